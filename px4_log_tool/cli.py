@@ -5,6 +5,7 @@ from px4_log_tool.runners import (
     ulog_csv,
     csv_db3,
     generate_ulog_metadata,
+    mcap_csv,
     ulog_db3
 )
 
@@ -32,7 +33,7 @@ def cli(ctx, verbose):
     "-r",
     "--resample",
     is_flag=True,
-    help="Resample data to a given frequency (filter.yaml is mandatory)",
+    help="Resample data to a given frequency (filter.yaml is mandatory). Without --merge, each topic is resampled on its own into resampled.csv.",
 )
 @click.option(
     "-c",
@@ -55,14 +56,55 @@ def cli(ctx, verbose):
     type=click.Path(exists=False),
     help="Module creates mirror directory tree of one with ULOGs with the CSV files in corresponding locations",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes (defaults to the number of CPUs).",
+)
+@click.option(
+    "--checksum",
+    is_flag=True,
+    help="Also compare content hashes, so that ULOGs that were only touched are not converted again.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Convert every ULOG, ignoring the conversion manifest of the output directory.",
+)
+@click.option(
+    "--format",
+    type=click.Choice(["csv", "npy", "arrow"]),
+    default="csv",
+    show_default=True,
+    help="Output table format: CSV, typed NumPy column directories or Arrow IPC files (requires pyarrow).",
+)
+@click.option(
+    "--no-index",
+    is_flag=True,
+    help="Neither use nor write the cached offset index of each ULOG.",
+)
+@click.option(
+    "--time-start",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Start of the extraction window, in seconds of log time (overrides time_window.start_s of the filter).",
+)
+@click.option(
+    "--time-end",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="End of the extraction window, in seconds of log time (overrides time_window.end_s of the filter).",
+)
 @click.pass_context
-def ulog2csv(ctx, directory_address, resample, clean, merge, filter, output_dir):
+def ulog2csv(ctx, directory_address, resample, clean, merge, filter, output_dir, jobs, checksum, force, format, no_index, time_start, time_end):
     """
     Convert ulog files to CSV in DIRECTORY_ADDRESS using FILTER.
     """
     if ctx.obj.verbose:
         click.echo("Verbose mode enabled.")
-    ulog_csv(verbose=ctx.obj.verbose, ulog_dir=directory_address, filter=filter, output_dir=output_dir, merge=merge, clean=clean, resample=resample)
+    ulog_csv(verbose=ctx.obj.verbose, ulog_dir=directory_address, filter=filter, output_dir=output_dir, merge=merge, clean=clean, resample=resample, jobs=jobs, checksum=checksum, force=force, format=format, index=not no_index, time_s=time_start, time_e=time_end)
 
 
 @click.command()
@@ -77,27 +119,143 @@ def ulog2csv(ctx, directory_address, resample, clean, merge, filter, output_dir)
     type=click.Path(exists=False),
     help="Create mirror directory tree of CSVs directory and populate with DB3 bags. Operation in-place if none provided.",
 )
-def ulog2db3(ctx, directory_address, filter, output_dir):
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes (defaults to the number of CPUs).",
+)
+@click.option(
+    "--checksum",
+    is_flag=True,
+    help="Also compare content hashes, so that ULOGs that were only touched are not converted again.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Convert every ULOG, ignoring the conversion manifest of the output directory.",
+)
+@click.option(
+    "--format",
+    type=click.Choice(["csv", "npy", "arrow"]),
+    default="csv",
+    show_default=True,
+    help="Output table format: CSV, typed NumPy column directories or Arrow IPC files (requires pyarrow).",
+)
+@click.option(
+    "--no-index",
+    is_flag=True,
+    help="Neither use nor write the cached offset index of each ULOG.",
+)
+@click.option(
+    "--time-start",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Start of the extraction window, in seconds of log time (overrides time_window.start_s of the filter).",
+)
+@click.option(
+    "--time-end",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="End of the extraction window, in seconds of log time (overrides time_window.end_s of the filter).",
+)
+@click.option(
+    "--no-csv",
+    is_flag=True,
+    help="Only write the DB3 bags, without the mirror tree of CSVs.",
+)
+def ulog2db3(ctx, directory_address, filter, output_dir, jobs, checksum, force, format, no_index, time_start, time_end, no_csv):
     """
     Convert ulog files to DB3 in DIRECTORY_ADDRESS using FILTER.
     """
     if ctx.obj.verbose:
         click.echo("Verbose mode enabled.")
-    ulog_db3(verbose=ctx.obj.verbose, directory_address=directory_address, filter=filter, output_dir=output_dir)
+    ulog_db3(verbose=ctx.obj.verbose, directory_address=directory_address, filter=filter, output_dir=output_dir, jobs=jobs, checksum=checksum, force=force, format=format, index=not no_index, time_s=time_start, time_e=time_end, csv=not no_csv)
+
+@click.command()
+@click.argument("directory_address", type=click.Path(exists=True))
+@click.option(
+    "-f", "--filter", type=click.Path(exists=True), help="Path to the filter YAML file."
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    type=click.Path(exists=False),
+    help="Create mirror directory tree of the bags directory and populate with CSV files. Written to topic_csvs in each bag if none provided.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes (defaults to the number of CPUs).",
+)
+@click.option(
+    "--time-start",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Start of the extraction window, in seconds from the first message of the bag (overrides time_window.start_s of the filter).",
+)
+@click.option(
+    "--time-end",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="End of the extraction window, in seconds from the first message of the bag (overrides time_window.end_s of the filter).",
+)
+@click.option(
+    "--create-index",
+    is_flag=True,
+    help="Index the messages of the bag by topic (if they are not yet), so that only the rows of whitelisted topics are read. Modifies the DB3 file.",
+)
+@click.pass_context
+def db32csv(ctx, directory_address, filter, output_dir, jobs, time_start, time_end, create_index):
+    """
+    Convert the DB3 bags in DIRECTORY_ADDRESS (a bag or a tree of bags) to CSV using FILTER.
+    """
+    if ctx.obj.verbose:
+        click.echo("Verbose mode enabled.")
+    db3_csv(directory_address=directory_address, filter=filter, verbose=ctx.obj.verbose, output_dir=output_dir, jobs=jobs, time_s=time_start, time_e=time_end, create_index=create_index)
+
 
 @click.command()
 @click.argument("directory_address", type=click.Path(exists=True))
 @click.option(
     "-f", "--filter", type=click.Path(exists=True), help="Path to the filter YAML file."
 )
+@click.option(
+    "-o",
+    "--output_dir",
+    type=click.Path(exists=False),
+    help="Module creates mirror directory tree of one with MCAPs with the CSV files in corresponding locations",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes decoding the chunks of each MCAP (defaults to the number of CPUs).",
+)
+@click.option(
+    "--time-start",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Start of the extraction window, in seconds from the first message of the file (overrides time_window.start_s of the filter).",
+)
+@click.option(
+    "--time-end",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="End of the extraction window, in seconds from the first message of the file (overrides time_window.end_s of the filter).",
+)
 @click.pass_context
-def db32csv(ctx, directory_address, filter):
+def mcap2csv(ctx, directory_address, filter, output_dir, jobs, time_start, time_end):
     """
-    Convert DB3 files to CSV in DIRECTORY_ADDRESS using FILTER.
+    Convert ROS 2 MCAP files to CSV in DIRECTORY_ADDRESS using FILTER.
     """
     if ctx.obj.verbose:
         click.echo("Verbose mode enabled.")
-    db3_csv(directory_address=directory_address, filter=filter, verbose=ctx.obj.verbose)
+    mcap_csv(verbose=ctx.obj.verbose, directory_address=directory_address, filter=filter, output_dir=output_dir, jobs=jobs, time_s=time_start, time_e=time_end)
 
 
 @click.command()
@@ -126,14 +284,21 @@ def generate_metadata(ctx, directory_address, filter):
     type=click.Path(exists=False),
     help="Create mirror directory tree of CSVs directory and populate with DB3 bags. Operation in-place if none provided.",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes (defaults to the number of CPUs).",
+)
 @click.pass_context
-def csv2db3(ctx, directory_address, filter, output_dir):
+def csv2db3(ctx, directory_address, filter, output_dir, jobs):
     """
     Convert and merge CSV files in a directory into ROS 2 bag DB3 files in DIRECTORY_ADDRESS.
     """
     if ctx.obj.verbose:
         click.echo("Verbose mode enabled.")
-    csv_db3(verbose=ctx.obj.verbose, directory_address=directory_address, filter=filter, output_dir=output_dir)
+    csv_db3(verbose=ctx.obj.verbose, directory_address=directory_address, filter=filter, output_dir=output_dir, jobs=jobs)
 
 @click.command()
 @click.pass_context
@@ -150,6 +315,7 @@ cli.add_command(ulog2csv)
 cli.add_command(csv2db3)
 cli.add_command(ulog2db3)
 cli.add_command(db32csv)
+cli.add_command(mcap2csv)
 cli.add_command(generate_metadata)
 cli.add_command(generate_filter_template)
 
@@ -0,0 +1,490 @@
+import os
+import re
+import struct
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+# CDR encapsulation headers (representation identifier and options).
+CDR_LE = b"\x00\x01\x00\x00"
+CDR_BE = b"\x00\x00\x00\x00"
+
+# .msg primitive types -> numpy type (without byte order).
+PRIMITIVES = {
+    "bool": "?",
+    "byte": "u1",
+    "char": "u1",
+    "int8": "i1",
+    "uint8": "u1",
+    "int16": "i2",
+    "uint16": "u2",
+    "int32": "i4",
+    "uint32": "u4",
+    "int64": "i8",
+    "uint64": "u8",
+    "float32": "f4",
+    "float64": "f8",
+}
+# .msg primitive types -> struct format character.
+_STRUCT = {
+    "bool": "?",
+    "byte": "B",
+    "char": "B",
+    "int8": "b",
+    "uint8": "B",
+    "int16": "h",
+    "uint16": "H",
+    "int32": "i",
+    "uint32": "I",
+    "int64": "q",
+    "uint64": "Q",
+    "float32": "f",
+    "float64": "d",
+}
+
+_CONSTANT = re.compile(r"^\S+\s+\w+\s*=")
+# Separator of the definitions of the nested types in a "ros2msg" schema.
+_SCHEMA_SEPARATOR = re.compile(r"^=+[ \t]*\n", re.MULTILINE)
+_TYPE = re.compile(r"^(?P<base>[\w/]+)(?P<string_bound><=\d+)?(?:\[(?P<array>(?:<=)?\d*)\])?$")
+
+
+class MsgField:
+    """
+    A field of a message definition.
+
+    Args:
+    - name (str): Field name.
+    - type (str): Primitive type, "string" or message type ("pkg/Type").
+    - length (int | None): Length of a fixed size array, None otherwise.
+    - sequence (bool): Whether the field is a (bounded or unbounded) sequence.
+    """
+
+    def __init__(self, name: str, type: str, length: int | None = None, sequence: bool = False):
+        self.name = name
+        self.type = type
+        self.length = length
+        self.sequence = sequence
+
+    @property
+    def array(self) -> bool:
+        return self.length is not None or self.sequence
+
+
+def parse_msg(text: str, package: str = "px4_msgs") -> List[MsgField]:
+    """
+    Parses the fields of a `.msg` definition; constants and default values
+    are ignored.
+
+    Args:
+    - text (str): Contents of the `.msg` file.
+    - package (str): Package of the message, for types given without one.
+
+    Returns:
+    - List[MsgField]: The fields, in definition (and serialization) order.
+    """
+    fields = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line or _CONSTANT.match(line):
+            continue
+        parts = line.split()
+        if len(parts) < 2:
+            raise ValueError(f"Invalid field definition '{line}'")
+        match = _TYPE.match(parts[0])
+        if match is None:
+            raise ValueError(f"Invalid field type '{parts[0]}'")
+        base = match["base"]
+        if base not in PRIMITIVES and base != "string":
+            if base == "wstring":
+                raise ValueError("wstring fields are not supported")
+            if "/" not in base:
+                base = f"{package}/{base}"
+        length, sequence = None, False
+        if match["array"] is not None:
+            if match["array"].isdigit():
+                length = int(match["array"])
+            else:
+                sequence = True
+        fields.append(MsgField(parts[1], base, length, sequence))
+    return fields
+
+
+def msg_dirs(msg_dir: str | None = None) -> List[str]:
+    """
+    Returns the directories to look up `px4_msgs` definitions in: `msg_dir`,
+    if given, and the `px4_msgs` package of a sourced ROS 2 environment.
+
+    Args:
+    - msg_dir (str, optional): Directory of PX4 `.msg` files.
+
+    Returns:
+    - List[str]: Existing directories, in lookup order.
+    """
+    dirs = [msg_dir] if msg_dir else []
+    for prefix in os.environ.get("AMENT_PREFIX_PATH", "").split(os.pathsep):
+        if prefix:
+            dirs.append(os.path.join(prefix, "share", "px4_msgs", "msg"))
+    return [dir for dir in dirs if os.path.isdir(dir)]
+
+
+class MsgRegistry:
+    """
+    Message definitions looked up by type name, and their CDR codecs.
+
+    Types of `px4_msgs` are looked up in `dirs`; types of other packages in
+    the packages of a sourced ROS 2 environment.
+
+    Args:
+    - dirs (List[str]): Directories of `px4_msgs` `.msg` files.
+    """
+
+    def __init__(self, dirs: List[str]):
+        self.dirs = list(dirs)
+        self._definitions: Dict[str, List[MsgField]] = {}
+        self._codecs: Dict[str, CdrCodec] = {}
+
+    @staticmethod
+    def normalise(msg_type: str) -> str:
+        """Returns "pkg/Type" for "pkg/msg/Type", "pkg/Type" or a bare px4_msgs "Type"."""
+        parts = msg_type.split("/")
+        if len(parts) == 1:
+            return f"px4_msgs/{parts[0]}"
+        return f"{parts[0]}/{parts[-1]}"
+
+    def _path(self, msg_type: str) -> str | None:
+        package, name = msg_type.split("/")
+        if package == "px4_msgs":
+            dirs = self.dirs
+        else:
+            dirs = [
+                os.path.join(prefix, "share", package, "msg")
+                for prefix in os.environ.get("AMENT_PREFIX_PATH", "").split(os.pathsep)
+                if prefix
+            ]
+        for dir in dirs:
+            path = os.path.join(dir, f"{name}.msg")
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def add_schema(self, msg_type: str, schema: str) -> None:
+        """
+        Adds the definitions of a "ros2msg" schema (as in MCAP files): the
+        `.msg` definition of the type, followed by those of the types it nests,
+        each after a separator line and a "MSG: pkg/Type" line. Types that
+        already have a definition keep it.
+
+        Args:
+        - msg_type (str): Message type of the schema.
+        - schema (str): The schema.
+        """
+        blocks = _SCHEMA_SEPARATOR.split(schema)
+        definitions = [(msg_type, blocks[0])]
+        for block in blocks[1:]:
+            header, _, text = block.lstrip("\n").partition("\n")
+            if header.startswith("MSG:"):
+                definitions.append((header[len("MSG:") :].strip(), text))
+        for name, text in definitions:
+            name = self.normalise(name)
+            if name not in self._definitions:
+                self._definitions[name] = parse_msg(text, name.split("/")[0])
+
+    def definition(self, msg_type: str) -> List[MsgField]:
+        """
+        Returns the fields of a message type.
+
+        Raises:
+        - KeyError: If the type has no definition.
+        """
+        msg_type = self.normalise(msg_type)
+        if msg_type not in self._definitions:
+            path = self._path(msg_type)
+            if path is None:
+                raise KeyError(f"No definition of message type {msg_type}")
+            with open(path, "r") as f:
+                self._definitions[msg_type] = parse_msg(f.read(), msg_type.split("/")[0])
+        return self._definitions[msg_type]
+
+    def codec(self, msg_type: str) -> "CdrCodec":
+        """
+        Returns the CDR codec of a message type.
+
+        Raises:
+        - KeyError: If the type (or a type it nests) has no definition.
+        """
+        msg_type = self.normalise(msg_type)
+        if msg_type not in self._codecs:
+            self._codecs[msg_type] = CdrCodec(self, msg_type)
+        return self._codecs[msg_type]
+
+
+def _align(position: int, alignment: int) -> int:
+    return -(-position // alignment) * alignment
+
+
+class CdrCodec:
+    """
+    Encodes and decodes messages of one type in (XCDR1) CDR, as ROS 2
+    serializes them.
+
+    Messages of which every field has a fixed size (the common case for PX4
+    messages) have a fixed layout, which `dtype` describes as a numpy
+    structured type: its leaves are the primitive fields, named as in ULog
+    headers (e.g. "q", "esc[0].esc_rpm"), at their offsets after the
+    encapsulation header. Such messages are encoded from whole columns at once.
+
+    Args:
+    - registry (MsgRegistry): Definitions of the type and the types it nests.
+    - msg_type (str): Message type ("pkg/Type").
+    """
+
+    def __init__(self, registry: MsgRegistry, msg_type: str):
+        self.registry = registry
+        self.msg_type = msg_type
+        self.fields = registry.definition(msg_type)
+        self._nested = {
+            field.type: registry.codec(field.type)
+            for field in self.fields
+            if field.type not in PRIMITIVES and field.type != "string"
+        }
+        self.dtype: np.dtype | None = None
+        leaves: List[Tuple[str, np.dtype, int]] = []
+        if self._layout(leaves, "", 0) is not None:
+            end = max((offset + dtype.itemsize for _, dtype, offset in leaves), default=0)
+            self.dtype = np.dtype(
+                {
+                    "names": [name for name, _, _ in leaves],
+                    "formats": [dtype for _, dtype, _ in leaves],
+                    "offsets": [offset for _, _, offset in leaves],
+                    "itemsize": end,
+                }
+            )
+
+    @property
+    def fixed(self) -> bool:
+        """Whether every message of the type has the same size."""
+        return self.dtype is not None
+
+    @property
+    def flat(self) -> bool:
+        """Whether the type has a fixed size and no nested message fields."""
+        return self.fixed and not self._nested
+
+    def _layout(self, leaves: List[Tuple[str, np.dtype, int]], prefix: str, position: int) -> int | None:
+        """
+        Appends the fixed layout of the type, placed at `position`, to `leaves`.
+
+        Returns:
+        - int | None: The position after the message, or None if its size varies.
+        """
+        for field in self.fields:
+            if field.sequence or field.type == "string":
+                return None
+            name = prefix + field.name
+            if field.type in PRIMITIVES:
+                dtype = np.dtype("<" + PRIMITIVES[field.type])
+                position = _align(position, min(dtype.itemsize, 8))
+                if field.length is not None:
+                    dtype = np.dtype((dtype, (field.length,)))
+                leaves.append((name, dtype, position))
+                position += dtype.itemsize
+                continue
+            nested = self._nested[field.type]
+            if field.length is None:
+                position = nested._layout(leaves, name + ".", position)
+            else:
+                for i in range(field.length):
+                    if position is None:
+                        break
+                    position = nested._layout(leaves, f"{name}[{i}].", position)
+            if position is None:
+                return None
+        return position
+
+    def columns(self) -> Dict[str, Tuple[str, int | None]]:
+        """
+        Returns the table columns of a fixed size type, as written for ULog
+        topics ("q_0", "esc_0.esc_rpm"), mapped to their leaf and array index.
+        """
+        columns = {}
+        for name in self.dtype.names:
+            dtype = self.dtype.fields[name][0]
+            column = name.replace("[", "_").replace("]", "")
+            if dtype.shape:
+                for i in range(dtype.shape[0]):
+                    columns[f"{column}_{i}"] = (name, i)
+            else:
+                columns[column] = (name, None)
+        return columns
+
+    def encode_columns(self, header_keys: List[str], columns: List[np.ndarray]) -> List[bytes]:
+        """
+        Encodes one message per table row of a fixed size type. Fields
+        without a column are left zero.
+
+        Args:
+        - header_keys (List[str]): Column names (see `columns`).
+        - columns (List[np.ndarray]): Equally long columns, in header order.
+
+        Returns:
+        - List[bytes]: Serialized messages, with encapsulation header.
+
+        Raises:
+        - ValueError: If the type has no fixed size or a column names no field.
+        """
+        if not self.fixed:
+            raise ValueError(f"Message type {self.msg_type} has fields of variable size, which tables cannot hold")
+        targets = self.columns()
+        n = len(columns[0]) if columns else 0
+        records = np.zeros(n, dtype=self.dtype)
+        for key, column in zip(header_keys, columns):
+            if key not in targets:
+                raise ValueError(f"Message type {self.msg_type} has no field {key}")
+            name, index = targets[key]
+            if index is None:
+                records[name] = column
+            else:
+                records[name][:, index] = column
+        buffer = np.empty((n, len(CDR_LE) + self.dtype.itemsize), dtype=np.uint8)
+        buffer[:, : len(CDR_LE)] = np.frombuffer(CDR_LE, dtype=np.uint8)
+        buffer[:, len(CDR_LE) :] = records.view(np.uint8).reshape(n, self.dtype.itemsize)
+        return [row.tobytes() for row in buffer]
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        """
+        Encodes a message given as a dictionary (as returned by `decode`).
+        Missing fields are left zero or empty.
+
+        Args:
+        - message (Dict[str, Any]): Field name -> value.
+
+        Returns:
+        - bytes: Serialized message, with encapsulation header.
+        """
+        out = bytearray(CDR_LE)
+        self._encode(out, message)
+        return bytes(out)
+
+    def _encode(self, out: bytearray, message: Dict[str, Any]) -> None:
+        for field in self.fields:
+            value = message.get(field.name)
+            if not field.array:
+                self._encode_value(out, field, value)
+                continue
+            if field.sequence:
+                values = [] if value is None else list(value)
+                _pack(out, "<I", len(values))
+            else:
+                values = [None] * field.length if value is None else list(value)
+                if len(values) != field.length:
+                    raise ValueError(f"Field {field.name} of {self.msg_type} holds {field.length} elements")
+            for element in values:
+                self._encode_value(out, field, element)
+
+    def _encode_value(self, out: bytearray, field: MsgField, value: Any) -> None:
+        if field.type in PRIMITIVES:
+            _pack(out, "<" + _STRUCT[field.type], 0 if value is None else value)
+        elif field.type == "string":
+            data = ("" if value is None else value).encode("utf-8") + b"\x00"
+            _pack(out, "<I", len(data))
+            out += data
+        else:
+            self._nested[field.type]._encode(out, {} if value is None else value)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """
+        Decodes a serialized message.
+
+        Args:
+        - data (bytes): Serialized message, with encapsulation header.
+
+        Returns:
+        - Dict[str, Any]: Field name -> value, in definition order. Primitive
+          arrays are numpy arrays, nested messages dictionaries and arrays of
+          strings or messages lists.
+        """
+        order = "<" if data[1] & 1 else ">"
+        message, _ = self._decode(memoryview(data)[len(CDR_LE) :], 0, order)
+        return message
+
+    def decode_many(self, messages: List[bytes]) -> np.ndarray | None:
+        """
+        Decodes messages of a fixed size type at once: the messages are
+        concatenated and viewed as records of `dtype`, without copying fields.
+
+        Args:
+        - messages (List[bytes]): Serialized messages, with encapsulation header.
+
+        Returns:
+        - np.ndarray | None: Records with the fields of `dtype`, or None if
+          the type has no fixed size or the messages differ in size or byte order.
+        """
+        if not self.fixed or not messages:
+            return None
+        size = len(messages[0])
+        if size < len(CDR_LE) + self.dtype.itemsize:
+            return None
+        data = b"".join(messages)
+        if len(data) != size * len(messages):
+            return None
+        flags = np.frombuffer(data, dtype=np.uint8)[1::size]
+        if (flags != flags[0]).any():
+            return None
+        dtype = self.dtype if flags[0] & 1 else self.dtype.newbyteorder(">")
+        # messages may be padded, e.g. to a multiple of four bytes
+        dtype = np.dtype(
+            {
+                "names": dtype.names,
+                "formats": [dtype.fields[name][0] for name in dtype.names],
+                "offsets": [dtype.fields[name][1] + len(CDR_LE) for name in dtype.names],
+                "itemsize": size,
+            }
+        )
+        return np.frombuffer(data, dtype=dtype)
+
+    def _decode(self, data: memoryview, position: int, order: str) -> Tuple[Dict[str, Any], int]:
+        message = {}
+        for field in self.fields:
+            if field.array:
+                if field.sequence:
+                    position = _align(position, 4)
+                    (count,) = struct.unpack_from(order + "I", data, position)
+                    position += 4
+                else:
+                    count = field.length
+                if field.type in PRIMITIVES:
+                    dtype = np.dtype(order + PRIMITIVES[field.type])
+                    position = _align(position, min(dtype.itemsize, 8)) if count else position
+                    value = np.frombuffer(data, dtype=dtype, count=count, offset=position).copy()
+                    position += dtype.itemsize * count
+                else:
+                    value = []
+                    for _ in range(count):
+                        element, position = self._decode_value(data, position, order, field)
+                        value.append(element)
+            else:
+                value, position = self._decode_value(data, position, order, field)
+            message[field.name] = value
+        return message, position
+
+    def _decode_value(self, data: memoryview, position: int, order: str, field: MsgField) -> Tuple[Any, int]:
+        if field.type in PRIMITIVES:
+            format = order + _STRUCT[field.type]
+            size = struct.calcsize(format)
+            position = _align(position, min(size, 8))
+            (value,) = struct.unpack_from(format, data, position)
+            return value, position + size
+        if field.type == "string":
+            position = _align(position, 4)
+            (length,) = struct.unpack_from(order + "I", data, position)
+            position += 4
+            value = bytes(data[position : position + length]).rstrip(b"\x00").decode("utf-8")
+            return value, position + length
+        return self._nested[field.type]._decode(data, position, order)
+
+
+def _pack(out: bytearray, format: str, value: Any) -> None:
+    """Appends a primitive to `out`, aligned to its size relative to the data after the header."""
+    size = struct.calcsize(format)
+    position = len(out) - len(CDR_LE)
+    out += b"\x00" * (_align(position, min(size, 8)) - position)
+    out += struct.pack(format, value)
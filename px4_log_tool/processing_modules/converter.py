@@ -3,14 +3,49 @@
 import numpy as np
 import sqlite3
 import csv
+import io
 import os
+import pickle
 import re
+import shutil
+import struct
+import tempfile
 import pandas as pd
+from abc import ABC, abstractmethod
 from collections import Counter
 from copy import deepcopy
-from pyulog import ULog
-from typing import Dict, List
+from itertools import compress
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 from px4_log_tool.util.logger import log
+from px4_log_tool.util.scheduler import map_ordered
+from px4_log_tool.processing_modules.cdr import MsgRegistry, msg_dirs
+from px4_log_tool.processing_modules.csv_writer import BLOCK_ROWS, widen_float32, write_csv_rows
+from px4_log_tool.processing_modules.db3 import Db3Reader, Db3Writer, bag_files
+from px4_log_tool.processing_modules.mcap_reader import McapChannel, McapChunk, McapError, McapReader, chunk_messages
+from px4_log_tool.processing_modules.message_plan import MessagePlan
+from px4_log_tool.processing_modules.resampler import rate_limit, span_rate
+from px4_log_tool.processing_modules.tables import TableWriter, list_tables, read_columns, table_name, table_stem
+from px4_log_tool.processing_modules.ulog_reader import Subscription, ULogStream
+
+
+def csv_output_dir(output: str, ulog_file_name: str) -> str:
+    """
+    Returns the directory that `convert_ulog2csv` writes the tables of a ULog to.
+
+    Args:
+    - output (str): Output directory passed to `convert_ulog2csv`.
+    - ulog_file_name (str): Name or path of the ULog file.
+
+    Returns:
+    - str: `output` joined with the ULog file name without its extension.
+    """
+    base_name = os.path.basename(ulog_file_name)
+    # strip '.ulg' || '.ulog'
+    if base_name.lower().endswith(".ulg"):
+        base_name = base_name[:-4]
+    elif base_name.lower().endswith(".ulog"):
+        base_name = base_name[:-5]
+    return os.path.join(output, base_name)
 
 
 def convert_ulog2csv(
@@ -24,12 +59,23 @@ def convert_ulog2csv(
     time_e: float | None = None,
     disable_str_exceptions: bool = False,
     verbose: bool = False,
+    return_frames: bool = False,
+    format: str = "csv",
+    index: bool = True,
+    fields: Dict[str, List[str]] | None = None,
 ) -> Dict:
     """
     Converts a PX4 ULog file to CSV files.
 
     This function converts a ULog file into multiple CSV files, one for each message type.
-    Filtering, field exclusion, and time range extraction are supported.
+    Filtering, field exclusion, and time range extraction are supported. With
+    `format` the topics are written as typed columnar tables instead (see
+    `tables.TABLE_FORMATS`). The log is decoded and written one chunk at a
+    time, so memory use does not grow with the size of the log.
+
+    With `index`, the first conversion of a log writes an index of it to the
+    user cache directory (see `ulog_reader.index_path`); later conversions
+    then read only the records of the `messages` and of the time window.
 
     Args:
     - directory_address (str): Directory path of the ULog file.
@@ -39,41 +85,109 @@ def convert_ulog2csv(
     - blacklist (List[str]): List of field names to exclude.
     - delimiter (str): CSV delimiter (default: ",").
     - time_s (float): Start time (in seconds) for extraction (defaults to log start).
+      Each topic starts at its first timestamp at or after it.
     - time_e (float): End time (in seconds) for extraction (defaults to log end).
+      Each topic ends before its first timestamp at or after it. Records outside
+      the window are not decoded.
     - disable_str_exceptions (bool): If True, disables string conversion exceptions.
     - verbose (bool): Verbosity of logging.
+    - return_frames (bool): If True, also build a DataFrame per CSV file from the
+      decoded arrays (no read-back of the written files).
+    - format (str): Output table format, "csv" (default), "npy" or "arrow".
+    - index (bool): Whether to use (and build) the cached index of the log.
+    - fields (Dict[str, List[str]]): Topic name -> fields to keep (besides the
+      timestamp). Only these are decoded; array and nested fields are
+      selected by their base name (e.g. "gyro_rad"). Other topics keep all fields.
+
+    Returns:
+    - Dict: CSV file stem -> DataFrame with the CSV contents if return_frames,
+      otherwise CSV file stem -> path of the written table.
+
+    Raises:
+    - ULogDecodeError: If the ULog cannot be decoded (no tables are left behind).
     """
 
     ulog_file_name = os.path.join(directory_address, ulog_file_name)
-    msg_filter = messages if messages else None
+    output_file_prefix = csv_output_dir(output, ulog_file_name)
+    topics = _decode_ulog(
+        ulog_file_name, messages, output_file_prefix, blacklist, delimiter, time_s, time_e,
+        disable_str_exceptions, verbose, return_frames, format, index, fields,
+    )
+    data_frame_dict = {}
+    for stem, sink in topics.items():
+        if return_frames:
+            data_frame_dict[stem] = _columns_to_frame(sink.header_keys, sink.columns())
+        else:
+            data_frame_dict[stem] = sink.path
+    return data_frame_dict
 
-    try:
-        ulog = ULog(ulog_file_name, msg_filter, disable_str_exceptions)
-        data = ulog.data_list
-    except Exception:
-        log(
-            "Issue with converting file "
-            + ulog_file_name
-            + ". It is most likely due to its filetype or integrity.",
-            verbosity=verbose,
-            log_level=1,
-        )
-        return {}
 
-    output_file_prefix = ulog_file_name
-    # strip '.ulg' || '.ulog'
-    if output_file_prefix.lower().endswith(".ulg"):
-        output_file_prefix = output_file_prefix[:-4]
-    elif output_file_prefix.lower().endswith(".ulog"):
-        output_file_prefix = output_file_prefix[:-5]
+def _decode_ulog(
+    ulog_file_name: str,
+    messages: List[str] | None,
+    output_file_prefix: str | None,
+    blacklist: List[str],
+    delimiter: str,
+    time_s: float | None,
+    time_e: float | None,
+    disable_str_exceptions: bool,
+    verbose: bool,
+    keep: bool,
+    format: str,
+    index: bool,
+    fields: Dict[str, List[str]] | None,
+    on_block: Callable[["_TopicSink", List[np.ndarray]], None] | None = None,
+) -> Dict[str, "_TopicSink"]:
+    """
+    Decodes the topics of a ULog into one sink per topic instance, writing
+    them as tables into `output_file_prefix` (unless it is None), keeping
+    their columns in memory if `keep` and passing each block of columns to
+    `on_block` (with its sink) as it is decoded. See `convert_ulog2csv` for
+    the other arguments.
 
-    base_name = os.path.basename(output_file_prefix)
-    output_file_prefix = os.path.join(output, base_name)
+    Returns:
+    - Dict[str, _TopicSink]: Table stem -> closed sink of the topic instance.
 
+    Raises:
+    - ULogDecodeError: If the ULog cannot be decoded.
+    """
+    msg_filter = messages if messages else None
+
+    issue = (
+        "Issue with converting file "
+        + ulog_file_name
+        + ". It is most likely due to its filetype or integrity."
+    )
     try:
-        os.makedirs(output_file_prefix)
-    except FileExistsError:
-        pass
+        stream = ULogStream(ulog_file_name, msg_filter, disable_str_exceptions, index=index, fields=fields)
+    except Exception as e:
+        raise ULogDecodeError(issue) from e
+
+    sinks: Dict[Subscription, _TopicSink] = {}
+    try:
+        if output_file_prefix is not None:
+            os.makedirs(output_file_prefix, exist_ok=True)
+        # the topic data is decoded and written one chunk of the file at a time
+        for subscription, records in _decoded(stream, time_s, time_e):
+            sink = sinks.get(subscription)
+            if sink is None:
+                # written under a temporary name until all topic instances are known
+                path = None
+                if output_file_prefix is not None:
+                    path = os.path.join(output_file_prefix, table_name(f".{len(sinks)}.part", format))
+                sink = _TopicSink(subscription, path, blacklist, delimiter, keep, on_block)
+                sinks[subscription] = sink
+            sink.write(records)
+    except _DecodeError as e:
+        _remove_tables([sink.path for sink in sinks.values() if sink.path])
+        raise ULogDecodeError(issue) from e
+    except BaseException:
+        _remove_tables([sink.path for sink in sinks.values() if sink.path])
+        raise
+    data = stream.data_list
+    unmatched = sorted({f"{d.name}.{field}" for d in data for field in d.unmatched})
+    if unmatched:
+        log(f"Fields not found in {ulog_file_name}: {', '.join(unmatched)}", verbosity=verbose, log_level=1)
 
     # Mark duplicated
     if messages is not None:
@@ -87,83 +201,159 @@ def convert_ulog2csv(
     else:
         counts = Counter([d.name.replace("/", "_") for d in data])
     redundant_msgs = [string for string, count in counts.items() if count > 1]
-    data_frame_dict = {}
+    topics = {}
 
     for d in data:
         if d.name.replace("/", "_") in redundant_msgs:
-            fmt = "{0}/{1}_{2}.csv"
-            output_file_name = fmt.format(
-                output_file_prefix, d.name.replace("/", "_"), d.multi_id
-            )
+            stem = "{0}_{1}".format(d.name.replace("/", "_"), d.multi_id)
         else:
-            fmt = "{0}/{1}.csv"
-            output_file_name = fmt.format(
-                output_file_prefix, d.name.replace("/", "_"), d.multi_id
-            )
-        with open(output_file_name, "w", encoding="utf-8") as csvfile:
-            # use same field order as in the log, except for the timestamp
-            data_keys = [f.field_name for f in d.field_data]
-            data_keys.remove("timestamp")
-            # Remove blacklisted data_keys
-            for entry in blacklist:
-                try:
-                    data_keys.remove(entry)
-                except ValueError:
-                    continue
-            data_keys.insert(0, "timestamp")  # we want timestamp at first position
-
-            # write the header
-            header_keys = deepcopy(data_keys)
-            for i in range(len(header_keys)):
-                header_keys[i] = header_keys[i].replace("[", "_")
-                header_keys[i] = header_keys[i].replace("]", "")
-            csvfile.write(delimiter.join(header_keys) + "\n")
-
-            # get the index for row where timestamp exceeds or equals the required value
-            time_s_i = (
-                np.where(d.data["timestamp"] >= time_s * 1e6)[0][0] if time_s else 0
-            )
-            # get the index for row upto the timestamp of the required value
-            time_e_i = (
-                np.where(d.data["timestamp"] >= time_e * 1e6)[0][0]
-                if time_e
-                else len(d.data["timestamp"])
-            )
+            stem = d.name.replace("/", "_")
 
-            # write the data
-            last_elem = len(data_keys) - 1
-            for i in range(time_s_i, time_e_i):
-                for k in range(len(data_keys)):
-                    csvfile.write(str(d.data[data_keys[k]][i]))
-                    if k != last_elem:
-                        csvfile.write(delimiter)
-                csvfile.write("\n")
-        data_frame_dict[output_file_name.split("/")[-1].split(".")[0]] = pd.read_csv(
-            output_file_name
-        )
-    return data_frame_dict
+        sink = sinks.pop(d)
+        sink.close()
+        if sink.path is not None:
+            output_file_name = os.path.join(output_file_prefix, table_name(stem, format))
+            _remove_tables([output_file_name])
+            os.replace(sink.path, output_file_name)
+            sink.path = output_file_name
+        topics[stem] = sink
+    # topic instances dropped because their message id was subscribed again
+    _remove_tables([sink.path for sink in sinks.values() if sink.path])
+    return topics
 
 
-def convert_csv2ros2bag(
-    directory_address: str,
-    output_dir: str,
-    topic_prefix: str = "/fmu/out",
-    capitalise_topics: bool = False,
-    verbose: bool = False,
-) -> None:
+class ULogDecodeError(Exception):
+    """Raised for a ULog that cannot be decoded, e.g. of another filetype or corrupted."""
+
+
+class _DecodeError(Exception):
+    """Raised for a ULog that cannot be decoded, as opposed to a table that cannot be written."""
+
+
+def _decoded(
+    stream: ULogStream, time_s: float | None, time_e: float | None
+) -> Iterator[Tuple[Subscription, np.ndarray]]:
+    """Yields the batches of `stream`, raising _DecodeError if decoding fails."""
+    try:
+        yield from stream.batches(time_s, time_e)
+    except Exception as e:
+        raise _DecodeError(str(e)) from e
+
+
+class _TopicSink:
+    """
+    Writes the records of a topic instance to a table, a block of rows at a time.
+    Without a `path` the records are only kept (if `keep`) or passed on to `on_block`.
     """
-    Converts CSV files to a ROS 2 bag file.
 
-    This function reads CSV files from the specified directory and converts
-    their contents into ROS 2 messages, which are then written to a ROS 2 bag
-    file. The CSV files should be named according to the message types and
-    topics they represent, and the data will be serialized accordingly.
+    def __init__(
+        self,
+        subscription: Subscription,
+        path: str | None,
+        blacklist: List[str],
+        delimiter: str,
+        keep: bool,
+        on_block: Callable[["_TopicSink", List[np.ndarray]], None] | None = None,
+    ):
+        # use same field order as in the log, except for the timestamp
+        data_keys = [f.field_name for f in subscription.field_data]
+        data_keys.remove("timestamp")
+        # Remove blacklisted data_keys
+        for entry in blacklist:
+            try:
+                data_keys.remove(entry)
+            except ValueError:
+                continue
+        data_keys.insert(0, "timestamp")  # we want timestamp at first position
 
-    Args:
-    - directory_address (str): Directory path containing the CSV files.
-    - topic_prefix (str): Prefix to the topics in the bag file.
-    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
-    - verbose (bool): Verbosity of logging.
+        # the header
+        header_keys = deepcopy(data_keys)
+        for i in range(len(header_keys)):
+            header_keys[i] = header_keys[i].replace("[", "_")
+            header_keys[i] = header_keys[i].replace("]", "")
+
+        self.path = path
+        self.name = subscription.name.replace("/", "_")
+        self.data_keys = data_keys
+        self.header_keys = header_keys
+        self.pending: List[np.ndarray] = []
+        self.pending_rows = 0
+        self.kept: List[np.ndarray] | None = [] if keep else None
+        self.on_block = on_block
+        self.dtypes = [subscription.dtype[key] for key in data_keys]
+        self.writer = None
+        if path is not None:
+            self.writer = TableWriter(path, header_keys, self.dtypes, delimiter)
+
+    def write(self, records: np.ndarray) -> None:
+        if len(records) == 0:
+            return
+        self.pending.append(records)
+        self.pending_rows += len(records)
+        if self.pending_rows >= BLOCK_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        records = np.concatenate(self.pending)
+        self.pending = []
+        self.pending_rows = 0
+        if self.kept is not None:
+            self.kept.append(records)
+        if self.writer is not None:
+            self.writer.write([records[key] for key in self.data_keys])
+        if self.on_block is not None:
+            self.on_block(self, [records[key] for key in self.data_keys])
+
+    def close(self) -> None:
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def columns(self) -> List[np.ndarray]:
+        """The written columns (if the sink keeps them)."""
+        if not self.kept:
+            return [np.empty(0, dtype) for dtype in self.dtypes]
+        records = np.concatenate(self.kept)
+        return [records[key] for key in self.data_keys]
+
+
+def _remove_tables(paths: List[str]) -> None:
+    """Removes tables (files or npy table directories), if they exist."""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def _columns_to_frame(header_keys: List[str], columns: List[np.ndarray]) -> pd.DataFrame:
+    """
+    Builds the DataFrame that reading back a written CSV file would give:
+    float32 columns hold the values of their printed text and every column is
+    widened to the int64/float64 dtypes pd.read_csv infers.
+    """
+    frame = {}
+    for key, column in zip(header_keys, columns):
+        if column.dtype == np.float32:
+            frame[key] = widen_float32(column)
+        elif column.dtype.kind == "f":
+            frame[key] = column.astype(np.float64)
+        elif column.dtype == np.uint64 and column.size and column.max() > np.iinfo(np.int64).max:
+            frame[key] = column.copy()
+        else:
+            frame[key] = column.astype(np.int64)
+    return pd.DataFrame(frame, columns=header_keys)
+
+
+def _ros_modules(verbose: bool = False) -> Tuple | None:
+    """
+    Imports the ROS 2 modules that bag writing needs.
+
+    Returns:
+    - Tuple | None: (rosbag2_py, px4_msgs.msg, serialize_message), or None if
+      the ROS 2 environment is not sourced.
     """
     try:
         import rosbag2_py
@@ -173,46 +363,183 @@ def convert_csv2ros2bag(
     except Exception as e:
         if e is not ImportError or e is not ModuleNotFoundError:
             log(
-                "Missing required ROS 2 packages. Make sure that the ROS 2 environment is sourced. Skipping conversion to ROS 2 bag.",
+                "Missing required ROS 2 packages. Make sure that the ROS 2 environment is sourced, or set bag_params.msg_dir to the PX4 .msg definitions. Skipping conversion to ROS 2 bag.",
                 verbosity=verbose,
                 log_level=2,
             )
         else:
             log(
-                "Missing required ROS 2 px4_msgs library. Make sure that it is sourced. Skipping conversion to ROS 2 bag.",
+                "Missing required ROS 2 px4_msgs library. Make sure that it is sourced, or set bag_params.msg_dir to the PX4 .msg definitions. Skipping conversion to ROS 2 bag.",
                 verbosity=verbose,
                 log_level=2,
             )
-        return
+        return None
+    return rosbag2_py, importlib.import_module("px4_msgs.msg"), serialize_message
 
-    def set_msg_field(msg, field_name, value):
-        """
-        Set the value of a message field, handling nested fields and array
-        indices, and ensuring type compatibility.
-        """
 
-        if "_" in field_name and field_name.split("_")[-1].isdigit():
-            field_base = "_".join(field_name.split("_")[:-1])
-            index = int(field_name.split("_")[-1])
-            if hasattr(msg, field_base):
-                array_field = getattr(msg, field_base)
-                if isinstance(array_field, (list, np.ndarray)):
-                    array_field[index] = type(array_field[index])(value)
-                else:
-                    raise ValueError(
-                        f"Field {field_base} is not an array in message type {type(msg).__name__}"
-                    )
-        else:
-            if hasattr(msg, field_name):
-                current_type = type(getattr(msg, field_name))
-                setattr(msg, field_name, current_type(value))
-            else:
-                raise ValueError(
-                    f"Message type {type(msg).__name__} has no field {field_name}"
-                )
+def bag_topic(base_name: str, topic_prefix: str = "/fmu/out", capitalise_topics: bool = False) -> Tuple[str, str]:
+    """
+    Returns the bag topic and the px4_msgs message type of a topic table.
 
-    writer = rosbag2_py.SequentialWriter()
+    Args:
+    - base_name (str): Table stem, e.g. "vehicle_attitude" or "actuator_outputs_1".
+    - topic_prefix (str): Prefix to the topics in the bag file.
+    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
+
+    Returns:
+    - Tuple[str, str]: Topic name and message type (e.g. "VehicleAttitude").
+    """
+    name = base_name
+    if capitalise_topics:
+        name = "".join([comp.capitalize() for comp in base_name.split("_")])
+    if base_name[-1].isdigit():
+        topic_name = f"{topic_prefix}/{name[:-2]}/f_{base_name[-1]}"
+    else:
+        topic_name = f"{topic_prefix}/{name}"
+    msg_type = "".join(
+        part.capitalize() for part in re.sub(r"_\d+", "", base_name).split("_")
+    )
+    return topic_name, msg_type
+
+
+class _RosBag:
+    """
+    Writes topic tables into a bag through rosbag2_py, serializing the
+    px4_msgs messages with rclpy.
+    """
+
+    def __init__(self, uri: str, ros: Tuple):
+        rosbag2_py, self.msg_module, self.serialize_message = ros
+        self.rosbag2_py = rosbag2_py
+        self.writer = rosbag2_py.SequentialWriter()
+        storage_options = rosbag2_py._storage.StorageOptions(uri=uri, storage_id="sqlite3")
+        converter_options = rosbag2_py._storage.ConverterOptions("", "")
+        self.writer.open(storage_options, converter_options)
+
+    def create_topic(self, topic_name: str, msg_type: str) -> None:
+        topic_info = self.rosbag2_py._storage.TopicMetadata(
+            name=topic_name, type=f"px4_msgs/msg/{msg_type}", serialization_format="cdr"
+        )
+        self.writer.create_topic(topic_info)
+
+    def write(self, topic_name: str, msg_type: str, header_keys: List[str], columns: List[np.ndarray]) -> None:
+        messages = self.encode(topic_name, msg_type, header_keys, columns)
+        if messages is not None:
+            self.write_messages(topic_name, *messages)
+
+    def encode(
+        self, topic_name: str, msg_type: str, header_keys: List[str], columns: List[np.ndarray]
+    ) -> Tuple[List[int], List[bytes]] | None:
+        """Returns the receive times and serialized messages of the rows, or None for an unknown type."""
+        try:
+            msg_class = getattr(self.msg_module, msg_type)
+        except AttributeError:
+            return None
+        plan = MessagePlan(msg_class, header_keys)
+
+        timestamps, payloads = [], []
+        for msg in plan.messages(columns):
+            timestamps.append(msg.timestamp * 1000)
+            payloads.append(self.serialize_message(msg))
+        return timestamps, payloads
+
+    def write_messages(self, topic_name: str, timestamps: List[int], payloads: List[bytes]) -> None:
+        for timestamp, payload in zip(timestamps, payloads):
+            self.writer.write(topic_name, payload, timestamp)
+
+    def close(self) -> None:
+        # the bag is completed when the writer is destroyed
+        self.writer = None
+
+
+class _CdrBag:
+    """
+    Writes topic tables into a bag without ROS 2, encoding the messages from
+    their `.msg` definitions (see `cdr.CdrCodec`).
+    """
+
+    def __init__(self, uri: str, registry: MsgRegistry, verbose: bool = False):
+        self.registry = registry
+        self.verbose = verbose
+        self.writer = Db3Writer(uri)
+
+    def create_topic(self, topic_name: str, msg_type: str) -> None:
+        self.writer.create_topic(topic_name, f"px4_msgs/msg/{msg_type}")
+
+    def write(self, topic_name: str, msg_type: str, header_keys: List[str], columns: List[np.ndarray]) -> None:
+        messages = self.encode(topic_name, msg_type, header_keys, columns)
+        if messages is not None:
+            self.write_messages(topic_name, *messages)
+
+    def encode(
+        self, topic_name: str, msg_type: str, header_keys: List[str], columns: List[np.ndarray]
+    ) -> Tuple[List[int], List[bytes]] | None:
+        """Returns the receive times and serialized messages of the rows, or None for an unknown type."""
+        try:
+            codec = self.registry.codec(msg_type)
+        except (KeyError, ValueError) as e:
+            log(f"{e}. Skipping topic {topic_name}.", verbosity=self.verbose, log_level=1)
+            return None
+        payloads = codec.encode_columns(header_keys, columns)
+        timestamps = np.asarray(columns[header_keys.index("timestamp")]).astype(np.uint64) * 1000
+        return timestamps.tolist(), payloads
+
+    def write_messages(self, topic_name: str, timestamps: List[int], payloads: List[bytes]) -> None:
+        self.writer.write(topic_name, timestamps, payloads)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def _open_bag(uri: str, msg_dir: str | None, verbose: bool) -> "_CdrBag | _RosBag | None":
+    """
+    Opens a bag for writing: without ROS 2 if PX4 message definitions are
+    found (see `cdr.msg_dirs`), through rosbag2_py otherwise.
+
+    Returns:
+    - _CdrBag | _RosBag | None: The bag, or None if neither is available.
+    """
+    dirs = msg_dirs(msg_dir)
+    if dirs:
+        return _CdrBag(uri, MsgRegistry(dirs), verbose)
+    ros = _ros_modules(verbose)
+    if ros is None:
+        return None
+    return _RosBag(uri, ros)
+
+
+def _can_write_bags(msg_dir: str | None, verbose: bool) -> bool:
+    """Tells whether `_open_bag` can open a bag."""
+    return bool(msg_dirs(msg_dir)) or _ros_modules(verbose) is not None
+
+
+def convert_csv2ros2bag(
+    directory_address: str,
+    output_dir: str,
+    topic_prefix: str = "/fmu/out",
+    capitalise_topics: bool = False,
+    verbose: bool = False,
+    msg_dir: str | None = None,
+) -> None:
+    """
+    Converts CSV files to a ROS 2 bag file.
 
+    This function reads CSV files (or tables of another format written by
+    `convert_ulog2csv`) from the specified directory and converts
+    their contents into ROS 2 messages, which are then written to a ROS 2 bag
+    file. The CSV files should be named according to the message types and
+    topics they represent, and the data will be serialized accordingly.
+
+    With the PX4 `.msg` definitions at hand (`msg_dir`, or the px4_msgs
+    package of a sourced ROS 2 environment) the bag is written without ROS 2.
+
+    Args:
+    - directory_address (str): Directory path containing the CSV files.
+    - topic_prefix (str): Prefix to the topics in the bag file.
+    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
+    - verbose (bool): Verbosity of logging.
+    - msg_dir (str): Directory of the PX4 `.msg` definitions.
+    """
     # Catching edge cases where directory_address is a PosixPath
     try:
         bag_name = directory_address.split("/")[-1]
@@ -220,256 +547,784 @@ def convert_csv2ros2bag(
         directory_address = str(directory_address)
         bag_name = directory_address.split("/")[-1]
 
-    storage_options = rosbag2_py._storage.StorageOptions(
-        uri=f"{output_dir}/{bag_name}",
-        storage_id="sqlite3",
-    )
-    converter_options = rosbag2_py._storage.ConverterOptions("", "")
-    writer.open(storage_options, converter_options)
+    bag = _open_bag(f"{output_dir}/{bag_name}", msg_dir, verbose)
+    if bag is None:
+        return
 
-    csv_files = [f for f in os.listdir(directory_address) if f.endswith(".csv")]
+    csv_files = list_tables(directory_address)
     if len(csv_files) == 0:
         log(
-            "Directory does not have any .csv files. Skipping conversion to ROS 2 bag.",
+            "Directory does not have any .csv files or tables. Skipping conversion to ROS 2 bag.",
             verbosity=verbose,
             log_level=2,
         )
+        bag.close()
         return
 
     topic_dict = {}
     for csv_file in csv_files:
-        base_name: str = csv_file.split(".")[0]
-        name = base_name
-        if capitalise_topics:
-            name = "".join([comp.capitalize() for comp in base_name.split("_")])
-        if base_name[-1].isdigit():
-            topic_name = f"{topic_prefix}/{name[:-2]}/f_{base_name[-1]}"
-        else:
-            topic_name = f"{topic_prefix}/{name}"
-        msg_type = "".join(
-            part.capitalize() for part in re.sub(r"_\d+", "", base_name).split("_")
-        )
-        topic_dict[base_name] = (topic_name, msg_type)
-        topic_info = rosbag2_py._storage.TopicMetadata(
-            name=topic_name, type=f"px4_msgs/msg/{msg_type}", serialization_format="cdr"
-        )
-        writer.create_topic(topic_info)
+        base_name: str = table_stem(csv_file)
+        topic_name, msg_type = bag_topic(base_name, topic_prefix, capitalise_topics)
+        topic_dict[base_name] = (topic_name, msg_type, csv_file)
+        bag.create_topic(topic_name, msg_type)
 
-    for base_name, (topic_name, msg_type) in topic_dict.items():
-        df = pd.read_csv(os.path.join(directory_address, f"{base_name}.csv"))
-        try:
-            msg_class = getattr(importlib.import_module("px4_msgs.msg"), msg_type)
-        except AttributeError:
-            continue
+    for base_name, (topic_name, msg_type, csv_file) in topic_dict.items():
+        columns = read_columns(os.path.join(directory_address, csv_file))
+        bag.write(topic_name, msg_type, list(columns), list(columns.values()))
+    bag.close()
 
-        for _, row in df.iterrows():
-            msg = msg_class()
-            for field in row.index:
-                set_msg_field(msg, field, row[field])
-            writer.write(topic_name, serialize_message(msg), msg.timestamp * 1000)
 
+class _BagSpill:
+    """
+    Rate limits and serializes the blocks of a topic instance as they are
+    decoded, holding the messages in a temporary file until the instance is
+    named and its bag topic written (see `convert_ulog2ros2bag`).
 
-def convert_ros2bag2csv(bag_file_address: str, verbose: bool = False):
-    try:
-        import px4_msgs.msg
-        from rosidl_runtime_py.utilities import get_message
-        from rclpy.serialization import deserialize_message
-    except Exception as e:
-        if e is not ImportError or e is not ModuleNotFoundError:
-            log(
-                "Missing required ROS 2 packages. Make sure that the ROS 2 environment is sourced. Skipping conversion to ROS 2 bag.",
-                verbosity=verbose,
-                log_level=2,
-            )
+    Args:
+    - path (str): Path of the temporary file.
+    - max_frequency (float | None): Maximum rate of the topic, in Hz (no limit if None).
+    """
+
+    def __init__(self, path: str, max_frequency: float | None):
+        self.file = open(path, "w+b")
+        self.max_frequency = max_frequency
+        # timestamp of the last kept sample, for the rate limit of the next block
+        self.last: int | None = None
+        # (samples, first timestamp, last timestamp) of the decoded and of the kept rows
+        self.decoded: Tuple[int, int, int] = (0, 0, 0)
+        self.kept: Tuple[int, int, int] = (0, 0, 0)
+
+    def add(self, columns: List[np.ndarray], encode: Callable) -> bool:
+        """
+        Rate limits a block of columns (timestamp first) and appends their
+        messages, serialized by `encode`. Returns False if `encode` cannot
+        serialize them.
+        """
+        timestamps = columns[0]
+        self.decoded = self._tally(self.decoded, timestamps)
+        if self.max_frequency is not None:
+            order = np.argsort(timestamps, kind="stable")
+            keep = rate_limit(timestamps[order], self.max_frequency, previous=self.last)
+            rows = order[keep]
+            if len(rows):
+                self.last = int(timestamps[rows[-1]])
+            if not keep.all():
+                columns = [column[rows] for column in columns]
+        self.kept = self._tally(self.kept, columns[0])
+        if len(columns[0]) == 0:
+            return True
+        messages = encode(columns)
+        if messages is None:
+            return False
+        pickle.dump(messages, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        return True
+
+    def messages(self) -> Iterator[Tuple[List[int], List[bytes]]]:
+        """Yields the receive times and serialized messages of the kept rows, a block at a time."""
+        self.file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self.file)
+            except EOFError:
+                return
+
+    def close(self) -> None:
+        self.file.close()
+
+    @staticmethod
+    def _tally(tally: Tuple[int, int, int], timestamps: np.ndarray) -> Tuple[int, int, int]:
+        count, first, last = tally
+        if len(timestamps) == 0:
+            return tally
+        if count == 0:
+            first, last = int(np.min(timestamps)), int(np.max(timestamps))
         else:
-            log(
-                "Missing required ROS 2 px4_msgs library. Make sure that it is sourced. Skipping conversion to ROS 2 bag.",
-                verbosity=verbose,
-                log_level=2,
-            )
+            first, last = min(first, int(np.min(timestamps))), max(last, int(np.max(timestamps)))
+        return count + len(timestamps), first, last
+
+    @staticmethod
+    def rate(tally: Tuple[int, int, int]) -> float:
+        """Mean rate of the rows of a tally, in Hz."""
+        count, first, last = tally
+        return span_rate(count, last - first)
+
+
+def convert_ulog2ros2bag(
+    directory_address: str,
+    ulog_file_name: str,
+    output_dir: str,
+    messages: List[str] | None = None,
+    csv_output: str | None = None,
+    blacklist: List[str] = [],
+    time_s: float | None = None,
+    time_e: float | None = None,
+    topic_prefix: str = "/fmu/out",
+    capitalise_topics: bool = False,
+    max_frequency: float | None = None,
+    verbose: bool = False,
+    format: str = "csv",
+    index: bool = True,
+    fields: Dict[str, List[str]] | None = None,
+    msg_dir: str | None = None,
+) -> None:
+    """
+    Converts a PX4 ULog file directly to a ROS 2 bag file.
+
+    The log is decoded once, a block of rows at a time: each block is rate
+    limited (see `rate_limit`) and serialized as it is decoded, so that no
+    number goes through text and memory use does not grow with the size of
+    the log. The serialized messages wait in a temporary file next to the bag
+    until the log is decoded, as only then are the topic instances named.
+    Without a `max_frequency`, the bag holds what `convert_ulog2csv` followed
+    by `convert_csv2ros2bag` would write. With `csv_output`, the topic tables
+    are written there as well, as by `convert_ulog2csv` (at their full rate).
+
+    Args:
+    - directory_address (str): Directory path of the ULog file.
+    - ulog_file_name (str): Name of the ULog file to convert.
+    - output_dir (str): Directory to write the bag into; the bag is named after the ULog.
+    - messages (List[str]): List of message names to include (all if None).
+    - csv_output (str): Output directory for the tables, as `output` of
+      `convert_ulog2csv` (no tables are written if None).
+    - blacklist (List[str]): List of field names to exclude.
+    - time_s (float): Start time (in seconds) for extraction (defaults to log start).
+    - time_e (float): End time (in seconds) for extraction (defaults to log end).
+    - topic_prefix (str): Prefix to the topics in the bag file.
+    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
+    - max_frequency (float): Maximum rate of each topic in the bag, in Hz (no limit if None).
+    - verbose (bool): Verbosity of logging.
+    - format (str): Table format of `csv_output`, "csv" (default), "npy" or "arrow".
+    - index (bool): Whether to use (and build) the cached index of the log.
+    - fields (Dict[str, List[str]]): Topic name -> fields to keep (besides the timestamp).
+    - msg_dir (str): Directory of the PX4 `.msg` definitions (see `convert_csv2ros2bag`).
+
+    Raises:
+    - ULogDecodeError: If the ULog cannot be decoded.
+    """
+    writable = _can_write_bags(msg_dir, verbose)
+    if not writable and csv_output is None:
         return
 
-    files: list[str] = os.listdir(bag_file_address)
-    rosbag_db: str | None = None
-    for file in files:
-        if file.endswith(".db3"):
-            rosbag_db = file
-    if rosbag_db is None:
+    ulog_path = os.path.join(directory_address, ulog_file_name)
+    output_file_prefix = None
+    if csv_output is not None:
+        output_file_prefix = csv_output_dir(csv_output, ulog_path)
+    arguments = (
+        ulog_path, messages, output_file_prefix, blacklist, ",", time_s, time_e,
+        False, verbose, False, format, index, fields,
+    )
+    if not writable:
+        _decode_ulog(*arguments)
         return
-    
-    conn = sqlite3.connect(os.path.join(bag_file_address, rosbag_db))
-    c = conn.cursor()
-    topic_names: list[str] = []
-    topic_types: list[str] = []
-    topic_id = []
-    records = c.execute("SELECT * from({})".format("topics")).fetchall()
-    for row in records:
-        if row[1] == "/rosout" : 
-            topic_names.append("")
-            topic_types.append("")
-            topic_id.append(None)
+
+    uri = csv_output_dir(output_dir, ulog_path)
+    shutil.rmtree(uri, ignore_errors=True)
+    os.makedirs(os.path.dirname(uri), exist_ok=True)
+    bag = _open_bag(uri, msg_dir, verbose)
+    spills: Dict[_TopicSink, _BagSpill | None] = {}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(uri)) as spill_dir:
+
+        def spill_block(sink: _TopicSink, columns: List[np.ndarray]) -> None:
+            if sink not in spills:
+                spills[sink] = _BagSpill(os.path.join(spill_dir, str(len(spills))), max_frequency)
+            spill = spills[sink]
+            if spill is None:
+                return
+            topic_name, msg_type = bag_topic(sink.name, topic_prefix, capitalise_topics)
+            if not spill.add(columns, lambda columns: bag.encode(topic_name, msg_type, sink.header_keys, columns)):
+                # a message type the bag cannot serialize
+                spill.close()
+                spills[sink] = None
+
+        try:
+            topics = _decode_ulog(*arguments, spill_block)
+
+            # same topic order as a bag written from the tables
+            stems = sorted(topics, key=lambda stem: table_name(stem, format))
+            for stem in stems:
+                bag.create_topic(*bag_topic(stem, topic_prefix, capitalise_topics))
+
+            for stem in stems:
+                spill = spills.get(topics[stem])
+                if spill is None:
+                    continue
+                topic_name, _ = bag_topic(stem, topic_prefix, capitalise_topics)
+                if spill.kept[0] < spill.decoded[0]:
+                    log(f"{topic_name}: {spill.rate(spill.decoded):.1f} Hz -> {spill.rate(spill.kept):.1f} Hz", verbosity=verbose, log_level=0)
+                for timestamps, payloads in spill.messages():
+                    bag.write_messages(topic_name, timestamps, payloads)
+            bag.close()
+        except BaseException:
+            bag.close()
+            shutil.rmtree(uri, ignore_errors=True)
+            raise
+        finally:
+            for spill in spills.values():
+                if spill is not None:
+                    spill.close()
+
+
+def _bag_columns(key: str, value) -> List[str]:
+    """
+    Returns the CSV columns of a message field in `convert_ros2bag2csv`
+    tables: one per array element, followed by the first element again.
+    """
+    if isinstance(value, (np.ndarray, list, str)):
+        if len(value) == 0:
+            return []
+        return [f"{key}_{i}" for i in range(len(value))] + [f"{key}_0"]
+    return [key]
+
+
+def _bag_values(value) -> list:
+    """Returns the CSV values of a message field, as laid out by `_bag_columns`."""
+    if isinstance(value, (np.ndarray, list, str)):
+        if len(value) == 0:
+            return []
+        return list(value) + [value[0]]
+    return [value]
+
+
+def _bag_record_columns(records: np.ndarray, keys: List[str]) -> List[np.ndarray]:
+    """
+    Returns the CSV columns of decoded records (see `cdr.CdrCodec.decode_many`),
+    laid out as by `_bag_columns`, holding the values `_bag_values` would print.
+    """
+    columns = []
+    for key in keys:
+        column = records[key]
+        column = column.astype(column.dtype.newbyteorder("="), copy=False)
+        if column.ndim > 1:
+            columns.extend(column[:, i] for i in range(column.shape[1]))
+            columns.append(column[:, 0])
+        elif column.dtype == np.float32:
+            # scalar fields of ROS 2 messages are Python floats
+            columns.append(column.astype(np.float64))
         else:
-            topic_names.append(row[1])
-            topic_types.append(row[2])
-            topic_id.append(row[0])
+            columns.append(column)
+    return columns
+
+
+class _BagTopicCsv(ABC):
+    """
+    Writes the messages of a bag topic to a CSV file, decoding them a block
+    of messages at a time. The file is created with the first block.
+    Without a `path` the rows (without the header) are written to an
+    in-memory `csvfile`.
+
+    Args:
+    - path (str | None): Path of the CSV file.
+    - blacklist (List[str]): Message fields to leave out.
+    """
+
+    def __init__(self, path: str | None, blacklist: List[str] = []):
+        self.path = path
+        self.blacklist = set(blacklist)
+        self.pending: List[Tuple[int, bytes]] = []
+        self.header_row: List[str] | None = None
+        self.csvfile = None
+        self.csv_writer = None
+
+    def add(self, timestamp: int, data: bytes) -> None:
+        self.pending.append((timestamp, data))
+        if len(self.pending) >= BLOCK_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        block = self.pending
+        self.pending = []
+        if self.csvfile is None:
+            self.header_row = self.header(block[0][1])
+            if self.path is None:
+                self.csvfile = io.StringIO(newline="")
+                self.csv_writer = csv.writer(self.csvfile)
+            else:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.csvfile = open(self.path, "w", newline="")
+                self.csv_writer = csv.writer(self.csvfile)
+                self.csv_writer.writerow(self.header_row)
+        self.write(block)
+
+    def close(self) -> None:
+        self.flush()
+        if self.csvfile is not None and self.path is not None:
+            self.csvfile.close()
+
+    @abstractmethod
+    def header(self, data: bytes) -> List[str]:
+        """Returns the header row, judged by the first message."""
+
+    @abstractmethod
+    def write(self, block: List[Tuple[int, bytes]]) -> None:
+        """Writes the rows of a block of (timestamp, message) pairs."""
+
+
+class _CdrTopicCsv(_BagTopicCsv):
+    """
+    Topic CSV decoded from the `.msg` definition of the topic type. Types of
+    a fixed layout are decoded as views on the concatenated blobs.
+    """
 
-    msg_records = c.execute("SELECT * from({})".format("messages")).fetchall()
+    def __init__(self, path: str, codec, blacklist: List[str] = []):
+        super().__init__(path, blacklist)
+        self.codec = codec
+        self.keys: List[str] = []
+
+    def header(self, data: bytes) -> List[str]:
+        # fields in the (alphabetical) order of the ROS 2 message attributes
+        message = self.codec.decode(data)
+        self.keys = sorted(key for key in message if key not in self.blacklist)
+        header_row = ["ros_timestamp"]
+        for key in self.keys:
+            header_row.extend(_bag_columns(key, message[key]))
+        return header_row
+
+    def write(self, block: List[Tuple[int, bytes]]) -> None:
+        records = self.codec.decode_many([data for _, data in block]) if self.codec.flat else None
+        if records is not None:
+            timestamps = np.array([timestamp for timestamp, _ in block], dtype=np.int64)
+            write_csv_rows(
+                self.csvfile, [timestamps] + _bag_record_columns(records, self.keys), line_terminator="\r\n"
+            )
+            return
+        for timestamp, data in block:
+            message = self.codec.decode(data)
+            row = [timestamp]
+            for key in self.keys:
+                row.extend(_bag_values(message[key]))
+            self.csv_writer.writerow(row)
+
+
+class _RosTopicCsv(_BagTopicCsv):
+    """Topic CSV decoded with rclpy into the px4_msgs message class."""
+
+    def __init__(self, path: str, msg_type, deserialize_message, blacklist: List[str] = []):
+        super().__init__(path, blacklist)
+        self.msg_type = msg_type
+        self.deserialize_message = deserialize_message
+        self.attributes: List[str] = []
+
+    def header(self, data: bytes) -> List[str]:
+        header_row = ["ros_timestamp"]
+        first_msg = self.deserialize_message(data, self.msg_type)
+        for key in dir(first_msg):
+            if key[0] != "_" and key.islower() and key != "get_fields_and_field_types" and key not in self.blacklist:
+                self.attributes.append(key)
+                try:
+                    attr_size = getattr(first_msg, key)
+                    if len(attr_size) > 0:
+                        for i in range(len(attr_size)):
+                            header_row.append(f"{key}_{i}")
+                        else:
+                            header_row.append(f"{key}_0")
+                except Exception:
+                    header_row.append(key)
+        return header_row
+
+    def write(self, block: List[Tuple[int, bytes]]) -> None:
+        for timestamp, message in block:
+            deserialized_msg = self.deserialize_message(message, self.msg_type)
+
+            row = []
+            row.append(timestamp)
+            for key in self.attributes:
+                try:
+                    attr_size = getattr(deserialized_msg, key)
+                    if len(attr_size) > 0:
+                        for i in range(len(attr_size)):
+                            row.append(getattr(deserialized_msg, key)[i])
+                        else:
+                            row.append(getattr(deserialized_msg, key)[0])
+                except Exception:
+                    row.append(getattr(deserialized_msg, key))
+            self.csv_writer.writerow(row)
+
+
+def _convert_db3_csv(
+    db_paths: List[str],
+    csv_dir: str,
+    open_topic,
+    topic_names: List[str] | None = None,
+    nested: bool = True,
+    start: int | None = None,
+    end: int | None = None,
+    create_index: bool = False,
+    verbose: bool = False,
+) -> None:
+    """
+    Writes the topics of a bag to CSV files in `csv_dir`, in a single pass
+    over the messages of each of its files: each message goes to the open
+    CSV writer of its topic, so memory use does not grow with the size of
+    the bag. The topics of a split bag are continued from file to file.
+
+    Args:
+    - db_paths (List[str]): `.db3` files of the bag, in recording order.
+    - csv_dir (str): Output directory of the CSV files.
+    - open_topic (Callable): (CSV path, topic name, topic type) -> _BagTopicCsv,
+      or None to skip the topic.
+    - topic_names (List[str]): Topics to convert (all if None).
+    - nested (bool): Also convert the topics nested under `topic_names`.
+    - start (int): Start of the time window, in nanoseconds of bag time.
+    - end (int): End of the time window, in nanoseconds of bag time.
+    - create_index (bool): Index the messages by topic, if they are not yet.
+    - verbose (bool): Verbosity of logging.
+    """
+    sinks: Dict[str, _BagTopicCsv | None] = {}
+    try:
+        for db_path in db_paths:
+            reader = Db3Reader(db_path)
+            try:
+                topics = {
+                    topic_id: (topic_name, topic_type)
+                    for topic_id, topic_name, topic_type in reader.topics(topic_names, nested)
+                    if topic_name != "/rosout"
+                }
+                topic_ids = None if topic_names is None else list(topics)
+                if create_index and topic_ids is not None:
+                    try:
+                        reader.create_topic_index()
+                    except sqlite3.Error as e:
+                        log(f"Could not index {db_path} by topic: {e}.", verbosity=verbose, log_level=1)
+                topic_sinks: Dict[int, _BagTopicCsv | None] = {}
+                for topic_id, timestamp, data in reader.messages(topic_ids, start, end):
+                    sink = topic_sinks.get(topic_id, False)
+                    if sink is False:
+                        sink = None
+                        if topic_id in topics:
+                            topic_name, topic_type = topics[topic_id]
+                            if topic_name not in sinks:
+                                csv_file_name: str = topic_name.replace("/", ".")[1:]
+                                path = os.path.join(csv_dir, f"{csv_file_name}.csv")
+                                sinks[topic_name] = open_topic(path, topic_name, topic_type)
+                            sink = sinks[topic_name]
+                        topic_sinks[topic_id] = sink
+                    if sink is not None:
+                        sink.add(timestamp, data)
+            finally:
+                reader.close()
+    finally:
+        for sink in sinks.values():
+            if sink is not None:
+                sink.close()
 
-    for i in range(len(topic_names)):
-        if topic_names[i] == "":
+
+def _whitelisted_topics(messages: List[str] | None, topic_prefix: str, capitalise_topics: bool) -> List[str] | None:
+    """Returns the bag topics of whitelisted message names (None for all)."""
+    if not messages:
+        return None
+    return [bag_topic(message, topic_prefix, capitalise_topics)[0] for message in messages]
+
+
+def bag_topic_sizes(
+    bag_file_address: str,
+    messages: List[str] | None = None,
+    topic_prefix: str = "/fmu/out",
+    capitalise_topics: bool = False,
+    create_index: bool = False,
+    verbose: bool = False,
+) -> Dict[str, int] | None:
+    """
+    Returns the whitelisted topics of a bag, over all of its files, with their
+    estimated share of the bag size, so that the topics can be converted as
+    separate work units.
+
+    Args:
+    - bag_file_address (str): Bag directory.
+    - messages (List[str]): List of message names to include (all if None).
+    - topic_prefix (str): Prefix to the topics in the bag file.
+    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
+    - create_index (bool): Index the messages of the bag by topic, if they are not yet.
+    - verbose (bool): Verbosity of logging.
+
+    Returns:
+    - Dict[str, int] | None: Topic name -> size in bytes, or None if the bag
+      is not indexed by topic, as then every topic would be read with a scan
+      of the whole bag.
+    """
+    topic_names = _whitelisted_topics(messages, topic_prefix, capitalise_topics)
+    sizes: Dict[str, int] = {}
+    for db_file in bag_files(bag_file_address):
+        db_path = os.path.join(bag_file_address, db_file)
+        reader = Db3Reader(db_path)
+        try:
+            if create_index:
+                try:
+                    reader.create_topic_index()
+                except sqlite3.Error as e:
+                    log(f"Could not index {db_path} by topic: {e}.", verbosity=verbose, log_level=1)
+            if not reader.has_topic_index():
+                return None
+            counts = reader.message_counts()
+            total = sum(counts.values()) or 1
+            for topic_id, topic_name, _ in reader.topics(topic_names):
+                if topic_name != "/rosout" and counts.get(topic_id):
+                    share = os.path.getsize(db_path) * counts[topic_id] // total
+                    sizes[topic_name] = sizes.get(topic_name, 0) + share
+        finally:
+            reader.close()
+    return sizes
+
+
+def _bag_start_time(db_paths: List[str]) -> int | None:
+    """Returns the receive time of the first message of a bag, over all of its files, in nanoseconds."""
+    starts = []
+    for db_path in db_paths:
+        reader = Db3Reader(db_path)
+        try:
+            start = reader.start_time()
+        finally:
+            reader.close()
+        if start is not None:
+            starts.append(start)
+    return min(starts) if starts else None
+
+
+def convert_ros2bag2csv(
+    bag_file_address: str,
+    verbose: bool = False,
+    msg_dir: str | None = None,
+    messages: List[str] | None = None,
+    blacklist: List[str] = [],
+    time_s: float | None = None,
+    time_e: float | None = None,
+    topic_prefix: str = "/fmu/out",
+    capitalise_topics: bool = False,
+    create_index: bool = False,
+    output_dir: str | None = None,
+    topics: List[str] | None = None,
+):
+    """
+    Converts the topics of a ROS 2 bag, over all of its `.db3` files, to CSV
+    files in its "topic_csvs" directory (or `output_dir`).
+
+    With the PX4 `.msg` definitions at hand (`msg_dir`, or the px4_msgs
+    package of a sourced ROS 2 environment) the bag is read without ROS 2.
+    The message and time selection is done by the SQL queries on the bag, so
+    only the rows of the selected topics and time window are decoded.
+
+    Args:
+    - bag_file_address (str): Bag directory.
+    - verbose (bool): Verbosity of logging.
+    - msg_dir (str): Directory of the PX4 `.msg` definitions.
+    - messages (List[str]): List of message names to include (all if None),
+      e.g. "sensor_combined" for the topic "/fmu/out/sensor_combined".
+    - blacklist (List[str]): List of field names to exclude.
+    - time_s (float): Start time for extraction, in seconds from the first
+      message of the bag (defaults to bag start).
+    - time_e (float): End time for extraction, in seconds from the first
+      message of the bag (defaults to bag end).
+    - topic_prefix (str): Prefix to the topics in the bag file.
+    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
+    - create_index (bool): Index the messages of the bag by topic for the
+      message selection, if they are not yet (modifies the bag file).
+    - output_dir (str): Output directory of the CSV files (defaults to
+      "topic_csvs" in the bag directory).
+    - topics (List[str]): Bag topics to convert, instead of those of `messages`.
+    """
+    dirs = msg_dirs(msg_dir)
+    if dirs:
+        registry = MsgRegistry(dirs)
+
+        def open_topic(path: str, topic_name: str, topic_type: str) -> _BagTopicCsv | None:
+            try:
+                return _CdrTopicCsv(path, registry.codec(topic_type), blacklist)
+            except (KeyError, ValueError) as e:
+                log(f"{e}. Skipping topic {topic_name}.", verbosity=verbose, log_level=1)
+                return None
+
+    else:
+        try:
+            import px4_msgs.msg
+            from rosidl_runtime_py.utilities import get_message
+            from rclpy.serialization import deserialize_message
+        except Exception as e:
+            if e is not ImportError or e is not ModuleNotFoundError:
+                log(
+                    "Missing required ROS 2 packages. Make sure that the ROS 2 environment is sourced. Skipping conversion to ROS 2 bag.",
+                    verbosity=verbose,
+                    log_level=2,
+                )
+            else:
+                log(
+                    "Missing required ROS 2 px4_msgs library. Make sure that it is sourced. Skipping conversion to ROS 2 bag.",
+                    verbosity=verbose,
+                    log_level=2,
+                )
+            return
+
+        def open_topic(path: str, topic_name: str, topic_type: str) -> _BagTopicCsv | None:
+            return _RosTopicCsv(path, get_message(topic_type), deserialize_message, blacklist)
+
+    if topics is not None:
+        topic_names, nested = topics, False
+    else:
+        topic_names, nested = _whitelisted_topics(messages, topic_prefix, capitalise_topics), True
+    if output_dir is None:
+        output_dir = os.path.join(bag_file_address, "topic_csvs")
+
+    db_paths = [os.path.join(bag_file_address, db_file) for db_file in bag_files(bag_file_address)]
+    start = end = None
+    if time_s is not None or time_e is not None:
+        # bag timestamps are PX4 time for bags written by this tool, but the
+        # receive (epoch) time for recorded ones: offset from the first message
+        bag_start = _bag_start_time(db_paths)
+        if bag_start is None:
+            return
+        start = None if time_s is None else bag_start + int(time_s * 1e9)
+        end = None if time_e is None else bag_start + int(time_e * 1e9)
+    _convert_db3_csv(db_paths, output_dir, open_topic, topic_names, nested, start, end, create_index, verbose)
+
+
+# Codecs of the MCAP channels decoded by a process: (file, channel id) -> codec.
+# Those of a file are dropped when `convert_mcap2csv` is done with it.
+_mcap_codecs: Dict[Tuple[str, int], Any] = {}
+
+
+def _mcap_codec(path: str, channel: McapChannel, msg_dir: str | None):
+    """Returns the CDR codec of an MCAP channel, from its schema or the `.msg` definitions."""
+    key = (path, channel.id)
+    if key not in _mcap_codecs:
+        registry = MsgRegistry(msg_dirs(msg_dir))
+        if channel.schema_encoding == "ros2msg":
+            registry.add_schema(channel.schema_name, channel.schema_data.decode("utf-8"))
+        _mcap_codecs[key] = registry.codec(channel.schema_name)
+    return _mcap_codecs[key]
+
+
+def _mcap_chunk_csv(
+    path: str,
+    chunk: McapChunk,
+    channels: List[McapChannel],
+    msg_dir: str | None,
+    blacklist: List[str],
+    start: int | None,
+    end: int | None,
+) -> Dict[int, Tuple[List[str], str]]:
+    """
+    Decodes the messages of some channels in a chunk of an MCAP file to CSV
+    rows. Run in the worker processes of `convert_mcap2csv`.
+
+    Returns:
+    - Dict[int, Tuple[List[str], str]]: Channel id -> CSV header and rows of
+      its messages in the chunk (and time window).
+    """
+    rows = {}
+    for channel_id, (log_times, payloads) in chunk_messages(path, chunk, [channel.id for channel in channels]).items():
+        keep = np.ones(len(log_times), dtype=bool)
+        if start is not None:
+            keep &= log_times >= start
+        if end is not None:
+            keep &= log_times < end
+        if not keep.any():
+            continue
+        channel = next(channel for channel in channels if channel.id == channel_id)
+        sink = _CdrTopicCsv(None, _mcap_codec(path, channel, msg_dir), blacklist)
+        for log_time, payload in zip(log_times[keep].tolist(), compress(payloads, keep)):
+            sink.add(log_time, payload)
+        sink.close()
+        rows[channel_id] = (sink.header_row, sink.csvfile.getvalue())
+    return rows
+
+
+def convert_mcap2csv(
+    mcap_file: str,
+    output_dir: str,
+    messages: List[str] | None = None,
+    blacklist: List[str] = [],
+    time_s: float | None = None,
+    time_e: float | None = None,
+    topic_prefix: str = "/fmu/out",
+    capitalise_topics: bool = False,
+    msg_dir: str | None = None,
+    jobs: int | None = None,
+    verbose: bool = False,
+) -> bool:
+    """
+    Converts the topics of a ROS 2 MCAP file to CSV files in `output_dir`,
+    laid out as by `convert_ros2bag2csv`, with the log time of the messages
+    as "ros_timestamp".
+
+    Only the chunks that hold messages of the whitelisted topics within the
+    time window are read, as found from the chunk indexes of the file. The
+    chunks are decompressed and decoded in parallel, and their rows appended
+    to the CSV files in file order. Messages are decoded with the schemas
+    stored in the file, or else with the `.msg` definitions of `msg_dir`.
+
+    Args:
+    - mcap_file (str): Path of the MCAP file.
+    - output_dir (str): Output directory of the CSV files.
+    - messages (List[str]): List of message names to include (all if None),
+      e.g. "sensor_combined" for the topic "/fmu/out/sensor_combined".
+    - blacklist (List[str]): List of field names to exclude.
+    - time_s (float): Start time for extraction, in seconds from the first
+      message of the file (defaults to log start).
+    - time_e (float): End time for extraction, in seconds from the first
+      message of the file (defaults to log end).
+    - topic_prefix (str): Prefix to the topics in the file.
+    - capitalise_topics (bool): For compatibility with snake and camelcase topics.
+    - msg_dir (str): Directory of the PX4 `.msg` definitions.
+    - jobs (int): Number of worker processes. Defaults to the CPU count.
+    - verbose (bool): Verbosity of logging.
+
+    Returns:
+    - bool: True if the file was converted.
+    """
+    try:
+        reader = McapReader(mcap_file)
+    except (OSError, McapError) as e:
+        log(f"Issue with reading file {mcap_file}: {e}.", verbosity=verbose, log_level=2)
+        return False
+
+    topic_names = _whitelisted_topics(messages, topic_prefix, capitalise_topics)
+    channels: Dict[int, McapChannel] = {}
+    for channel in reader.channels.values():
+        if channel.topic == "/rosout" or channel.message_encoding != "cdr":
+            continue
+        if topic_names is not None and not any(
+            channel.topic == name or channel.topic.startswith(f"{name}/") for name in topic_names
+        ):
             continue
-        time = []
-        count = 0
-        messages = []
-        msg_type = get_message(topic_types[i])
-        for row in msg_records:
-            if topic_id[i] == row[1]:
-                count += 1
-                time.append(row[2])
-                messages.append(row[3])
-        if len(messages) < 1:
+        try:
+            _mcap_codec(mcap_file, channel, msg_dir)
+        except (KeyError, ValueError, UnicodeDecodeError) as e:
+            log(f"{e}. Skipping topic {channel.topic}.", verbosity=verbose, log_level=1)
             continue
+        channels[channel.id] = channel
 
-        os.makedirs(os.path.join(bag_file_address , "topic_csvs"), exist_ok=True)
-        csv_file_name: str = topic_names[i].replace("/",".")[1:]
-        with open(f"{bag_file_address }/topic_csvs/{csv_file_name}.csv", "w", newline="") as csvfile:
-            # Create a CSV writer
-            csv_writer = csv.writer(csvfile)
-
-            # store header and attribute rows
-            attributes = []
-            header_row = ["ros_timestamp"]
-            for key in dir(deserialize_message(messages[0], msg_type)):
-                if key[0] != "_" and key.islower() and key != "get_fields_and_field_types":
-                    attributes.append(key)
-                    try:
-                        attr_size = getattr(deserialize_message(messages[0], msg_type), key)
-                        if len(attr_size) > 0:
-                            for i in range(len(attr_size)):
-                                header_row.append(f"{key}_{i}")
-                            else:
-                                header_row.append(f"{key}_0")
-                    except Exception:
-                        header_row.append(key)
-
-            csv_writer.writerow(header_row)
-
-            # Write rows
-            for timestamp, message in zip(time, messages):
-                deserialized_msg = deserialize_message(message, msg_type)
-                
-                row = []
-                row.append(timestamp)
-                for key in attributes:
-                    try:
-                        attr_size = getattr(deserialized_msg, key)
-                        if len(attr_size) > 0:
-                            for i in range(len(attr_size)):
-                                row.append(getattr(deserialized_msg, key)[i])
-                            else:
-                                row.append(getattr(deserialized_msg, key)[0])
-                    except Exception:
-                        row.append(getattr(deserialized_msg, key))
-                csv_writer.writerow(row)
-
-    conn.close()
-            
-## TODO: REFACTOR
-# import importlib
-# import yaml
-# from glob import glob
-# 
-# def px4_mcap_to_csv(mcap_dir: str) -> None:
-#     """
-#     Convert PX4 MCAP files to CSV format.
-#
-#     Args:
-#         mcap_dir (str): Path to the directory containing MCAP directories.
-#     Raises:
-#
-#         FileNotFoundError: If no MCAP files are found in the specified directory.
-#     """
-#     import px4_msgs.msg
-#     from mcap_ros2.reader import read_ros2_messages
-#     from rosidl_runtime_py import message_to_ordereddict
-#
-#     try:
-#         mcap_filename = glob(os.path.join(mcap_dir, "*.mcap"))[0]
-#         metadata = glob(os.path.join(mcap_dir, "*.yaml"))[0]
-#     except IndexError:
-#         print(f"No MCAP files found in {mcap_dir}")
-#         return
-#
-#     with open(metadata, "r") as file:
-#         metadata = yaml.safe_load(file)
-#
-#     msg_df = {}
-#     msg_rosdict = {}
-#     msg_csvstr = {}
-#
-#     for i in range(
-#         len(metadata["rosbag2_bagfile_information"]["topics_with_message_count"])
-#     ):
-#         msg_addr = metadata["rosbag2_bagfile_information"]["topics_with_message_count"][
-#             i
-#         ]["topic_metadata"]["type"]
-#
-#         msg_addr = msg_addr.split("/")
-#
-#         module = importlib.import_module(msg_addr[0])
-#         message_package = getattr(module, msg_addr[1])
-#         message = getattr(message_package, msg_addr[2])
-#
-#         empty_msg_dict = message_to_ordereddict(message())
-#         msg_rosdict[message().__class__.__name__] = empty_msg_dict
-#
-#         header = []
-#         for sub_key in list(empty_msg_dict.keys()):
-#             if sub_key == "timestamp":
-#                 header.append(sub_key)
-#             else:
-#                 try:
-#                     for j in range(len(empty_msg_dict[sub_key])):
-#                         header.append(sub_key + f"_{j}")
-#                 except TypeError:
-#                     header.append(f"{sub_key}")
-#         header = ",".join(header) + "\n"
-#
-#         msg_csvstr[message().__class__.__name__] = header
-#
-#     i = 0
-#     try:
-#         for msg in read_ros2_messages(mcap_filename):
-#             msg_class = msg.ros_msg.__class__.__name__
-#
-#             try:
-#                 current_line = (
-#                     ",".join(
-#                         [
-#                             f"{msg.ros_msg.__getattribute__(key)}"
-#                             for key in list(msg_rosdict[msg_class].keys())
-#                         ]
-#                     )
-#                     + "\n"
-#                 )
-#                 current_line = current_line.replace("[", "")
-#                 current_line = current_line.replace("]", "")
-#                 current_line = current_line.replace(", ", ",")
-#                 msg_csvstr[msg_class] += current_line
-#             except Exception as _:
-#                 continue
-#
-#         for key in list(msg_csvstr.keys()):
-#             dat = [x.split(",") for x in msg_csvstr[key].strip("\n").split("\n")]
-#             msg_df[key] = pd.DataFrame(dat)
-#             msg_df[key] = msg_df[key].T.set_index(0, drop=True).T
-#     except Exception as e:
-#         print(
-#             f"Message versions probably aren't matching. Confirm if message fields are matching: {e}"
-#         )
-#
-#     for key in list(msg_df.keys()):
-#         dumpfile = f"{mcap_dir}{key}.csv"
-#         msg_df[key].to_csv(dumpfile, index=False)
-#
-#     return
+    # log times are PX4 time or the receive (epoch) time: offset from the first message
+    log_start = min((chunk.start_time for chunk in reader.chunks), default=0)
+    start = None if time_s is None else log_start + int(time_s * 1e9)
+    end = None if time_e is None else log_start + int(time_e * 1e9)
+    tasks = []
+    for chunk in reader.chunks:
+        if (start is not None and chunk.end_time < start) or (end is not None and chunk.start_time >= end):
+            continue
+        chunk_channels = list(channels.values())
+        if chunk.message_indexes:
+            chunk_channels = [channel for channel in chunk_channels if channel.id in chunk.message_indexes]
+        if chunk_channels:
+            tasks.append((mcap_file, chunk, chunk_channels, msg_dir, blacklist, start, end))
+
+    csvfiles = {}
+    try:
+        for rows in map_ordered(_mcap_chunk_csv, tasks, jobs=jobs):
+            for channel_id, (header_row, text) in rows.items():
+                if channel_id not in csvfiles:
+                    csv_file_name: str = channels[channel_id].topic.replace("/", ".")[1:]
+                    os.makedirs(output_dir, exist_ok=True)
+                    csvfiles[channel_id] = open(os.path.join(output_dir, f"{csv_file_name}.csv"), "w", newline="")
+                    csv.writer(csvfiles[channel_id]).writerow(header_row)
+                csvfiles[channel_id].write(text)
+    except (McapError, struct.error, ValueError) as e:
+        # ValueError: a message payload shorter than its type
+        log(f"Issue with decoding file {mcap_file}: {e}.", verbosity=verbose, log_level=2)
+        return False
+    finally:
+        for csvfile in csvfiles.values():
+            csvfile.close()
+        # the worker processes end with the conversion, but not this one
+        for key in [key for key in _mcap_codecs if key[0] == mcap_file]:
+            del _mcap_codecs[key]
+    return True
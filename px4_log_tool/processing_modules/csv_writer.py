@@ -0,0 +1,286 @@
+import numpy as np
+from typing import List, TextIO
+
+# Rows formatted and written per block. Bounds the size of the intermediate
+# character arrays while keeping the number of write() calls small.
+BLOCK_ROWS = 1 << 14
+# Character rows transposed at a time; transposing the whole block in one go
+# strides through far more memory than the cache holds.
+TRANSPOSE_ROWS = 64
+
+_NUL = 0
+_ZERO = ord("0")
+_DOT = ord(".")
+_MINUS = ord("-")
+
+_POW10_U64 = np.array([10**i for i in range(20)], dtype=np.uint64)
+_POW10_F64 = np.array([10.0**i for i in range(23)])
+
+# numpy prints float32 scalars positionally only within [1e-4, 1e6); within
+# that range every value has a decimal exponent e in [-4, 5] and its shortest
+# round-trip representation has at most 9 significant digits.
+_F32_MIN_EXP = -4
+_F32_MAX_EXP = 5
+_F32_MAX_DIGITS = 9
+_F32_POW10 = np.power(10.0, np.arange(_F32_MIN_EXP, _F32_MAX_EXP + 2))
+# exact powers of ten scaling a value of exponent e to 9 integer digits
+_F32_SCALE = np.power(10.0, _F32_MAX_DIGITS - 1 - np.arange(_F32_MIN_EXP, _F32_MAX_EXP + 2))
+# rounding steps, in units of the scaled value, for dropping k trailing digits
+_F32_STEP = np.power(10.0, np.arange(_F32_MAX_DIGITS))
+# tolerance, in units of the scaled value, below which rounding decisions made
+# in float64 are not trusted
+_F32_TOLERANCE = 1e-6
+
+
+def _to_rows(strings: List[str]) -> np.ndarray:
+    """Packs ASCII strings into NUL padded (width, n) character rows."""
+    packed = np.array([s.encode("ascii") for s in strings], dtype=bytes)
+    if packed.itemsize == 0:
+        return np.zeros((1, len(strings)), dtype=np.uint8)
+    return packed.view(np.uint8).reshape(len(strings), packed.itemsize).T
+
+
+def _format_fallback(values: np.ndarray) -> np.ndarray:
+    """Formats values with str() of their numpy scalars, once per unique value."""
+    if values.dtype.kind not in "biuf" or values.itemsize not in (1, 2, 4, 8):
+        return _to_rows([str(v) for v in values])
+    # compare bit patterns so that 0.0 and -0.0 keep their own text
+    bits = values.view(np.dtype(f"u{values.itemsize}"))
+    _, first, inverse = np.unique(bits, return_index=True, return_inverse=True)
+    return _to_rows([str(v) for v in values[first]])[:, inverse.reshape(-1)]
+
+
+def _digit_rows(values: np.ndarray, n_digits: int) -> np.ndarray:
+    """Returns the n_digits least significant decimal digits as (n_digits, n) ASCII rows."""
+    rows = np.empty((n_digits, values.size), dtype=np.uint8)
+    quotient = np.empty(values.size, dtype=np.uint32)
+    digit = np.empty(values.size, dtype=np.uint32)
+    # peel off nine digits at a time so that the inner loop runs on uint32
+    remainder = values
+    for stop in range(n_digits, 0, -9):
+        if stop > 9:
+            high = remainder // _POW10_U64[9]
+            chunk = (remainder - high * _POW10_U64[9]).astype(np.uint32)
+            remainder = high
+        else:
+            chunk = remainder.astype(np.uint32)
+        for row in range(stop - 1, max(stop - 9, 0) - 1, -1):
+            np.floor_divide(chunk, np.uint32(10), out=quotient)
+            np.multiply(quotient, np.uint32(10), out=digit)
+            np.subtract(chunk, digit, out=digit)
+            rows[row] = digit
+            chunk, quotient = quotient, chunk
+    rows += np.uint8(_ZERO)
+    return rows
+
+
+def _blank_leading_zeros(rows: np.ndarray) -> None:
+    """Replaces the zeros in front of the first non-zero digit of each column with NUL."""
+    significant = np.zeros(rows.shape[1], dtype=bool)
+    for row in rows:
+        significant |= row != _ZERO
+        np.multiply(row, significant, out=row)
+
+
+def _format_integers(values: np.ndarray) -> np.ndarray:
+    negative = values < 0 if values.dtype.kind == "i" else np.zeros(values.size, dtype=bool)
+    magnitude = values.astype(np.uint64)
+    magnitude[negative] = (~magnitude[negative]) + np.uint64(1)
+    width = len(str(int(magnitude.max()))) if values.size else 1
+
+    rows = np.empty((width + 1, values.size), dtype=np.uint8)
+    rows[0] = negative.view(np.uint8) * np.uint8(_MINUS)
+    digits = _digit_rows(magnitude, width)
+    # blank the leading zeros, always keeping the last digit
+    _blank_leading_zeros(digits[:-1])
+    rows[1:] = digits
+    return rows
+
+
+def _shortest_digits(values: np.ndarray) -> tuple[np.ndarray, ...]:
+    """
+    Finds the shortest round-trip decimal digits of float32 values inside
+    numpy's positional range with float64 arithmetic.
+
+    Returns:
+    - positional: Values printed positionally and resolved here.
+    - ambiguous: Values whose rounding cannot be decided safely in float64.
+    - kept: The digits, as an integer valued float64 array.
+    - e: Decimal place of the first digit.
+    - lowest: Decimal place of the last digit.
+    """
+    n = values.size
+    bits = values.view(np.uint32)
+    with np.errstate(invalid="ignore"):
+        a = np.abs(values.astype(np.float64))
+        positional = (a >= 1e-4) & (a < 1e6)
+    # powers of two have an asymmetric rounding interval
+    positional &= (bits & np.uint32(0x7FFFFF)) != 0
+    a = np.where(positional, a, 1.0)
+
+    e = np.floor(np.log10(a)).astype(np.intp) - _F32_MIN_EXP
+    e -= a < _F32_POW10[e]
+    e += a >= _F32_POW10[e + 1]
+
+    # In units of the value scaled to nine integer digits, the value rounds
+    # back to itself from anywhere within half a float32 ulp, 2**(exponent - 24).
+    # Both factors are powers of two or exact powers of ten, so the products
+    # below are exact.
+    scale = _F32_SCALE[e]
+    scaled = a * scale
+    exponent = ((bits >> np.uint32(23)) & np.uint32(0xFF)).astype(np.uint64)
+    half_ulp = ((exponent + np.uint64(1023 - 127 - 24)) << np.uint64(52)).view(np.float64)
+    half_ulp *= scale
+
+    # Nine digits always round-trip, and if p digits round-trip so do p + 1, so
+    # count how many trailing digits can be dropped before that stops working.
+    ambiguous = np.abs(np.abs(np.rint(scaled) - scaled) - 0.5) < _F32_TOLERANCE
+    searching = positional.copy()
+    dropped = np.zeros(n, dtype=np.intp)
+    for k in range(1, _F32_MAX_DIGITS):
+        t = 10.0**k
+        distance = np.abs(np.rint(scaled / t) * t - scaled)
+        unsafe = np.abs(distance - half_ulp) < _F32_TOLERANCE
+        unsafe |= np.abs(distance - 0.5 * t) < _F32_TOLERANCE
+        unsafe &= searching
+        ambiguous |= unsafe
+        searching &= distance < half_ulp
+        if not searching.any():
+            break
+        dropped += searching
+    step = _F32_STEP[dropped]
+    kept = np.rint(scaled / step)
+
+    # rounding up may carry into a new leading digit, e.g. 9.9999995 -> 10.0
+    carry = np.flatnonzero(kept * step == _F32_STEP[-1] * 10)
+    kept[carry] /= 10
+    e[carry] += 1
+    e += _F32_MIN_EXP
+    lowest = e - (_F32_MAX_DIGITS - 1) + dropped
+
+    return positional, ambiguous, kept, e, lowest
+
+
+def _format_float32(values: np.ndarray) -> np.ndarray:
+    """
+    Reproduces str(np.float32(x)) for whole arrays. Values inside numpy's
+    positional range are written from their shortest round-trip digits;
+    anything else (zero, nan, inf, scientific notation and the rare values
+    whose rounding cannot be decided safely) falls back to str().
+    """
+    n = values.size
+    positional, ambiguous, kept, e, lowest = _shortest_digits(values)
+
+    # lay the kept digits out on the places first .. last (first >= 0 > last)
+    # that any value of this block needs, e.g. 12.5 -> places 1, 0, -1
+    block_first = max(int(e.max(where=positional, initial=0)), 0)
+    block_last = min(int(lowest.min(where=positional, initial=-1)), -1)
+    fixed = kept.astype(np.uint64) * _POW10_U64[np.maximum(lowest - block_last, 0)]
+    digits = _digit_rows(fixed, block_first - block_last + 1)
+    n_int = block_first + 1
+    # the shortest digits never end in a zero, so blanking the leading and
+    # trailing zeros around the units and tenths places leaves exactly them
+    _blank_leading_zeros(digits[: n_int - 1])
+    _blank_leading_zeros(digits[: n_int : -1])
+
+    rows = np.empty((2 + digits.shape[0], n), dtype=np.uint8)
+    rows[0] = np.signbit(values).view(np.uint8) * np.uint8(_MINUS)
+    rows[1 : 1 + n_int] = digits[:n_int]
+    rows[1 + n_int] = _DOT
+    rows[2 + n_int :] = digits[n_int:]
+
+    fallback = ~positional | ambiguous
+    if not np.any(fallback):
+        return rows
+    formatted = _format_fallback(values[fallback])
+    if formatted.shape[0] > rows.shape[0]:
+        rows = np.pad(rows, ((0, formatted.shape[0] - rows.shape[0]), (0, 0)))
+    index = np.flatnonzero(fallback)
+    rows[:, index] = _NUL
+    rows[: formatted.shape[0], index] = formatted
+    return rows
+
+
+def widen_float32(values: np.ndarray) -> np.ndarray:
+    """
+    Converts float32 values to the float64 values of their printed text, i.e.
+    float(str(np.float32(x))), as reading the written CSV back would give.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    positional, ambiguous, kept, _, lowest = _shortest_digits(values)
+    # both factors are exact, so this is the correctly rounded decimal value
+    widened = kept / _POW10_F64[np.maximum(-lowest, 0)] * _POW10_F64[np.maximum(lowest, 0)]
+    with np.errstate(invalid="ignore"):
+        widened = np.copysign(widened, values)
+
+    fallback = np.flatnonzero(~positional | ambiguous)
+    if fallback.size:
+        unique, inverse = np.unique(values[fallback].view(np.uint32), return_inverse=True)
+        text = [float(str(v)) for v in unique.view(np.float32)]
+        widened[fallback] = np.array(text, dtype=np.float64)[inverse.reshape(-1)]
+    return widened
+
+
+def format_column(values: np.ndarray) -> np.ndarray:
+    """
+    Formats a 1-D array into NUL padded character rows of shape (width, n).
+
+    Stripping the NUL bytes from column i yields exactly str(values[i]), i.e.
+    the text the per-cell CSV writer produced for the numpy scalar.
+    """
+    values = np.ascontiguousarray(values)
+    if values.dtype.kind in "iu":
+        return _format_integers(values)
+    if values.dtype == np.float32:
+        return _format_float32(values)
+    if values.dtype == np.float64:
+        return _to_rows(list(map(repr, values.tolist())))
+    return _format_fallback(values)
+
+
+def write_csv_rows(
+    csvfile: TextIO,
+    columns: List[np.ndarray],
+    delimiter: str = ",",
+    block_rows: int = BLOCK_ROWS,
+    line_terminator: str = "\n",
+) -> None:
+    """
+    Writes equally long columns as delimited rows, one block of rows at a time.
+
+    The characters of every cell in a block are laid out column by column, so
+    a transpose yields the rows once the padding is dropped.
+
+    Args:
+    - csvfile (TextIO): Open text file to write to.
+    - columns (List[np.ndarray]): Column arrays in output order.
+    - delimiter (str): CSV delimiter (default: ",").
+    - block_rows (int): Number of rows formatted per write.
+    - line_terminator (str): End of each row (default: a newline; csv.writer
+      ends rows with a carriage return and a newline).
+    """
+    if len(columns) == 0:
+        return
+    separator = np.frombuffer(delimiter.encode("ascii"), dtype=np.uint8)
+    terminator = np.frombuffer(line_terminator.encode("ascii"), dtype=np.uint8)
+    n_rows = len(columns[0])
+    for start in range(0, n_rows, block_rows):
+        stop = min(start + block_rows, n_rows)
+        cells = [format_column(column[start:stop]) for column in columns]
+        width = sum(c.shape[0] for c in cells) + separator.size * (len(cells) - 1) + terminator.size
+
+        block = np.empty((width, stop - start), dtype=np.uint8)
+        row = 0
+        for i, c in enumerate(cells):
+            if i > 0:
+                block[row : row + separator.size] = separator[:, None]
+                row += separator.size
+            block[row : row + c.shape[0]] = c
+            row += c.shape[0]
+        block[row:] = terminator[:, None]
+
+        text = np.empty((stop - start, width), dtype=np.uint8)
+        for row in range(0, width, TRANSPOSE_ROWS):
+            text[:, row : row + TRANSPOSE_ROWS] = block[row : row + TRANSPOSE_ROWS].T
+        text = text.ravel()
+        csvfile.write(np.compress(text != _NUL, text).tobytes().decode("ascii"))
@@ -0,0 +1,275 @@
+import os
+import sqlite3
+import yaml
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Messages inserted per transaction.
+BATCH_MESSAGES = 1 << 14
+
+# rosbag2 sqlite3 storage layout, as written by ROS 2 Humble (and read by
+# every later release).
+_SCHEMA = (
+    "CREATE TABLE topics("
+    "id INTEGER PRIMARY KEY, name TEXT NOT NULL, type TEXT NOT NULL, "
+    "serialization_format TEXT NOT NULL, offered_qos_profiles TEXT NOT NULL)",
+    "CREATE TABLE messages("
+    "id INTEGER PRIMARY KEY, topic_id INTEGER NOT NULL, "
+    "timestamp INTEGER NOT NULL, data BLOB NOT NULL)",
+)
+METADATA_NAME = "metadata.yaml"
+METADATA_VERSION = 5
+# Index of the messages by topic, created on request for filtered reads.
+TOPIC_INDEX = "topic_id_idx"
+
+
+def _split_index(file: str) -> Tuple[int, str]:
+    """Sort key of the files of a split bag: "<bag>_<n>.db3" by n."""
+    stem = file[: -len(".db3")]
+    base, _, suffix = stem.rpartition("_")
+    return (int(suffix), file) if base and suffix.isdigit() else (-1, file)
+
+
+def bag_files(bag_dir: str) -> List[str]:
+    """
+    Returns the `.db3` files of a bag directory in recording order: as listed
+    in its `metadata.yaml`, or else by their split index ("<bag>_0.db3",
+    "<bag>_1.db3", ...).
+    """
+    files = [file for file in os.listdir(bag_dir) if file.endswith(".db3")]
+    try:
+        with open(os.path.join(bag_dir, METADATA_NAME)) as f:
+            metadata = yaml.safe_load(f)["rosbag2_bagfile_information"]
+        listed = [os.path.basename(path) for path in metadata["relative_file_paths"]]
+    except (OSError, KeyError, TypeError, yaml.YAMLError):
+        listed = []
+    if sorted(listed) == sorted(files):
+        return listed
+    return sorted(files, key=_split_index)
+
+
+def is_bag_dir(path: str) -> bool:
+    """Whether a directory holds the `.db3` files of a bag."""
+    return any(file.endswith(".db3") for file in os.listdir(path))
+
+
+class Db3Writer:
+    """
+    Writes a rosbag2 bag in the sqlite3 storage format, without ROS 2.
+
+    Messages are inserted in large transactions with journaling off, and the
+    timestamp index and `metadata.yaml` are written when the bag is closed.
+
+    Args:
+    - uri (str): Bag directory to create; it must not exist.
+    """
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        os.makedirs(uri)
+        self.file_name = f"{os.path.basename(os.path.normpath(uri))}_0.db3"
+        self._connection = sqlite3.connect(os.path.join(uri, self.file_name))
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self._topics: Dict[str, Tuple[int, str]] = {}
+        self._counts: Dict[str, int] = {}
+        self._start: int | None = None
+        self._end: int | None = None
+
+    def create_topic(self, name: str, msg_type: str, serialization_format: str = "cdr") -> None:
+        """
+        Adds a topic to the bag.
+
+        Args:
+        - name (str): Topic name.
+        - msg_type (str): Message type, e.g. "px4_msgs/msg/SensorCombined".
+        - serialization_format (str): Serialization format of the messages.
+        """
+        cursor = self._connection.execute(
+            "INSERT INTO topics (name, type, serialization_format, offered_qos_profiles) VALUES (?, ?, ?, ?)",
+            (name, msg_type, serialization_format, ""),
+        )
+        self._topics[name] = (cursor.lastrowid, msg_type)
+        self._counts[name] = 0
+
+    def write(self, topic: str, timestamps: Iterable[int], payloads: Iterable[bytes]) -> None:
+        """
+        Appends messages of a topic, a transaction of BATCH_MESSAGES at a time.
+
+        Args:
+        - topic (str): Topic name (created with `create_topic`).
+        - timestamps (Iterable[int]): Receive times of the messages, in nanoseconds.
+        - payloads (Iterable[bytes]): Serialized messages.
+        """
+        topic_id = self._topics[topic][0]
+        rows = []
+        for timestamp, payload in zip(timestamps, payloads):
+            rows.append((topic_id, int(timestamp), payload))
+            if len(rows) == BATCH_MESSAGES:
+                self._insert(topic, rows)
+                rows = []
+        if rows:
+            self._insert(topic, rows)
+
+    def _insert(self, topic: str, rows: List[Tuple[int, int, bytes]]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (topic_id, timestamp, data) VALUES (?, ?, ?)", rows
+            )
+        self._counts[topic] += len(rows)
+        start = min(row[1] for row in rows)
+        end = max(row[1] for row in rows)
+        self._start = start if self._start is None else min(self._start, start)
+        self._end = end if self._end is None else max(self._end, end)
+
+    def close(self) -> None:
+        """Indexes the messages and writes the bag metadata."""
+        with self._connection:
+            self._connection.execute("CREATE INDEX timestamp_idx ON messages (timestamp ASC)")
+        self._connection.close()
+        start = self._start or 0
+        duration = (self._end or 0) - start
+        count = sum(self._counts.values())
+        metadata = {
+            "version": METADATA_VERSION,
+            "storage_identifier": "sqlite3",
+            "duration": {"nanoseconds": duration},
+            "starting_time": {"nanoseconds_since_epoch": start},
+            "message_count": count,
+            "topics_with_message_count": [
+                {
+                    "topic_metadata": {
+                        "name": name,
+                        "type": msg_type,
+                        "serialization_format": "cdr",
+                        "offered_qos_profiles": "",
+                    },
+                    "message_count": self._counts[name],
+                }
+                for name, (_, msg_type) in self._topics.items()
+            ],
+            "compression_format": "",
+            "compression_mode": "",
+            "relative_file_paths": [self.file_name],
+            "files": [
+                {
+                    "path": self.file_name,
+                    "starting_time": {"nanoseconds_since_epoch": start},
+                    "duration": {"nanoseconds": duration},
+                    "message_count": count,
+                }
+            ],
+        }
+        with open(os.path.join(self.uri, METADATA_NAME), "w") as f:
+            yaml.dump({"rosbag2_bagfile_information": metadata}, f, sort_keys=False)
+
+
+class Db3Reader:
+    """
+    Reads the topics and messages of a rosbag2 sqlite3 file, without ROS 2.
+
+    Args:
+    - path (str): Path of the `.db3` file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+
+    def topics(self, names: List[str] | None = None, nested: bool = True) -> List[Tuple[int, str, str]]:
+        """
+        Returns the (id, name, type) of each topic, in id order.
+
+        Args:
+        - names (List[str], optional): Only the topics of these names. All topics if None.
+        - nested (bool): Also the topics nested under `names` (e.g. the
+          instance "/fmu/out/actuator_outputs/f_1" of "/fmu/out/actuator_outputs").
+        """
+        query = "SELECT id, name, type FROM topics"
+        parameters: List[str] = []
+        if names is not None:
+            if not names:
+                return []
+            predicates = []
+            for name in names:
+                predicates.append("name = ?")
+                parameters.append(name)
+                if nested:
+                    predicates.append("name LIKE ? ESCAPE '\\'")
+                    escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                    parameters.append(f"{escaped}/%")
+            query += " WHERE " + " OR ".join(predicates)
+        return self._connection.execute(f"{query} ORDER BY id", parameters).fetchall()
+
+    def has_topic_index(self) -> bool:
+        """Whether an index of the messages leads with their topic id."""
+        for index in self._connection.execute("PRAGMA index_list(messages)").fetchall():
+            columns = self._connection.execute(f"PRAGMA index_info('{index[1]}')").fetchall()
+            if columns and columns[0][2] == "topic_id":
+                return True
+        return False
+
+    def message_counts(self) -> Dict[int, int]:
+        """Returns the number of messages of each topic id (read from the topic index, if any)."""
+        return dict(self._connection.execute("SELECT topic_id, COUNT(*) FROM messages GROUP BY topic_id"))
+
+    def start_time(self) -> int | None:
+        """Returns the earliest receive time of the messages, in nanoseconds (None if there are none)."""
+        return self._connection.execute("SELECT MIN(timestamp) FROM messages").fetchone()[0]
+
+    def create_topic_index(self) -> None:
+        """Indexes the messages by topic id, unless they already are."""
+        if not self.has_topic_index():
+            with self._connection:
+                self._connection.execute(f"CREATE INDEX {TOPIC_INDEX} ON messages (topic_id)")
+
+    def messages(
+        self,
+        topic_ids: List[int] | None = None,
+        start: int | None = None,
+        end: int | None = None,
+    ) -> Iterator[Tuple[int, int, bytes]]:
+        """
+        Yields the (topic id, timestamp, data) of the messages, each topic in
+        insertion order. Rows are streamed from the database, not loaded at once.
+
+        The selection is left to SQLite: with a topic index only the rows of
+        the selected topics are read (one topic after the other), and the
+        rosbag2 timestamp index serves the time window.
+
+        Args:
+        - topic_ids (List[int], optional): Only the messages of these topics.
+        - start (int, optional): Only the messages received at or after this time, in nanoseconds.
+        - end (int, optional): Only the messages received before this time, in nanoseconds.
+        """
+        predicates: List[str] = []
+        parameters: List[int] = []
+        if topic_ids is not None:
+            if not topic_ids:
+                return
+            predicates.append(f"topic_id IN ({', '.join('?' * len(topic_ids))})")
+            parameters.extend(topic_ids)
+        if start is not None:
+            predicates.append("timestamp >= ?")
+            parameters.append(start)
+        if end is not None:
+            predicates.append("timestamp < ?")
+            parameters.append(end)
+        query = "SELECT topic_id, timestamp, data FROM messages"
+        if predicates:
+            query += " WHERE " + " AND ".join(predicates)
+        # without a topic index, ordering by topic would sort the whole table
+        if topic_ids is not None and self.has_topic_index():
+            query += " ORDER BY topic_id, id"
+        else:
+            query += " ORDER BY id"
+        cursor = self._connection.execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(BATCH_MESSAGES)
+            if not rows:
+                break
+            yield from rows
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,365 @@
+import struct
+import numpy as np
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+MAGIC = b"\x89MCAP0\r\n"
+
+OP_HEADER = 0x01
+OP_FOOTER = 0x02
+OP_SCHEMA = 0x03
+OP_CHANNEL = 0x04
+OP_MESSAGE = 0x05
+OP_CHUNK = 0x06
+OP_MESSAGE_INDEX = 0x07
+OP_CHUNK_INDEX = 0x08
+OP_DATA_END = 0x0F
+
+# Opcode and length that precede the content of every record.
+_RECORD_HEADER = struct.Struct("<BQ")
+# Footer record: header, summary start, summary offset start and summary CRC.
+_FOOTER = struct.Struct("<BQQQI")
+# Message record content up to the data: channel id, sequence, log and publish times.
+_MESSAGE = struct.Struct("<HIQQ")
+_MESSAGE_DATA = _RECORD_HEADER.size + _MESSAGE.size
+# Chunk record content up to the compression: start and end times, uncompressed size and CRC.
+_CHUNK = struct.Struct("<QQQI")
+# Chunk index record content up to its message index offsets: start and end
+# times, chunk offset and length.
+_CHUNK_INDEX = struct.Struct("<QQQQ")
+
+_u16 = struct.Struct("<H").unpack_from
+_u32 = struct.Struct("<I").unpack_from
+_u64 = struct.Struct("<Q").unpack_from
+
+
+class McapError(Exception):
+    """Raised for a file that is not a readable MCAP file."""
+
+
+class McapChannel:
+    """
+    A channel (topic) of an MCAP file, with the schema of its messages.
+
+    Args:
+    - id (int): Channel id.
+    - topic (str): Topic name.
+    - message_encoding (str): Encoding of the messages, "cdr" for ROS 2.
+    - schema_name (str): Message type, e.g. "px4_msgs/msg/SensorCombined".
+    - schema_encoding (str): Encoding of the schema, "ros2msg" for `.msg` definitions.
+    - schema_data (bytes): The schema.
+    """
+
+    def __init__(
+        self,
+        id: int,
+        topic: str,
+        message_encoding: str,
+        schema_name: str = "",
+        schema_encoding: str = "",
+        schema_data: bytes = b"",
+    ):
+        self.id = id
+        self.topic = topic
+        self.message_encoding = message_encoding
+        self.schema_name = schema_name
+        self.schema_encoding = schema_encoding
+        self.schema_data = schema_data
+
+
+class McapChunk:
+    """
+    A run of records in the data section of an MCAP file that is read as a
+    whole: the records of a chunk, or of consecutive messages outside chunks.
+
+    Args:
+    - offset (int): File offset of the (compressed) records.
+    - length (int): Length of the (compressed) records.
+    - compression (str): "", "zstd" or "lz4".
+    - uncompressed_size (int): Length of the records once decompressed.
+    - start_time (int): Earliest log time of the messages, in nanoseconds.
+    - end_time (int): Latest log time of the messages, in nanoseconds.
+    - message_indexes (Dict[int, int]): Channel id -> file offset of the
+      message index of the channel in the chunk. Empty if not indexed.
+    """
+
+    def __init__(
+        self,
+        offset: int,
+        length: int,
+        compression: str = "",
+        uncompressed_size: int | None = None,
+        start_time: int = 0,
+        end_time: int = (1 << 64) - 1,
+        message_indexes: Dict[int, int] | None = None,
+    ):
+        self.offset = offset
+        self.length = length
+        self.compression = compression
+        self.uncompressed_size = length if uncompressed_size is None else uncompressed_size
+        self.start_time = start_time
+        self.end_time = end_time
+        self.message_indexes = message_indexes or {}
+
+
+def _string(data, position: int) -> Tuple[str, int]:
+    (length,) = _u32(data, position)
+    position += 4
+    return bytes(data[position : position + length]).decode("utf-8"), position + length
+
+
+def _bytes(data, position: int) -> Tuple[bytes, int]:
+    (length,) = _u32(data, position)
+    position += 4
+    return bytes(data[position : position + length]), position + length
+
+
+def _records(data) -> Iterator[Tuple[int, int, int]]:
+    """Yields the (opcode, content offset, content length) of the records in `data`."""
+    position = 0
+    end = len(data)
+    while position + _RECORD_HEADER.size <= end:
+        opcode, length = _RECORD_HEADER.unpack_from(data, position)
+        position += _RECORD_HEADER.size
+        if position + length > end:
+            raise McapError("Truncated record")
+        yield opcode, position, length
+        position += length
+
+
+def decompress(data: bytes, compression: str, uncompressed_size: int) -> bytes:
+    """
+    Decompresses the records of a chunk.
+
+    Raises:
+    - McapError: If the compression is not supported, its library is not
+      installed, or the chunk is corrupt.
+    """
+    if compression == "":
+        return data
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise McapError("zstd compressed chunks need the zstandard package")
+        try:
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=uncompressed_size)
+        except zstandard.ZstdError as e:
+            raise McapError(f"Corrupt zstd chunk: {e}") from e
+    if compression == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            raise McapError("lz4 compressed chunks need the lz4 package")
+        try:
+            return lz4.frame.decompress(data)
+        except RuntimeError as e:
+            raise McapError(f"Corrupt lz4 chunk: {e}") from e
+    raise McapError(f"Unsupported chunk compression '{compression}'")
+
+
+class McapReader:
+    """
+    Reads the channels and chunks of an MCAP file, without reading its messages.
+
+    The channels and chunks are taken from the summary section at the end of
+    the file, whose chunk indexes locate every chunk and, through its message
+    indexes, the messages of each channel in it. Files without chunk indexes
+    (e.g. of an interrupted recording, or written without chunks) are scanned
+    once instead; their messages are then found by reading the records.
+
+    Args:
+    - path (str): Path of the MCAP file.
+
+    Raises:
+    - McapError: If the file is not an MCAP file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._schemas: Dict[int, Tuple[str, str, bytes]] = {}
+        self.channels: Dict[int, McapChannel] = {}
+        self.chunks: List[McapChunk] = []
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise McapError(f"{path} is not an MCAP file")
+            if not self._read_summary(f):
+                self._schemas.clear()
+                self.channels.clear()
+                self.chunks.clear()
+                self._scan(f)
+
+    def _read_summary(self, f: BinaryIO) -> bool:
+        """Reads the summary section; returns False if it has no chunk indexes."""
+        f.seek(0, 2)
+        size = f.tell()
+        if size < 2 * len(MAGIC) + _FOOTER.size:
+            return False
+        f.seek(size - len(MAGIC) - _FOOTER.size)
+        footer = f.read(_FOOTER.size + len(MAGIC))
+        if footer[_FOOTER.size :] != MAGIC:
+            return False
+        opcode, _, summary_start, summary_offset_start, _ = _FOOTER.unpack_from(footer)
+        if opcode != OP_FOOTER or summary_start == 0:
+            return False
+        summary_end = summary_offset_start or size - len(MAGIC) - _FOOTER.size
+        f.seek(summary_start)
+        summary = f.read(summary_end - summary_start)
+        for opcode, position, length in _records(summary):
+            self._read_record(opcode, summary, position)
+        if not self.chunks:
+            return False
+        self.chunks.sort(key=lambda chunk: chunk.offset)
+        return True
+
+    def _read_record(self, opcode: int, data, position: int) -> None:
+        """Reads a schema, channel or chunk index record."""
+        if opcode == OP_SCHEMA:
+            (id,) = _u16(data, position)
+            name, position = _string(data, position + 2)
+            encoding, position = _string(data, position)
+            schema, _ = _bytes(data, position)
+            self._schemas[id] = (name, encoding, schema)
+        elif opcode == OP_CHANNEL:
+            id, schema_id = struct.unpack_from("<HH", data, position)
+            topic, position = _string(data, position + 4)
+            message_encoding, _ = _string(data, position)
+            self.channels[id] = McapChannel(id, topic, message_encoding, *self._schemas.get(schema_id, ()))
+        elif opcode == OP_CHUNK_INDEX:
+            start_time, end_time, chunk_offset, chunk_length = _CHUNK_INDEX.unpack_from(data, position)
+            position += _CHUNK_INDEX.size
+            (map_length,) = _u32(data, position)
+            position += 4
+            indexes = np.frombuffer(
+                bytes(data[position : position + map_length]), dtype=[("channel", "<u2"), ("offset", "<u8")]
+            )
+            position += map_length + 8  # message index length
+            compression, position = _string(data, position)
+            compressed_size, uncompressed_size = struct.unpack_from("<QQ", data, position)
+            # the records follow the chunk header, whose size is known from its compression
+            records = chunk_offset + _RECORD_HEADER.size + _CHUNK.size + 4 + len(compression.encode()) + 8
+            self.chunks.append(
+                McapChunk(
+                    records,
+                    compressed_size,
+                    compression,
+                    uncompressed_size,
+                    start_time,
+                    end_time,
+                    dict(zip(indexes["channel"].tolist(), indexes["offset"].tolist())),
+                )
+            )
+
+    def _scan(self, f: BinaryIO) -> None:
+        """Reads the channels and chunks from the records of the data section."""
+        f.seek(len(MAGIC))
+        run: McapChunk | None = None
+        while True:
+            position = f.tell()
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                break
+            opcode, length = _RECORD_HEADER.unpack(header)
+            if opcode in (OP_DATA_END, OP_FOOTER):
+                break
+            if opcode == OP_MESSAGE:
+                message = f.read(_MESSAGE.size)
+                if len(message) < _MESSAGE.size or length < _MESSAGE.size:
+                    break
+                _, _, log_time, _ = _MESSAGE.unpack(message)
+                # consecutive messages outside chunks are read as one run
+                if run is None:
+                    run = McapChunk(position, 0, start_time=log_time, end_time=log_time)
+                    self.chunks.append(run)
+                run.length = run.uncompressed_size = position + _RECORD_HEADER.size + length - run.offset
+                run.start_time = min(run.start_time, log_time)
+                run.end_time = max(run.end_time, log_time)
+                f.seek(length - _MESSAGE.size, 1)
+                continue
+            run = None
+            content = f.read(length)
+            if len(content) < length:
+                break
+            if opcode in (OP_SCHEMA, OP_CHANNEL):
+                self._read_record(opcode, content, 0)
+            elif opcode == OP_CHUNK:
+                start_time, end_time, uncompressed_size, _ = _CHUNK.unpack_from(content)
+                compression, offset = _string(content, _CHUNK.size)
+                (records_length,) = _u64(content, offset)
+                offset += 8
+                chunk = McapChunk(
+                    position + _RECORD_HEADER.size + offset,
+                    records_length,
+                    compression,
+                    uncompressed_size,
+                    start_time,
+                    end_time,
+                )
+                # schemas and channels are usually written into the chunks
+                records = decompress(content[offset : offset + records_length], compression, uncompressed_size)
+                for opcode, record, _ in _records(records):
+                    if opcode in (OP_SCHEMA, OP_CHANNEL):
+                        self._read_record(opcode, records, record)
+                self.chunks.append(chunk)
+
+
+def chunk_messages(
+    path: str, chunk: McapChunk, channel_ids: List[int]
+) -> Dict[int, Tuple[np.ndarray, List[bytes]]]:
+    """
+    Reads the messages of some channels from a chunk of an MCAP file, using
+    the message indexes of the chunk where it has them.
+
+    Args:
+    - path (str): Path of the MCAP file.
+    - chunk (McapChunk): Chunk of the file (see `McapReader.chunks`).
+    - channel_ids (List[int]): Channels to read.
+
+    Returns:
+    - Dict[int, Tuple[np.ndarray, List[bytes]]]: Channel id -> log times
+      (nanoseconds) and data of its messages, in file order. Channels
+      without messages in the chunk are left out.
+    """
+    with open(path, "rb") as f:
+        f.seek(chunk.offset)
+        data = f.read(chunk.length)
+        if len(data) < chunk.length:
+            raise McapError("Truncated chunk")
+        records = decompress(data, chunk.compression, chunk.uncompressed_size)
+        offsets: Dict[int, List[int]] = {}
+        if chunk.message_indexes:
+            for channel_id in channel_ids:
+                if channel_id in chunk.message_indexes:
+                    offsets[channel_id] = _message_offsets(f, chunk.message_indexes[channel_id])
+        else:
+            wanted = set(channel_ids)
+            for opcode, position, _ in _records(records):
+                if opcode == OP_MESSAGE:
+                    (channel_id,) = _u16(records, position)
+                    if channel_id in wanted:
+                        offsets.setdefault(channel_id, []).append(position - _RECORD_HEADER.size)
+    messages = {}
+    for channel_id, channel_offsets in offsets.items():
+        if not channel_offsets:
+            continue
+        log_times, payloads = [], []
+        for offset in channel_offsets:
+            _, length = _RECORD_HEADER.unpack_from(records, offset)
+            log_times.append(_u64(records, offset + _RECORD_HEADER.size + 6)[0])
+            payloads.append(records[offset + _MESSAGE_DATA : offset + _RECORD_HEADER.size + length])
+        messages[channel_id] = (np.array(log_times, dtype=np.uint64), payloads)
+    return messages
+
+
+def _message_offsets(f: BinaryIO, index_offset: int) -> List[int]:
+    """Returns the offsets of the messages of a message index record, in file order."""
+    f.seek(index_offset)
+    opcode, length = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+    if opcode != OP_MESSAGE_INDEX:
+        raise McapError("Invalid message index offset")
+    content = f.read(length)
+    (entries_length,) = _u32(content, 2)
+    entries = np.frombuffer(
+        content, dtype=[("log_time", "<u8"), ("offset", "<u8")], count=entries_length // 16, offset=6
+    )
+    # the index is ordered by log time; the output keeps the order of the file
+    return np.sort(entries["offset"]).tolist()
@@ -1,61 +1,337 @@
+import numpy as np
 import pandas as pd
 import os
-from typing import List
+from typing import Dict, List, Tuple
+from px4_log_tool.util.logger import log
+from px4_log_tool.processing_modules.tables import (
+    TableWriter,
+    read_columns,
+    read_table,
+    table_format,
+    table_name,
+    table_schema,
+    table_stem,
+    write_frame,
+)
+
+
+# Tables derived from the topic tables of a mission, which are not topics themselves.
+DERIVED_TABLES = ("merged", "resampled")
+
+
+def column_prefix(stem: str) -> str:
+    """Prefix of the merged columns of a topic: "vehicle_local_position" -> "VehicleLocalPosition"."""
+    return "".join(part.capitalize() for part in stem.split("_"))
+
+
+def _sorted_timestamps(stamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the timestamps of a table in ascending order, and the table row of each."""
+    stamps = np.asarray(stamps)
+    if len(stamps) > 1 and np.any(stamps[1:] < stamps[:-1]):
+        order = np.argsort(stamps, kind="stable")
+        return stamps[order], order
+    return stamps, np.arange(len(stamps))
+
+
+def merge_timeline(timestamps: List[np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Builds the union timeline of several topics and the row of each message on it.
+
+    The sorted timestamps of all topics are merged at once; a timestamp that a
+    topic repeats takes as many rows as its largest repeat count, and the n-th
+    occurrence of it in each topic lands on the n-th of these rows.
+
+    Args:
+    - timestamps (List[np.ndarray]): Timestamps of each topic, in table order.
+
+    Returns:
+    - Tuple[np.ndarray, List[np.ndarray]]: The timeline, and for each topic an
+      indexer of the timeline's length holding the table row of each timeline
+      row (-1 where the topic has no message).
+    """
+    orders = []
+    sorted_timestamps = []
+    for stamps in timestamps:
+        stamps, order = _sorted_timestamps(stamps)
+        orders.append(order)
+        sorted_timestamps.append(stamps)
+
+    # a stable sort of the concatenated sorted runs is a k-way merge of them
+    merged = np.sort(np.concatenate(sorted_timestamps), kind="stable")
+    distinct = np.ones(len(merged), dtype=bool)
+    distinct[1:] = merged[1:] != merged[:-1]
+    values = merged[distinct]
+
+    repeats = np.zeros(len(values), dtype=np.intp)
+    slots = []
+    for stamps in sorted_timestamps:
+        slot = np.searchsorted(values, stamps)
+        occurrence = np.arange(len(stamps)) - np.searchsorted(stamps, stamps)
+        np.maximum.at(repeats, slot, occurrence + 1)
+        slots.append((slot, occurrence))
+    starts = np.cumsum(repeats) - repeats
+    timeline = np.repeat(values, repeats)
+
+    indexers = []
+    for order, (slot, occurrence) in zip(orders, slots):
+        indexer = np.full(len(timeline), -1, dtype=np.intp)
+        indexer[starts[slot] + occurrence] = order
+        indexers.append(indexer)
+    return timeline, indexers
+
+
+def asof_indexer(
+    timeline: np.ndarray,
+    stamps: np.ndarray,
+    direction: str = "backward",
+    tolerance: int | None = None,
+) -> np.ndarray:
+    """
+    Matches each timeline row to a sample of a topic, as of its timestamp.
+
+    Args:
+    - timeline (np.ndarray): Sorted timestamps of the merged rows.
+    - stamps (np.ndarray): Timestamps of the topic, in table order.
+    - direction (str): "backward" takes the last sample at or before the row,
+      "nearest" the closest sample either side (the earlier one on a tie).
+    - tolerance (int, optional): Largest distance between a row and its sample,
+      in timestamp units. Unlimited if None.
+
+    Returns:
+    - np.ndarray: The table row matched to each timeline row, -1 where there is none.
+    """
+    stamps, order = _sorted_timestamps(stamps)
+    stamps = stamps.astype(np.int64, copy=False)
+    timeline = timeline.astype(np.int64, copy=False)
+    if len(stamps) == 0:
+        return np.full(len(timeline), -1, dtype=np.intp)
+    before = np.searchsorted(stamps, timeline, side="right") - 1
+    match = before
+    if direction == "nearest":
+        after = before + 1
+        has_after = after < len(stamps)
+        distance_before = timeline - stamps[np.maximum(before, 0)]
+        distance_after = stamps[np.minimum(after, len(stamps) - 1)] - timeline
+        match = np.where(has_after & ((before < 0) | (distance_after < distance_before)), after, before)
+    valid = match >= 0
+    if tolerance is not None:
+        valid &= np.abs(timeline - stamps[np.maximum(match, 0)]) <= tolerance
+    return np.where(valid, order[np.maximum(match, 0)], -1)
+
+
+def asof_timeline(
+    timestamps: List[np.ndarray],
+    reference: int | None,
+    frequency_hz: float,
+    direction: str = "backward",
+    tolerance: int | None = None,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Builds the timeline of an as-of merge and the sample of each topic on it.
+
+    Args:
+    - timestamps (List[np.ndarray]): Timestamps of each topic (in microseconds), in table order.
+    - reference (int, optional): Index of the topic whose samples make the timeline. If None,
+      the timeline is a clock at `frequency_hz` spanning all topics.
+    - frequency_hz (float): Rate of the clock.
+    - direction (str): See `asof_indexer`.
+    - tolerance (int, optional): See `asof_indexer`.
+
+    Returns:
+    - Tuple[np.ndarray, List[np.ndarray]]: The timeline, and for each topic the table row
+      of each timeline row (-1 where the topic has no sample within the tolerance).
+    """
+    if reference is not None:
+        timeline, order = _sorted_timestamps(timestamps[reference])
+    else:
+        present = [np.asarray(stamps) for stamps in timestamps if len(stamps) > 0]
+        if present:
+            start = min(int(stamps.min()) for stamps in present)
+            end = max(int(stamps.max()) for stamps in present)
+            step = max(int(round(1e6 / frequency_hz)), 1)
+            timeline = np.arange(start, end + 1, step, dtype=np.int64)
+        else:
+            timeline = np.array([], dtype=np.int64)
+    indexers = []
+    for index, stamps in enumerate(timestamps):
+        if index == reference:
+            indexers.append(order)
+        else:
+            indexers.append(asof_indexer(timeline, stamps, direction, tolerance))
+    return timeline, indexers
+
 
 def merge_csv(
         root: str,
         files: List[str],
+        format: str = "csv",
+        merge_params: dict | None = None,
+        verbose: bool = False,
 ) -> None:
     """
-    Merges multiple CSV files in a directory, handling column renaming and resampling.
+    Merges multiple CSV files in a directory, handling column renaming.
+
+    This function merges the topic tables found in the specified directory into a single 'merged'
+    table, leaving out the tables derived from them (see `DERIVED_TABLES`). Column names are
+    intelligently renamed to avoid conflicts, and a 'mission_name' column is added to identify
+    the source directory. The merged table is resampled separately (see
+    `resample_merged_csvs` of `util.components`).
 
-    This function merges CSV files found in the specified directory into a single 'merged.csv' file.
-    Column names are intelligently renamed to avoid conflicts, and a 'mission_name' column is added
-    to identify the source directory. Optionally, the merged data can be resampled based on
-    parameters provided in `sampling_params`.
+    Each table is read once. The union of their timestamps is built in a single merge (see
+    `merge_timeline`) and every column is gathered onto it in one pass, missing rows as NaN,
+    so the cost grows with the size of the tables rather than with the number of topics.
+
+    With `merge_params["mode"]` set to "asof", the rows are instead the samples of the
+    `reference` topic (or a clock at `frequency_hz` if it is None), and every other topic
+    contributes its sample matched in `direction` within `tolerance_s` (see `asof_timeline`).
 
     Args:
         root: The directory path containing the CSV files to merge.
-        files: A list of filenames within the 'root' directory.
+        files: A list of filenames within the 'root' directory. Tables of any format
+            (see `tables.TABLE_FORMATS`) are read natively.
+        format: Format of the merged table ('csv', 'npy' or 'arrow'). Defaults to 'csv'.
+        merge_params: The `merge_params` of the filter. Defaults to the exact timestamp merge.
+        verbose: Whether to print verbose output. Defaults to False.
 
     Returns:
-        None. The merged and potentially resampled DataFrame is saved as 'merged.csv' in the 'root' directory.
+        None. The merged DataFrame is saved as the 'merged' table of the given format (e.g.
+        'merged.csv') in the 'root' directory.
     """
 
-    merged_df = pd.DataFrame(data={"timestamp": []})
+    topics: List[Tuple[str, Dict[str, np.ndarray]]] = []
     for file in files:
-        if file == "merged.csv":
+        if table_stem(file) in DERIVED_TABLES:
             continue
+        topics.append((column_prefix(table_stem(file)), read_columns(os.path.join(root, file))))
 
-        data_frame: pd.DataFrame = pd.read_csv(os.path.join(root, file))
+    timestamps = [columns["timestamp"] for _, columns in topics]
+    if merge_params is not None and merge_params["mode"] == "asof":
+        stems = [table_stem(file) for file in files if table_stem(file) not in DERIVED_TABLES]
+        reference = merge_params["reference"]
+        if reference is not None and reference not in stems:
+            log(f"Reference topic '{reference}' not found in {root}, merging onto a {merge_params['frequency_hz']} Hz clock.", verbosity=verbose, log_level=1)
+        tolerance_s = merge_params["tolerance_s"]
+        timeline, indexers = asof_timeline(
+            timestamps,
+            reference=stems.index(reference) if reference in stems else None,
+            frequency_hz=merge_params["frequency_hz"],
+            direction=merge_params["direction"],
+            tolerance=None if tolerance_s is None else int(round(tolerance_s * 1e6)),
+        )
+    elif topics:
+        timeline, indexers = merge_timeline(timestamps)
+    else:
+        timeline, indexers = np.array([], dtype=np.float64), []
 
-        prefix_parts = file.split("_")
-        capitalised_prefix_parts = [prefix_parts[0].capitalize()] + [
-            part.capitalize() for part in prefix_parts[1:]
-        ]
-        joined_prefix = "".join(capitalised_prefix_parts)
-        joined_prefix = joined_prefix.split(".")[0]
+    merged: Dict[str, np.ndarray] = {}
+    for (prefix, columns), indexer in zip(topics, indexers):
+        for name, column in columns.items():
+            if name != "timestamp":
+                merged[f"{prefix}_{name}"] = pd.api.extensions.take(
+                    np.asarray(column), indexer, allow_fill=True
+                )
 
-        column_names = data_frame.columns
-        column_names = ["timestamp"] + [
-            f"{joined_prefix}_{name}"
-            for name in column_names[column_names != "timestamp"]
-        ]
+    mission_name_list = os.path.normpath(root).split(os.sep)
+    mission_name = "/".join(mission_name_list)
 
-        data_frame.rename(
-            columns=dict(zip(data_frame.columns, column_names)), inplace=True
-        )
+    merged_df = pd.DataFrame(
+        {
+            "mission_name": np.full(len(timeline), mission_name, dtype=object),
+            "timestamp": timeline,
+            **{key: merged[key] for key in sorted(merged)},
+        }
+    )
 
-        merged_df = pd.merge(merged_df, data_frame, on="timestamp", how="outer")
+    write_frame(merged_df, os.path.join(root, table_name("merged", format)))
 
-    merged_df.sort_values(by="timestamp", inplace=True)
 
-    mission_name_list = os.path.normpath(root).split(os.sep)
-    mission_name = "/".join(mission_name_list)
-    merged_df["mission_name"] = mission_name
+def _unified_dtype(dtypes: List[np.dtype | None], missing: bool) -> np.dtype | None:
+    """
+    Type of a unified column, as concatenating its tables would make it:
+    integers and booleans become floats where some table lacks the column (or
+    has it as floats), and other mixes become strings. The width of strings
+    is left to the caller (`<U0`), as that of Arrow tables is not in their schema.
+    """
+    known = [dtype for dtype in dtypes if dtype is not None]
+    if not known:
+        return None
+    if any(dtype.kind in "OUS" for dtype in known):
+        return np.dtype(str)
+    try:
+        dtype = np.result_type(*known)
+    except TypeError:
+        return np.dtype(str)
+    if missing and dtype.kind in "iub":
+        return np.dtype(np.float64)
+    return dtype
+
+
+def _string_width(paths: List[str], key: str) -> int:
+    """Returns the length of the longest value of a column over the tables that have it."""
+    width = 0
+    for table in paths:
+        if key in table_schema(table):
+            values = read_table(table, columns=[key])[key].to_numpy().astype(str)
+            if len(values):
+                width = max(width, int(np.char.str_len(values).max()))
+    return width
+
+
+def unify_tables(paths: List[str], path: str) -> None:
+    """
+    Concatenates tables into one, a table at a time, so that only the largest
+    of them is ever held in memory. The columns are the union of theirs, in
+    order of appearance, read from their headers up front; a table lacking a
+    column leaves it empty (NaN, or "" for strings).
+
+    Args:
+    - paths (List[str]): Tables to concatenate, e.g. the `merged` table of each mission.
+    - path (str): Path of the unified table; its extension selects the format.
+    """
+    schemas = [table_schema(table) for table in paths]
+    header_keys: List[str] = list(dict.fromkeys(key for schema in schemas for key in schema))
+    dtypes = {
+        key: _unified_dtype(
+            [schema[key] for schema in schemas if key in schema],
+            missing=any(key not in schema for schema in schemas),
+        )
+        for key in header_keys
+    }
+    # integer and boolean columns of CSV tables, whose types are not in their
+    # headers, are only known to become floats where another table lacks them
+    floats = {key for key in header_keys if any(key not in schema for schema in schemas)}
 
-    preamble = ["mission_name", "timestamp"]
-    body = sorted([col for col in merged_df.columns if col not in preamble])
-    merged_df = merged_df[preamble + body]
+    if table_format(path) == "csv":
+        with open(path, "w", encoding="utf-8") as f:
+            for index, table in enumerate(paths):
+                frame = read_table(table)
+                columns = {}
+                for key in header_keys:
+                    if key not in frame:
+                        columns[key] = np.full(len(frame), np.nan)
+                    elif key in floats and frame[key].dtype.kind in "iub":
+                        columns[key] = frame[key].to_numpy(dtype=np.float64)
+                    else:
+                        columns[key] = frame[key]
+                pd.DataFrame(columns).to_csv(f, header=index == 0, index=False)
+        return
 
-    merged_df.to_csv(os.path.join(root, "merged.csv"), index=False)
+    for key, dtype in dtypes.items():
+        if dtype is not None and dtype.kind == "U":
+            dtypes[key] = np.dtype(f"<U{max(_string_width(paths, key), 1)}")
+    writer = TableWriter(path, header_keys, [dtypes[key] for key in header_keys])
+    for table in paths:
+        frame = read_table(table)
+        columns = []
+        for key in header_keys:
+            dtype = dtypes[key]
+            if key not in frame:
+                # as the empty cells of the CSV path
+                column = np.full(len(frame), "" if dtype.kind == "U" else np.nan, dtype=dtype)
+            elif dtype.kind == "U":
+                column = frame[key].to_numpy().astype(str).astype(dtype)
+            else:
+                column = frame[key].to_numpy().astype(dtype, copy=False)
+            columns.append(column)
+        writer.write(columns)
+    writer.close()
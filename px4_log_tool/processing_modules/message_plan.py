@@ -0,0 +1,113 @@
+import numpy as np
+from typing import Any, Iterator, List, Tuple
+from px4_log_tool.processing_modules.csv_writer import BLOCK_ROWS
+
+
+def split_column(column: str) -> Tuple[str, int | None]:
+    """
+    Splits a table column name into its message field and array index.
+
+    Args:
+    - column (str): Column name, e.g. "timestamp" or "q_2".
+
+    Returns:
+    - Tuple[str, int | None]: Field name and array index (None for scalars).
+    """
+    base, separator, suffix = column.rpartition("_")
+    if separator and suffix.isdigit():
+        return base, int(suffix)
+    return column, None
+
+
+def _cast(column: np.ndarray, kind: type) -> List[Any]:
+    """Converts a column to a list of Python values of type `kind`."""
+    if kind is bool:
+        return column.astype(bool).tolist()
+    if kind is int:
+        if column.dtype.kind in "iu":
+            return column.tolist()
+        return column.astype(np.int64).tolist()
+    if kind is float:
+        return column.astype(np.float64).tolist()
+    return [kind(value) for value in column.tolist()]
+
+
+class MessagePlan:
+    """
+    Conversion plan from the columns of a topic table to messages of one type.
+
+    The plan is built once from the table header and a message class: every
+    column is resolved to a field, or to an element of an array field, and
+    to the Python type the field holds. Messages are then filled from whole
+    column arrays, converting each column in bulk, so that no field lookup
+    or type check is repeated per cell.
+
+    Args:
+    - msg_class (type): Message class (e.g. from `px4_msgs.msg`).
+    - columns (List[str]): Column names of the table, in table order.
+
+    Raises:
+    - ValueError: If a column names a field the message does not have.
+    """
+
+    def __init__(self, msg_class: type, columns: List[str]):
+        self.msg_class = msg_class
+        template = msg_class()
+        # (field, column position, Python type) of scalar fields
+        self._scalars = []
+        # field -> (default value, [(array index, column position)])
+        self._arrays = {}
+        for position, column in enumerate(columns):
+            field, index = split_column(column)
+            if index is None:
+                if not hasattr(template, field):
+                    raise ValueError(f"Message type {msg_class.__name__} has no field {field}")
+                self._scalars.append((field, position, type(getattr(template, field))))
+                continue
+            # array columns of unknown fields are not part of the message
+            if not hasattr(template, field):
+                continue
+            default = getattr(template, field)
+            if not isinstance(default, (list, np.ndarray)):
+                raise ValueError(f"Field {field} is not an array in message type {msg_class.__name__}")
+            if index >= len(default):
+                raise ValueError(f"Field {field} of message type {msg_class.__name__} has no element {index}")
+            self._arrays.setdefault(field, (default, []))[1].append((index, position))
+
+    def _values(self, columns: List[np.ndarray]) -> Tuple[List[str], List[Any]]:
+        """Returns the fields and their per-row values for a block of columns."""
+        fields, values = [], []
+        for field, position, kind in self._scalars:
+            fields.append(field)
+            values.append(_cast(np.asarray(columns[position]), kind))
+        n = len(columns[0])
+        for field, (default, elements) in self._arrays.items():
+            block = np.tile(np.asarray(default), (n, 1))
+            for index, position in elements:
+                block[:, index] = columns[position]
+            fields.append(field)
+            # numeric arrays are held as numpy arrays, others as lists
+            values.append(block if isinstance(default, np.ndarray) else block.tolist())
+        return fields, values
+
+    def messages(self, columns: List[np.ndarray]) -> Iterator[Any]:
+        """
+        Yields one message per table row.
+
+        Args:
+        - columns (List[np.ndarray]): Equally long columns, in the order of
+          the columns the plan was built for.
+
+        Yields:
+        - Message of the plan's type.
+        """
+        if len(columns) == 0:
+            return
+        msg_class = self.msg_class
+        for start in range(0, len(columns[0]), BLOCK_ROWS):
+            fields, values = self._values([column[start : start + BLOCK_ROWS] for column in columns])
+            for row in zip(*values):
+                msg = msg_class()
+                for field, value in zip(fields, row):
+                    setattr(msg, field, value)
+                yield msg
@@ -69,12 +69,14 @@ eval_metadata = {
 }
 
 
-def get_file_metadata(metadata_fields: list, directory_address: str, ulog_file_name: str):
+def get_file_metadata(metadata_fields: list, directory_address: str, ulog_file_name: str, format: str = "csv"):
     data_frame_dict = convert_ulog2csv(
         directory_address,
         ulog_file_name,
         messages=["vehicle_local_position"],
         output=f"./.cache/{ulog_file_name}",
+        return_frames=True,
+        format=format,
     )
     metadata = {}
     for field in metadata_fields:
@@ -1,8 +1,117 @@
+import json
 import os
 import numpy as np
 import pandas as pd
-import warnings
+from typing import Any, Dict, List, Tuple
 from px4_log_tool.util.logger import log
+from px4_log_tool.processing_modules.merger import DERIVED_TABLES, column_prefix
+from px4_log_tool.processing_modules.tables import read_table, table_name, table_stem, write_columns, write_frame
+
+# Interpolation methods that are linear in time on the resampling grid.
+_LINEAR_METHODS = ("linear", "time", "index", "values")
+# Directory of the decimated levels of a mission, and their index.
+PYRAMID_DIR = "pyramid"
+PYRAMID_INDEX = "index.json"
+
+
+def resample_edges(start: int, end: int, target_frequency_hz: float) -> np.ndarray:
+    """
+    Returns the left edges of the resampling bins covering [start, end].
+
+    Edge k lies at round(k * 1e6 / target_frequency_hz) microseconds, so the
+    bins are aligned to multiples of the period and do not drift when the
+    period is not a whole number of microseconds (e.g. 3 Hz).
+
+    Args:
+    - start (int): First timestamp, in microseconds.
+    - end (int): Last timestamp, in microseconds.
+    - target_frequency_hz (float): Rate of the grid, in Hz.
+
+    Returns:
+    - np.ndarray: The bin edges (int64, microseconds).
+    """
+    period = 1e6 / target_frequency_hz
+    k = np.arange(int(np.floor(start / period)) - 1, int(np.floor(end / period)) + 2)
+    edges = np.round(k * period).astype(np.int64)
+    first = np.searchsorted(edges, start, side="right") - 1
+    last = np.searchsorted(edges, end, side="right") - 1
+    return edges[first : last + 1]
+
+
+def _fill(values: np.ndarray, missing: np.ndarray, backward: bool = False) -> np.ndarray:
+    """Propagates the last (or, backward, the next) present value into the missing ones."""
+    if backward:
+        return _fill(values[::-1], missing[::-1])[::-1]
+    source = np.where(missing, 0, np.arange(len(values)))
+    np.maximum.accumulate(source, out=source)
+    filled = values[source]
+    # missing values before the first present one stay missing
+    before = np.cumsum(~missing) == 0
+    filled[before] = values[before]
+    return filled
+
+
+def _bin_last(bins: np.ndarray, values: np.ndarray, length: int) -> np.ndarray:
+    """Last present value of each bin (NaN for empty bins), for timestamp-sorted values."""
+    # NaN is the only float that differs from itself
+    present = np.flatnonzero(values == values if values.dtype.kind == "f" else ~pd.isna(values))
+    binned = np.full(length, np.nan, dtype=values.dtype)
+    if len(present):
+        present_bins = bins[present]
+        last = np.ones(len(present), dtype=bool)
+        last[:-1] = present_bins[1:] != present_bins[:-1]
+        binned[present_bins[last]] = values[present[last]]
+    return binned
+
+
+def dataclass_lookup(msg_reference: pd.DataFrame) -> Dict[str, str]:
+    """
+    Maps each alias of the message reference (e.g. "SensorCombined_gyro_rad")
+    to its dataclass ("Numerical" or "Categorical"), the first listing winning.
+
+    Args:
+    - msg_reference (pd.DataFrame): A dataframe containing message references (Alias, Dataclass).
+
+    Returns:
+    - Dict[str, str]: Alias -> Dataclass.
+    """
+    lookup: Dict[str, str] = {}
+    for alias, dataclass in zip(msg_reference["Alias"], msg_reference["Dataclass"]):
+        if isinstance(alias, str):
+            lookup.setdefault(alias, dataclass)
+    return lookup
+
+
+def classify_labels(labels: List[str], dataclasses: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """
+    Splits merged column labels (e.g. "ActuatorOutputs0_output_1") into
+    numerical and categorical ones by the dataclass of their alias. Labels
+    missing from the reference, the timestamp and the mission name are left out.
+
+    Args:
+    - labels (List[str]): Column labels of a merged table.
+    - dataclasses (Dict[str, str]): Alias -> Dataclass (see `dataclass_lookup`).
+
+    Returns:
+    - Tuple[List[str], List[str]]: The numerical and the categorical labels.
+    """
+    num_labels = []
+    cat_labels = []
+    for label in labels:
+        if label == "timestamp" or label == "mission_name":
+            continue
+        msg, param = label.split("_", maxsplit=1)
+        if msg[-1].isdigit():
+            msg = msg[:-1]
+        alias = f"{msg}_{param}"
+        if alias not in dataclasses:
+            continue
+        if dataclasses[alias] == "Numerical":
+            num_labels.append(label)
+        else:
+            cat_labels.append(label)
+    return num_labels, cat_labels
+
 
 def resample_data(
         df: pd.DataFrame,
@@ -22,15 +131,19 @@ def resample_data(
     different aggregation methods for numerical and categorical columns and provides an option
     for interpolating numerical data after resampling.
 
+    The timestamps stay integer microseconds throughout: the bins of the grid (see
+    `resample_edges`) are assigned with a single `searchsorted`, and each column takes the
+    last value of each bin, then has its empty bins filled, in one vectorized pass.
+
     Args:
         df: The DataFrame containing the data to resample. The DataFrame must have a
-            'timestamp' column with datetime values.
+            'timestamp' column of integer microseconds.
         target_frequency_hz: The target resampling frequency in Hz.
         num_method: The method to use for numerical data ('mean', 'median', 'max', 'min', 'sum', 'ffill', 'bfill'). This is
         only applied if `interpolate_numerical = False`
             Defaults to 'ffill'.
-        cat_method: The method to use for downsampling categorical data ('ffill', 'bfill', 'mode').
-            Defaults to 'last'.
+        cat_method: The method to use for filling categorical data ('ffill' or 'bfill'; any other
+            method fills forward). Defaults to 'last'.
         interpolate_numerical: Whether to interpolate numerical data after resampling. Defaults to False.
         interpolate_method: The interpolation method to use if interpolation is enabled (e.g., 'linear', 'nearest', 'spline').
             Defaults to 'linear'.
@@ -39,7 +152,7 @@ def resample_data(
         verbose: (Optional) Set to True if verbose output is desired in sampling.
 
     Returns:
-        The resampled DataFrame with the 'timestamp' column reset as a regular column.
+        The resampled DataFrame with the 'timestamp' column (as datetimes) reset as a regular column.
     """
     # Validate that num_columns and cat_columns are provided
     if num_columns is None or cat_columns is None:
@@ -53,43 +166,330 @@ def resample_data(
     if unidentified_cols:
         raise ValueError(f"There are columns in the dataframe which are flagged as neither numerical nor categorical: {unidentified_cols}")
 
-    # Convert the target frequency from Hz to a pandas frequency string
-    milliseconds_per_sample = 1000 / target_frequency_hz
-    pandas_freq = f"{round(milliseconds_per_sample)}L"
-
-    # Set the timestamp column as the index if it is not already
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="us")
-    if df.index.name != "timestamp":
-        df = df.set_index("timestamp")
-
     # TODO: check verbose true
     if verbose:
-        print_column_frequencies(df)
+        print_column_frequencies(df.set_index(pd.to_datetime(df["timestamp"], unit="us")).drop(columns="timestamp").sort_index())
+
+    timestamps = df["timestamp"].to_numpy()
+    if len(timestamps) == 0:
+        edges = np.array([], dtype=np.int64)
+    else:
+        edges = resample_edges(int(timestamps.min()), int(timestamps.max()), target_frequency_hz)
+    resampled = resample_columns(
+        edges,
+        timestamps,
+        {column: df[column].to_numpy() for column in num_columns + cat_columns},
+        num_columns,
+        cat_columns,
+        num_method,
+        cat_method,
+        interpolate_numerical,
+        interpolate_method,
+    )
+    return pd.DataFrame({"timestamp": pd.to_datetime(edges, unit="us"), **resampled})
+
+
+def resample_columns(
+    edges: np.ndarray,
+    timestamps: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    num_columns: List[str],
+    cat_columns: List[str],
+    num_method: str = "ffill",
+    cat_method: str = "last",
+    interpolate_numerical: bool = True,
+    interpolate_method: str = "linear",
+) -> Dict[str, np.ndarray]:
+    """
+    Resamples columns sharing timestamps onto a grid (see `resample_data` for the methods).
+
+    Args:
+    - edges (np.ndarray): Left edges of the bins of the grid (see `resample_edges`).
+    - timestamps (np.ndarray): Timestamps of the rows, in integer microseconds, within the grid.
+    - columns (Dict[str, np.ndarray]): Column name -> values, one per row.
+    - num_columns (List[str]): Names of the numerical columns to resample.
+    - cat_columns (List[str]): Names of the categorical columns to resample.
 
-    # Resample the entire DataFrame using a simple aggregation initially
-    df_resampled = df.resample(pandas_freq).last()  # Use 'last' to initially preserve data structure
+    Returns:
+    - Dict[str, np.ndarray]: Column name -> one value per bin, numerical then categorical columns.
+    """
+    timestamps = np.asarray(timestamps).astype(np.int64)
+    order = None
+    if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+    bins = np.searchsorted(edges, timestamps, side="right") - 1
+    positions = np.arange(len(edges))
+
+    resampled = {}
+    for column in num_columns + cat_columns:
+        values = np.asarray(columns[column])
+        values = values.astype(np.float64 if values.dtype.kind in "biuf" else object, copy=False)
+        if order is not None:
+            values = values[order]
+        binned = _bin_last(bins, values, len(edges))
+        missing = pd.isna(binned)
+        if not missing.any() or missing.all():
+            resampled[column] = binned
+            continue
 
-    # Apply specific methods for numerical data
-    df_num = df_resampled[num_columns]
-    if interpolate_numerical:
-        df_num = df_num.interpolate(method=interpolate_method)
+        if column in cat_columns:
+            binned = _fill(binned, missing, backward=cat_method == "bfill")
+        elif interpolate_numerical and interpolate_method in _LINEAR_METHODS:
+            binned = np.interp(positions, positions[~missing], binned[~missing])
+        elif interpolate_numerical:
+            binned = pd.Series(binned).interpolate(method=interpolate_method).to_numpy()
+        elif num_method in ("ffill", "bfill"):
+            binned = _fill(binned, missing, backward=num_method == "bfill")
+        else:
+            binned = np.where(missing, getattr(pd.Series(binned), num_method)(), binned)
+
+        # ensure that no new NaNs are introduced
+        missing = pd.isna(binned)
+        if missing.any():
+            binned = _fill(binned, missing)
+            binned = _fill(binned, pd.isna(binned), backward=True)
+        resampled[column] = binned
+    return resampled
+
+
+def resample_topics(
+    root: str,
+    files: List[str],
+    format: str,
+    resample_params: Dict[str, Any],
+    dataclasses: Dict[str, str],
+    verbose: bool = False,
+) -> None:
+    """
+    Resamples the topic tables of a mission onto one grid and writes them as
+    a single dense 'resampled' table, without merging them first.
+
+    The grid spans the mission from its first to its last timestamp, as that
+    of its merged table would, so the result is the one of resampling the
+    (outer) merged table. The timestamps of all topics are read first, then
+    each topic is resampled on its own, so memory and time scale with the
+    grid and the largest topic rather than with the union of all timestamps.
+    With `pyramid_levels_hz` in the resampling parameters, the pyramid of the
+    mission (see `pyramid_columns`) is computed from the same reads.
+
+    Args:
+    - root (str): The directory containing the topic tables of a mission.
+    - files (List[str]): The tables within `root`.
+    - format (str): Format of the resampled table ("csv", "npy" or "arrow").
+    - resample_params (Dict[str, Any]): The `resample_params` of the filter.
+    - dataclasses (Dict[str, str]): Alias -> Dataclass (see `dataclass_lookup`).
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+    """
+    topics = [file for file in files if table_stem(file) not in DERIVED_TABLES]
+    bounds = []
+    for file in topics:
+        timestamps = read_table(os.path.join(root, file), columns=["timestamp"])["timestamp"].to_numpy()
+        if len(timestamps) > 0:
+            bounds.append((int(timestamps.min()), int(timestamps.max())))
+    levels_hz = resample_params.get("pyramid_levels_hz") or []
+    if bounds:
+        start = min(start for start, _ in bounds)
+        end = max(end for _, end in bounds)
+        edges = resample_edges(start, end, resample_params["target_frequency_hz"])
+        level_edges = pyramid_edges(start, end, levels_hz)
     else:
-        df_num = df_num.fillna(df_num.ffill() if num_method == 'ffill' else df_num.bfill() if num_method == 'bfill' else getattr(df_num, num_method)())
+        edges = np.array([], dtype=np.int64)
+        level_edges = [np.array([], dtype=np.int64) for _ in levels_hz]
+    levels: List[Dict[str, np.ndarray]] = [{} for _ in levels_hz]
+
+    num_labels: List[str] = []
+    cat_labels: List[str] = []
+    resampled: Dict[str, np.ndarray] = {}
+    for file in topics:
+        frame = read_table(os.path.join(root, file))
+        prefix = column_prefix(table_stem(file))
+        columns = {f"{prefix}_{name}": frame[name].to_numpy() for name in frame.columns if name != "timestamp"}
+        num, cat = classify_labels(list(columns), dataclasses)
+        unidentified = [label for label in columns if label not in num and label not in cat]
+        if unidentified:
+            log(f"Leaving out columns of {os.path.join(root, file)} that are neither numerical nor categorical: {unidentified}", verbosity=verbose, log_level=1)
+        resampled.update(
+            resample_columns(
+                edges,
+                frame["timestamp"].to_numpy(),
+                columns,
+                num,
+                cat,
+                resample_params["num_method"],
+                resample_params["cat_method"],
+                resample_params["interpolate_numerical"],
+                resample_params["interpolate_method"],
+            )
+        )
+        if levels_hz:
+            topic_levels = pyramid_columns(level_edges, frame["timestamp"].to_numpy(), {label: columns[label] for label in num})
+            for level, topic_level in zip(levels, topic_levels):
+                level.update(topic_level)
+        num_labels += num
+        cat_labels += cat
+        del frame, columns
+
+    mission_name = "/".join(os.path.normpath(root).split(os.sep))
+    resampled_df = pd.DataFrame(
+        {
+            "mission_name": np.full(len(edges), mission_name, dtype=object),
+            "timestamp": pd.to_datetime(edges, unit="us"),
+            **{label: resampled[label] for label in sorted(num_labels) + sorted(cat_labels)},
+        }
+    )
+    write_frame(resampled_df, os.path.join(root, table_name("resampled", format)))
+    if levels_hz:
+        write_pyramid(root, levels_hz, level_edges, levels, topics, format)
+
+
+def pyramid_edges(start: int, end: int, levels_hz: List[float]) -> List[np.ndarray]:
+    """
+    Returns the bin edges (see `resample_edges`) of each level of a pyramid
+    spanning [start, end], from the finest level to the coarsest.
+    """
+    return [resample_edges(start, end, frequency) for frequency in sorted(levels_hz, reverse=True)]
+
+
+def _reduce_bins(
+    groups: np.ndarray,
+    stats: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    length: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reduces (sum, count, min, max) rows into `length` bins, given the
+    non-decreasing bin of each row. Empty bins have a NaN min and max.
+    """
+    sums, counts, mins, maxs = stats
+    out_mins = np.full(length, np.nan)
+    out_maxs = np.full(length, np.nan)
+    if len(groups):
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        # fmin/fmax skip the NaNs of empty bins of a finer level
+        out_mins[groups[starts]] = np.fmin.reduceat(mins, starts)
+        out_maxs[groups[starts]] = np.fmax.reduceat(maxs, starts)
+    return (
+        np.bincount(groups, weights=sums, minlength=length),
+        np.bincount(groups, weights=counts, minlength=length),
+        out_mins,
+        out_maxs,
+    )
+
+
+def pyramid_columns(
+    edges: List[np.ndarray],
+    timestamps: np.ndarray,
+    columns: Dict[str, np.ndarray],
+) -> List[Dict[str, np.ndarray]]:
+    """
+    Computes the min, max and mean of numerical columns within the bins of
+    each level of a pyramid, in one pass over the samples: the finest level
+    is binned from the samples, and each coarser level whose bins are unions
+    of those of the level before it is reduced from these.
+
+    Args:
+    - edges (List[np.ndarray]): Bin edges of each level, finest first (see `pyramid_edges`).
+    - timestamps (np.ndarray): Timestamps of the rows, in integer microseconds, within the levels.
+    - columns (Dict[str, np.ndarray]): Column name -> values, one per row; NaNs are skipped.
 
-    # Apply specific methods for categorical data
-    df_cat = df_resampled[cat_columns]
-    with warnings.catch_warnings():
-        warnings.simplefilter(action='ignore', category=FutureWarning)
-        df_cat = df_cat.fillna(method=cat_method)
+    Returns:
+    - List[Dict[str, np.ndarray]]: For each level, "<column>_min", "<column>_max" and
+      "<column>_mean" -> one value per bin (NaN for bins without samples).
+    """
+    timestamps = np.asarray(timestamps).astype(np.int64)
+    order = None
+    if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+    # bin of each bin of the level before, where the levels nest
+    parents: List[np.ndarray | None] = [None]
+    for fine, coarse in zip(edges[:-1], edges[1:]):
+        nested = np.isin(coarse[1:], fine).all()
+        parents.append(np.searchsorted(coarse, fine, side="right") - 1 if nested else None)
+
+    levels: List[Dict[str, np.ndarray]] = [{} for _ in edges]
+    for name, values in columns.items():
+        values = np.asarray(values).astype(np.float64, copy=False)
+        if order is not None:
+            values = values[order]
+        present = values == values
+        values = values[present]
+        stats = None
+        for level, (level_edges, parent) in enumerate(zip(edges, parents)):
+            if parent is not None and stats is not None:
+                stats = _reduce_bins(parent, stats, len(level_edges))
+            else:
+                bins = np.searchsorted(level_edges, timestamps[present], side="right") - 1
+                stats = _reduce_bins(bins, (values, np.ones(len(values)), values, values), len(level_edges))
+            sums, counts, mins, maxs = stats
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums / counts
+            levels[level][f"{name}_min"] = mins
+            levels[level][f"{name}_max"] = maxs
+            levels[level][f"{name}_mean"] = np.where(counts > 0, means, np.nan)
+    return levels
+
+
+def write_pyramid(
+    directory: str,
+    levels_hz: List[float],
+    edges: List[np.ndarray],
+    levels: List[Dict[str, np.ndarray]],
+    raw: List[str],
+    format: str = "csv",
+) -> None:
+    """
+    Writes the levels of a pyramid (see `pyramid_columns`) as tables of a
+    `pyramid` directory, with an `index.json` listing them from the coarsest
+    to the finest, then the raw tables they were computed from.
 
-    # Concatenate numerical and categorical data back together
-    df_final = pd.concat([df_num, df_cat], axis=1)
-    df_final = df_final.ffill().bfill()  # ensure that no new NaNs are introduced
+    Args:
+    - directory (str): The mission directory.
+    - levels_hz (List[float]): Frequency of each level.
+    - edges (List[np.ndarray]): Bin edges of each level, finest first.
+    - levels (List[Dict[str, np.ndarray]]): Columns of each level, finest first.
+    - raw (List[str]): Raw tables of the mission, relative to `directory`.
+    - format (str): Format of the level tables ("csv", "npy" or "arrow").
+    """
+    pyramid_dir = os.path.join(directory, PYRAMID_DIR)
+    os.makedirs(pyramid_dir, exist_ok=True)
+    index = {"levels": [], "raw": raw}
+    for frequency, level_edges, columns in zip(sorted(levels_hz, reverse=True), edges, levels):
+        name = table_name(f"{frequency:g}hz", format)
+        keys = sorted(columns)
+        write_columns(
+            os.path.join(pyramid_dir, name),
+            ["timestamp"] + keys,
+            [level_edges] + [columns[key] for key in keys],
+        )
+        index["levels"].insert(
+            0, {"frequency_hz": frequency, "period_us": 1e6 / frequency, "rows": len(level_edges), "table": name}
+        )
+    with open(os.path.join(pyramid_dir, PYRAMID_INDEX), "w") as f:
+        json.dump(index, f, indent=2)
+
+
+def select_pyramid_level(directory: str, start: int, end: int, min_rows: int) -> str | None:
+    """
+    Picks the coarsest level of a mission's pyramid that still has `min_rows`
+    bins between `start` and `end` (e.g. one per pixel of a plot).
 
-    # Ensure df_final has the timestamp in a column
-    df_final.reset_index(inplace=True)
+    Args:
+    - directory (str): The mission directory.
+    - start (int): Start of the window, in microseconds.
+    - end (int): End of the window, in microseconds.
+    - min_rows (int): Number of bins the window needs.
 
-    return df_final
+    Returns:
+    - str | None: Path of the level table, or None if only the raw tables are fine enough.
+    """
+    pyramid_dir = os.path.join(directory, PYRAMID_DIR)
+    with open(os.path.join(pyramid_dir, PYRAMID_INDEX), "r") as f:
+        index = json.load(f)
+    for level in index["levels"]:
+        if (end - start) / level["period_us"] >= min_rows:
+            return os.path.join(pyramid_dir, level["table"])
+    return None
 
 
 def print_column_frequencies(df):
@@ -139,24 +539,44 @@ def print_column_frequencies(df):
     return frequency_dict
 
 
-def adjust_topic_rate(csv_file:str, max_frequency:float = 100, verbose: bool = False):
-    df = pd.read_csv(csv_file)
-    df = df.sort_values("timestamp").reset_index(drop=True)
-
-    timestamps = df["timestamp"].to_numpy()
-    if len(timestamps) < 2:
-        log(f"Skipping topic rate adjustment of {csv_file}.", verbosity=verbose, log_level=1)
-        return
+def span_rate(count: int, span: int) -> float:
+    """
+    Returns the mean rate of `count` samples spread over `span` microseconds, in Hz
+    (0 for fewer than two samples).
+    """
+    if count < 2:
+        return 0.0
+    return (count - 1) * 1e6 / span if span > 0 else float("inf")
 
-    time_diffs = np.diff(timestamps) / 1e6
-    avg_period = np.mean(time_diffs)
 
-    original_frequency = 1 / avg_period
+def rate_limit(
+    timestamps: np.ndarray,
+    max_frequency: float = 100,
+    tolerance: float = 0,
+    previous: int | None = None,
+) -> np.ndarray:
+    """
+    Selects at most one sample per bucket of time, the first of each, with
+    buckets of 1 / `max_frequency` shortened by `tolerance`. Unlike keeping
+    every n-th sample, this holds for jittery and bursty topics, whose mean
+    period says little about their gaps. A tolerance keeps the samples of a
+    topic logged at `max_frequency` whose periods jitter by less than it, at
+    the cost of a kept rate of up to `max_frequency` * (1 + `tolerance`).
 
-    if original_frequency < max_frequency:
-        return
+    Args:
+    - timestamps (np.ndarray): Sorted timestamps of the topic, in microseconds.
+    - max_frequency (float): Maximum rate of the topic, in Hz.
+    - tolerance (float): Fraction by which the rate may exceed `max_frequency` (none by default).
+    - previous (int): Timestamp of the last sample kept before `timestamps`,
+      to continue the selection of an earlier block of the topic.
 
-    step_size = int(round(original_frequency / max_frequency))
-    downsampled_df = df.iloc[::step_size].copy()
-    downsampled_df.to_csv(csv_file, index=False)
-    return
+    Returns:
+    - np.ndarray: Mask of the samples to keep.
+    """
+    scale = max_frequency * (1 + tolerance) / 1e6
+    buckets = np.floor(np.asarray(timestamps, dtype=np.float64) * scale)
+    keep = np.ones(len(buckets), dtype=bool)
+    keep[1:] = buckets[1:] != buckets[:-1]
+    if previous is not None and len(buckets):
+        keep[0] = buckets[0] != np.floor(float(previous) * scale)
+    return keep
@@ -0,0 +1,311 @@
+import csv
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+from px4_log_tool.util.logger import log
+from px4_log_tool.processing_modules.csv_writer import write_csv_rows
+
+# Output formats of the topic, merged and unified tables.
+# - csv: one delimited text file per table.
+# - npy: one directory per table holding a typed `.npy` file per column, which
+#   `np.load(..., mmap_mode="r")` maps without parsing.
+# - arrow: one Arrow IPC file per table (requires pyarrow).
+TABLE_FORMATS = ("csv", "npy", "arrow")
+_EXTENSIONS = {"csv": ".csv", "npy": ".npy", "arrow": ".arrow"}
+# Column order of an npy table.
+COLUMNS_NAME = "columns.json"
+
+
+def check_format(format: str, verbose: bool = False) -> bool:
+    """
+    Checks that a table format is known and that its dependencies are installed.
+
+    Args:
+    - format (str): One of TABLE_FORMATS.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - bool: True if tables can be written in this format.
+    """
+    if format not in TABLE_FORMATS:
+        log(f"Unknown output format '{format}'. Use one of {', '.join(TABLE_FORMATS)}.", verbosity=verbose, log_level=2)
+        return False
+    if format == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            log("The arrow output format requires pyarrow. Install it or use --format npy.", verbosity=verbose, log_level=2)
+            return False
+    return True
+
+
+def table_name(stem: str, format: str = "csv") -> str:
+    """Returns the file (or, for npy, directory) name of table `stem`."""
+    return stem + _EXTENSIONS[format]
+
+
+def table_format(path: str) -> str | None:
+    """
+    Returns the format of the table at `path`, judged by its name.
+
+    Args:
+    - path (str): Path or name of a table.
+
+    Returns:
+    - str | None: One of TABLE_FORMATS, or None if `path` does not name a table.
+    """
+    for format, extension in _EXTENSIONS.items():
+        if path.endswith(extension):
+            return format
+    return None
+
+
+def table_stem(path: str) -> str:
+    """Returns the table name of `path` without its directory and extension."""
+    name = os.path.basename(os.path.normpath(path))
+    format = table_format(name)
+    return name[: -len(_EXTENSIONS[format])] if format else name
+
+
+def is_table(root: str, name: str) -> bool:
+    """Tells whether directory entry `name` of `root` is a table (hidden ones are not)."""
+    format = table_format(name)
+    if format is None or name.startswith("."):
+        return False
+    return os.path.isdir(os.path.join(root, name)) == (format == "npy")
+
+
+def list_tables(root: str, names: List[str] | None = None) -> List[str]:
+    """
+    Lists the tables of a directory.
+
+    Args:
+    - root (str): Directory to list.
+    - names (List[str], optional): Entries of `root` to consider (e.g. the files
+      and subdirectories yielded by os.walk). Defaults to all entries.
+
+    Returns:
+    - List[str]: Names of the tables, sorted.
+    """
+    if names is None:
+        names = os.listdir(root)
+    return sorted(name for name in names if is_table(root, name))
+
+
+def _npy_header(dtype: np.dtype, length: int) -> bytes:
+    """
+    Returns a version 1.0 `.npy` header for a 1-D array. Its size does not
+    depend on `length`, so that it can be rewritten once the length is known.
+    """
+    template = "{'descr': %r, 'fortran_order': False, 'shape': (%%s,), }" % (
+        np.lib.format.dtype_to_descr(dtype),
+    )
+    header = template % length
+    # magic, version, header size, room for a 20 digit length and the newline,
+    # padded so that the data is 64 byte aligned
+    size = -(-(10 + len(template) + 20 + 1) // 64) * 64
+    return b"\x93NUMPY\x01\x00" + (size - 10).to_bytes(2, "little") + header.ljust(size - 11).encode("latin1") + b"\n"
+
+
+class TableWriter:
+    """
+    Appends batches of equally long columns to a table, in the format given by
+    `path`. Files are only held open by Arrow tables, so that many tables can
+    be written at a time.
+
+    Args:
+    - path (str): Path of the table; its extension selects the format.
+    - header_keys (List[str]): Column names.
+    - dtypes (List[np.dtype]): Column types (used by the typed formats).
+    - delimiter (str): CSV delimiter (default: ",").
+    """
+
+    def __init__(
+        self,
+        path: str,
+        header_keys: List[str],
+        dtypes: List[np.dtype],
+        delimiter: str = ",",
+    ):
+        self.path = path
+        self.format = table_format(path)
+        self.header_keys = list(header_keys)
+        self.dtypes = [np.dtype(dtype) for dtype in dtypes]
+        self.delimiter = delimiter
+        self.length = 0
+        if self.format == "csv":
+            with open(path, "w", encoding="utf-8") as csvfile:
+                csvfile.write(delimiter.join(self.header_keys) + "\n")
+        elif self.format == "npy":
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+            for key, dtype in zip(self.header_keys, self.dtypes):
+                with open(os.path.join(path, f"{key}.npy"), "wb") as f:
+                    f.write(_npy_header(dtype, 0))
+            with open(os.path.join(path, COLUMNS_NAME), "w") as f:
+                json.dump(self.header_keys, f)
+        elif self.format == "arrow":
+            import pyarrow as pa
+
+            self._schema = pa.schema(
+                [(key, pa.from_numpy_dtype(dtype)) for key, dtype in zip(self.header_keys, self.dtypes)]
+            )
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self._schema)
+        else:
+            raise ValueError(f"Unknown table format of {path}")
+
+    def write(self, columns: List[np.ndarray]) -> None:
+        """Appends equally long columns, in table order."""
+        if len(columns) == 0 or len(columns[0]) == 0:
+            return
+        if self.format == "csv":
+            with open(self.path, "a", encoding="utf-8") as csvfile:
+                write_csv_rows(csvfile, columns, self.delimiter)
+        elif self.format == "npy":
+            for key, dtype, column in zip(self.header_keys, self.dtypes, columns):
+                with open(os.path.join(self.path, f"{key}.npy"), "ab") as f:
+                    f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        else:
+            import pyarrow as pa
+
+            self._writer.write_batch(pa.record_batch(list(columns), schema=self._schema))
+        self.length += len(columns[0])
+
+    def close(self) -> None:
+        """Completes the table."""
+        if self.format == "npy":
+            for key, dtype in zip(self.header_keys, self.dtypes):
+                with open(os.path.join(self.path, f"{key}.npy"), "r+b") as f:
+                    f.write(_npy_header(dtype, self.length))
+        elif self.format == "arrow":
+            self._writer.close()
+            self._sink.close()
+
+
+def write_columns(
+    path: str,
+    header_keys: List[str],
+    columns: List[np.ndarray],
+    delimiter: str = ",",
+) -> None:
+    """
+    Writes equally long column arrays as a table, in the format given by `path`.
+
+    Args:
+    - path (str): Path of the table; its extension selects the format.
+    - header_keys (List[str]): Column names.
+    - columns (List[np.ndarray]): Column arrays in output order.
+    - delimiter (str): CSV delimiter (default: ",").
+    """
+    writer = TableWriter(path, header_keys, [column.dtype for column in columns], delimiter)
+    writer.write(columns)
+    writer.close()
+
+
+def write_frame(frame: pd.DataFrame, path: str) -> None:
+    """
+    Writes a DataFrame as a table, in the format given by `path`.
+
+    Args:
+    - frame (pd.DataFrame): Table to write; its index is dropped.
+    - path (str): Path of the table; its extension selects the format.
+    """
+    if table_format(path) == "csv":
+        frame.to_csv(path, index=False)
+        return
+    columns = []
+    for key in frame.columns:
+        column = frame[key].to_numpy()
+        if column.dtype == object:
+            # strings (e.g. mission names) as fixed width unicode, which maps
+            column = column.astype(str)
+        columns.append(column)
+    write_columns(path, [str(key) for key in frame.columns], columns)
+
+
+def table_schema(path: str) -> Dict[str, np.dtype | None]:
+    """
+    Reads the column names and types of a table without its data. CSV tables
+    only have their header read, and their types are unknown (None).
+
+    Args:
+    - path (str): Path of the table; its extension selects the format.
+
+    Returns:
+    - Dict[str, np.dtype | None]: Column name -> type, in table order. Strings
+      are unicode types (of width 0 when the format does not fix it).
+    """
+    format = table_format(path)
+    if format == "csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return {key: None for key in next(csv.reader(f), [])}
+    if format == "npy":
+        return {key: column.dtype for key, column in read_columns(path).items()}
+    if format == "arrow":
+        import pyarrow as pa
+
+        with pa.memory_map(path, "r") as source:
+            schema = pa.ipc.open_file(source).schema
+        return {
+            field.name: np.dtype(str)
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+            else np.dtype(field.type.to_pandas_dtype())
+            for field in schema
+        }
+    raise ValueError(f"Unknown table format of {path}")
+
+
+def read_columns(path: str) -> Dict[str, np.ndarray]:
+    """
+    Reads a table as column arrays. npy tables are memory-mapped and Arrow
+    tables are mapped as well where their types allow it.
+
+    Args:
+    - path (str): Path of the table; its extension selects the format.
+
+    Returns:
+    - Dict[str, np.ndarray]: Column name -> values, in table order.
+    """
+    format = table_format(path)
+    if format == "npy":
+        with open(os.path.join(path, COLUMNS_NAME), "r") as f:
+            header_keys = json.load(f)
+        return {
+            key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r")
+            for key in header_keys
+        }
+    frame = read_table(path)
+    return {key: frame[key].to_numpy() for key in frame.columns}
+
+
+def read_table(path: str, columns: List[str] | None = None) -> pd.DataFrame:
+    """
+    Reads a table into a DataFrame.
+
+    Args:
+    - path (str): Path of the table; its extension selects the format.
+    - columns (List[str], optional): Only these columns, in table order. All columns if None.
+
+    Returns:
+    - pd.DataFrame: The table.
+    """
+    format = table_format(path)
+    if format == "csv":
+        return pd.read_csv(path, usecols=columns)
+    if format == "npy":
+        arrays = read_columns(path)
+        keys = [key for key in arrays if columns is None or key in columns]
+        return pd.DataFrame({key: arrays[key] for key in keys}, columns=keys)
+    if format == "arrow":
+        import pyarrow as pa
+
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select([key for key in table.column_names if key in columns])
+            return table.to_pandas()
+    raise ValueError(f"Unknown table format of {path}")
@@ -0,0 +1,884 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+# Bytes of the data section read and decoded at a time. Together with the
+# number of logged topics this bounds the memory used to decode a ULog,
+# whatever its size. It must hold the largest possible message (65538 bytes).
+CHUNK_BYTES = 8 << 20
+
+# The index of "<dir>/<log>.ulg" is "<log>.ulg.<hash of its path>.idx" in the
+# cache directory (see ULogIndex), so that the log archive is left untouched.
+INDEX_SUFFIX = ".idx"
+INDEX_DIR = os.path.join("px4_log_tool", "ulog_index")
+INDEX_MAGIC = b"PX4ULIDX"
+INDEX_VERSION = 1
+# Records per block of the index; the index holds the largest timestamp of each.
+INDEX_BLOCK = 1024
+# Records of an indexed read that are closer than this are read at once.
+_GAP_BYTES = 1 << 16
+
+HEADER_BYTES = b"\x55\x4c\x6f\x67\x01\x12\x35"
+SYNC_BYTES = b"\x2F\x73\x13\x20\x25\x0C\xBB\x12"
+
+MSG_TYPE_FORMAT = ord("F")
+MSG_TYPE_DATA = ord("D")
+MSG_TYPE_INFO = ord("I")
+MSG_TYPE_INFO_MULTIPLE = ord("M")
+MSG_TYPE_PARAMETER = ord("P")
+MSG_TYPE_PARAMETER_DEFAULT = ord("Q")
+MSG_TYPE_ADD_LOGGED_MSG = ord("A")
+MSG_TYPE_SYNC = ord("S")
+MSG_TYPE_DROPOUT = ord("O")
+MSG_TYPE_LOGGING = ord("L")
+MSG_TYPE_LOGGING_TAGGED = ord("C")
+MSG_TYPE_FLAG_BITS = ord("B")
+
+# Message types of the data section that carry no topic data; they are skipped.
+_SKIPPED_TYPES = frozenset(
+    (
+        MSG_TYPE_INFO,
+        MSG_TYPE_INFO_MULTIPLE,
+        MSG_TYPE_PARAMETER,
+        MSG_TYPE_PARAMETER_DEFAULT,
+        MSG_TYPE_LOGGING,
+        MSG_TYPE_LOGGING_TAGGED,
+        MSG_TYPE_SYNC,
+    )
+)
+
+# ULog field type -> numpy type, as decoded by pyulog.
+_NUMPY_TYPES = {
+    "int8_t": np.int8,
+    "uint8_t": np.uint8,
+    "int16_t": np.int16,
+    "uint16_t": np.uint16,
+    "int32_t": np.int32,
+    "uint32_t": np.uint32,
+    "int64_t": np.int64,
+    "uint64_t": np.uint64,
+    "float": np.float32,
+    "double": np.float64,
+    "bool": np.int8,
+    "char": np.int8,
+}
+
+_unpack_header = struct.Struct("<HB").unpack_from
+
+
+class FieldData:
+    """Name and ULog type of a single (flattened) topic field."""
+
+    def __init__(self, field_name: str, type_str: str):
+        self.field_name = field_name
+        self.type_str = type_str
+
+
+class Subscription:
+    """
+    A logged topic instance. Mirrors the `pyulog.ULog.Data` attributes used by
+    the converters, except that the records are streamed rather than held in
+    `data`.
+
+    With `fields`, only the named fields (and the timestamp) are decoded: a
+    name selects the field of that name and, for arrays and nested types,
+    all of its elements (e.g. "gyro_rad" selects "gyro_rad[0]" to
+    "gyro_rad[2]"). `field_data` and `dtype` then describe the kept fields,
+    `dtype` being a view of the bytes from `offset` to `offset +
+    dtype.itemsize` of each record, and `unmatched` lists the names that
+    selected nothing.
+
+    Args:
+    - msg_id (int): Message id of the instance.
+    - multi_id (int): Instance number of the topic.
+    - name (str): Topic name.
+    - formats (Dict[str, list]): Parsed format definitions of the log.
+    - fields (List[str], optional): Fields to decode (all if None).
+    """
+
+    def __init__(
+        self,
+        msg_id: int,
+        multi_id: int,
+        name: str,
+        formats: Dict[str, list],
+        fields: List[str] | None = None,
+    ):
+        self.msg_id = msg_id
+        self.multi_id = multi_id
+        self.name = name
+        self.field_data: List[FieldData] = []
+        self._flatten("", name, formats)
+        # remove padding fields at the end
+        while self.field_data and self.field_data[-1].field_name.startswith("_padding"):
+            self.field_data.pop()
+        self.dtype = np.dtype(
+            [(f.field_name, _NUMPY_TYPES[f.type_str]) for f in self.field_data]
+        ).newbyteorder("<")
+        # size of a whole record, which data messages are checked against
+        self.record_size = self.dtype.itemsize
+        self.offset = 0
+        self.unmatched: List[str] = []
+        if fields is not None:
+            self._project(fields)
+        # number of records decoded so far
+        self.count = 0
+
+    def _project(self, fields: List[str]) -> None:
+        """Restricts `field_data` and `dtype` to the selected fields."""
+        def selected(field_name: str, name: str) -> bool:
+            return field_name == name or field_name.startswith((name + "[", name + "."))
+
+        self.unmatched = [name for name in fields if not any(selected(f.field_name, name) for f in self.field_data)]
+        kept = [
+            f for f in self.field_data
+            if f.field_name == "timestamp" or any(selected(f.field_name, name) for name in fields)
+        ]
+        if not kept:
+            return
+        full = self.dtype.fields
+        start = min(full[f.field_name][1] for f in kept)
+        end = max(full[f.field_name][1] + full[f.field_name][0].itemsize for f in kept)
+        self.field_data = kept
+        self.offset = start
+        self.dtype = np.dtype(
+            {
+                "names": [f.field_name for f in kept],
+                "formats": [full[f.field_name][0] for f in kept],
+                "offsets": [full[f.field_name][1] - start for f in kept],
+                "itemsize": end - start,
+            }
+        )
+
+    def _flatten(self, prefix: str, type_name: str, formats: Dict[str, list]) -> None:
+        for field_type, array_size, field_name in formats[type_name]:
+            if field_type in _NUMPY_TYPES:
+                if array_size > 1:
+                    for i in range(array_size):
+                        self.field_data.append(FieldData(f"{prefix}{field_name}[{i}]", field_type))
+                else:
+                    self.field_data.append(FieldData(prefix + field_name, field_type))
+            elif array_size > 1:
+                for i in range(array_size):
+                    self._flatten(f"{prefix}{field_name}[{i}].", field_type, formats)
+            else:
+                self._flatten(f"{prefix}{field_name}.", field_type, formats)
+
+
+def _parse_format(data: bytes, errors: str) -> Tuple[str, list]:
+    format_arr = data.decode("utf-8", errors).split(":")
+    name, types = format_arr[0], format_arr[1]
+    fields = []
+    for field in types.split(";"):
+        if len(field) == 0:
+            continue
+        field_split = field.split(" ")
+        type_str, field_name = field_split[0], field_split[1]
+        if "[" in type_str:
+            array_size = int(type_str[type_str.find("[") + 1 : type_str.find("]")])
+            type_str = type_str[: type_str.find("[")]
+        else:
+            array_size = 1
+        fields.append((type_str, array_size, field_name))
+    return name, fields
+
+
+def _is_truncated(msg_type: int, data: bytes, errors: str) -> bool:
+    """
+    Tells whether pyulog fails to unpack a message of the data section (and
+    therefore stops reading the segment). Strings are decoded like pyulog
+    does, so undecodable ones raise in strict mode.
+    """
+    size = len(data)
+    if msg_type == MSG_TYPE_DATA:
+        return size < 2
+    if msg_type == MSG_TYPE_ADD_LOGGED_MSG:
+        return size < 3
+    if msg_type == MSG_TYPE_DROPOUT:
+        return size != 2
+    if msg_type == MSG_TYPE_LOGGING:
+        if size >= 9:
+            data[9:].decode("utf-8", errors)
+        return size < 9
+    if msg_type == MSG_TYPE_LOGGING_TAGGED:
+        if size >= 11:
+            data[11:].decode("utf-8", errors)
+        return size < 11
+    if msg_type in (MSG_TYPE_INFO_MULTIPLE, MSG_TYPE_PARAMETER_DEFAULT):
+        if size < 1:
+            return True
+        data = data[1:]
+    elif msg_type not in (MSG_TYPE_INFO, MSG_TYPE_PARAMETER):
+        return False
+    if len(data) < 1:
+        return True
+    key_len = data[0]
+    type_key = data[1 : 1 + key_len].decode("utf-8", errors).split(" ")
+    if len(type_key) < 2:
+        return False  # an IndexError for pyulog, which skips the message
+    value = data[1 + key_len :]
+    if type_key[0].startswith("char["):
+        value.decode("utf-8", errors)
+        return False
+    if type_key[0] in _NUMPY_TYPES:
+        return len(value) != np.dtype(_NUMPY_TYPES[type_key[0]]).itemsize
+    return False
+
+
+def _timestamps(
+    subscription: Subscription, raw: np.ndarray, payloads: np.ndarray, records: np.ndarray | None = None
+) -> np.ndarray:
+    """Timestamps of the records at `payloads` (zeros for a topic without timestamp)."""
+    field = subscription.dtype.fields.get("timestamp")
+    if field is None:
+        return np.zeros(len(payloads), dtype=np.uint64)
+    if records is not None:
+        return records["timestamp"]
+    dtype, shift = field[:2]
+    shift += subscription.offset
+    return raw[(payloads + shift)[:, None] + np.arange(dtype.itemsize)].view(dtype).ravel()
+
+
+def _align(offset: int, alignment: int) -> int:
+    return -(-offset // alignment) * alignment
+
+
+def _gather(view: memoryview, offsets: np.ndarray, size: int) -> bytes:
+    """Concatenates the `size` bytes found at each of `offsets` in `view`."""
+    return b"".join([view[p : p + size] for p in offsets.tolist()])
+
+
+def index_path(ulog_path: str) -> str:
+    """
+    Returns the path of the index of a ULog file, in the user cache directory
+    ("$XDG_CACHE_HOME/px4_log_tool/ulog_index", or under "~/.cache").
+
+    Args:
+    - ulog_path (str): Path to the ULog file.
+    """
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    key = hashlib.sha256(os.path.abspath(ulog_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache, INDEX_DIR, f"{os.path.basename(ulog_path)}.{key}{INDEX_SUFFIX}")
+
+
+class ULogIndex:
+    """
+    Index of a ULog file, written to `index_path` by a full pass of
+    ULogStream. For every topic instance with data it holds the file offsets
+    of the records pyulog keeps (after appended data, re-subscriptions and
+    corrupt messages are resolved) and the largest timestamp of each block
+    of INDEX_BLOCK records, so that a topic or a time window can be read
+    without scanning the log.
+
+    The file is a JSON header (see `_IndexBuilder.finish`) followed by the
+    arrays, which are memory-mapped. An index whose log changed size or
+    modification time since it was written is not loaded.
+
+    Args:
+    - path (str): Path of the index file.
+    - header (dict): Its parsed header.
+    - data_offset (int): File offset of the arrays.
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any], data_offset: int):
+        self.path = path
+        self.header = header
+        self.data_offset = data_offset
+        self.entries: List[Dict[str, Any]] = header["instances"]
+        self.offset_dtype = np.dtype(header["offset_dtype"])
+
+    @classmethod
+    def load(cls, ulog_path: str, errors: str = "strict") -> "ULogIndex | None":
+        """
+        Loads the index of a ULog file.
+
+        Args:
+        - ulog_path (str): Path to the ULog file.
+        - errors (str): How undecodable names are handled by the caller; an
+          index built while ignoring them only serves callers that do too.
+
+        Returns:
+        - ULogIndex | None: The index, or None if there is no valid one.
+        """
+        path = index_path(ulog_path)
+        try:
+            stat = os.stat(ulog_path)
+            with open(path, "rb") as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                (length,) = struct.unpack("<Q", f.read(8))
+                header = json.loads(f.read(length).decode("utf-8"))
+        except (OSError, ValueError, struct.error):
+            return None
+        if (
+            header.get("version") != INDEX_VERSION
+            or header.get("size") != stat.st_size
+            or header.get("mtime_ns") != stat.st_mtime_ns
+            or header.get("errors") not in ("strict", errors)
+        ):
+            return None
+        return cls(path, header, _align(len(INDEX_MAGIC) + 8 + length, 64))
+
+    def offsets(self, entry: Dict[str, Any]) -> np.ndarray:
+        """File offsets of the records of an instance, in file order."""
+        return np.memmap(
+            self.path, self.offset_dtype, "r", self.data_offset + entry["offsets"], (entry["count"],)
+        )
+
+    def block_max(self, entry: Dict[str, Any]) -> np.ndarray:
+        """Largest timestamp of each block of INDEX_BLOCK records of an instance."""
+        blocks = -(-entry["count"] // INDEX_BLOCK)
+        return np.memmap(self.path, np.dtype("<f8"), "r", self.data_offset + entry["block_max"], (blocks,))
+
+
+class _IndexBuilder:
+    """
+    Collects the record offsets of every topic instance during a full pass
+    of ULogStream and writes them as a ULogIndex. The offsets are spilled to
+    temporary files, so memory use does not grow with the log. The index is
+    an optimisation: if it cannot be written, the pass goes on without it.
+    """
+
+    def __init__(self, ulog_path: str, errors: str):
+        stat = os.stat(ulog_path)
+        self.path = index_path(ulog_path)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.errors = errors
+        self.offset_dtype = np.dtype("<u4" if stat.st_size < 1 << 32 else "<u8")
+        self.directory = tempfile.mkdtemp(prefix="px4_log_tool_index_")
+        # instance -> [spill file, record count, block maxima, max of the current block]
+        self.instances: Dict[Subscription, list] = {}
+        # the instances left with data at the end of their segment, as for ULogStream
+        self.finished: List[Subscription] = []
+        self.readded = False
+        self.failed = False
+
+    def add(self, subscription: Subscription, offsets: np.ndarray, timestamps: np.ndarray) -> None:
+        """Records the file offsets and timestamps of a batch of records of an instance."""
+        if self.failed:
+            return
+        state = self.instances.get(subscription)
+        if state is None:
+            spill = os.path.join(self.directory, str(len(self.instances)))
+            state = self.instances[subscription] = [spill, 0, [], -np.inf]
+        try:
+            with open(state[0], "ab") as f:
+                f.write(offsets.astype(self.offset_dtype).tobytes())
+        except OSError:
+            self.failed = True
+            return
+        # as float64, the maxima compare to a time like the timestamps do
+        timestamps = timestamps.astype(np.float64)
+        # complete the current block, then whole blocks, then start the next one
+        filled = state[1] % INDEX_BLOCK
+        head = min(len(timestamps), (INDEX_BLOCK - filled) % INDEX_BLOCK)
+        if head:
+            state[3] = max(state[3], timestamps[:head].max())
+            if filled + head == INDEX_BLOCK:
+                state[2].append(state[3])
+        rest = timestamps[head:]
+        whole = len(rest) // INDEX_BLOCK * INDEX_BLOCK
+        if whole:
+            state[2].extend(rest[:whole].reshape(-1, INDEX_BLOCK).max(axis=1).tolist())
+        if len(rest) > whole:
+            state[3] = rest[whole:].max()
+        state[1] += len(offsets)
+
+    def finish(self, data_list: List[Subscription], file_corrupt: bool) -> None:
+        """Writes the index of the instances in `data_list`; gives up silently if it cannot."""
+        if self.failed:
+            return
+        entries, arrays, position = [], [], 0
+        for subscription in data_list:
+            spill, count, block_max, current = self.instances[subscription]
+            if count % INDEX_BLOCK:
+                block_max = block_max + [current]
+            entry = {
+                "name": subscription.name,
+                "multi_id": subscription.multi_id,
+                "msg_id": subscription.msg_id,
+                "count": count,
+                "offsets": position,
+            }
+            position = _align(position + count * self.offset_dtype.itemsize, 8)
+            entry["block_max"] = position
+            position += len(block_max) * 8
+            entries.append(entry)
+            arrays.append((spill, np.array(block_max, dtype="<f8")))
+        header = json.dumps(
+            {
+                "version": INDEX_VERSION,
+                "size": self.size,
+                "mtime_ns": self.mtime_ns,
+                "errors": self.errors,
+                "offset_dtype": self.offset_dtype.str,
+                "readded": self.readded,
+                "file_corrupt": file_corrupt,
+                "instances": entries,
+            }
+        ).encode("utf-8")
+        start = len(INDEX_MAGIC) + 8 + len(header)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "wb") as f:
+                f.write(INDEX_MAGIC + struct.pack("<Q", len(header)) + header)
+                f.write(b"\0" * (_align(start, 64) - start))
+                for entry, (spill, block_max) in zip(entries, arrays):
+                    with open(spill, "rb") as source:
+                        shutil.copyfileobj(source, f)
+                    f.write(b"\0" * (entry["block_max"] - entry["offsets"] - entry["count"] * self.offset_dtype.itemsize))
+                    f.write(block_max.tobytes())
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            # e.g. a read-only cache: the log is just scanned again next time
+            try:
+                os.remove(self.path + ".tmp")
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        """Removes the temporary files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ULogStream:
+    """
+    Decodes the topic data of a ULog file one chunk at a time.
+
+    The result matches `pyulog.ULog(path, messages, disable_str_exceptions)`:
+    the same topics and fields, the same records (including the handling of
+    appended data and the recovery from corrupt messages), but the records are
+    yielded in batches by `batches()` instead of being collected in memory.
+    Info, parameter and logging messages are skipped without being decoded.
+
+    With `index`, the log is read through its ULogIndex if it has a valid
+    one: only the records of the selected topics are read. Otherwise the
+    whole log is scanned and the index is written as a by-product.
+
+    Args:
+    - path (str): Path to the ULog file.
+    - messages (List[str], optional): Names of the topics to decode (all if None).
+    - disable_str_exceptions (bool): If True, ignore undecodable characters in
+      topic and format names.
+    - chunk_size (int): Bytes of the data section decoded at a time.
+    - index (bool): Whether to use (and build) the index of the log (see `index_path`).
+    - fields (Dict[str, List[str]], optional): Topic name -> fields to decode
+      (see Subscription); topics that are not listed are decoded whole.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        messages: List[str] | None = None,
+        disable_str_exceptions: bool = False,
+        chunk_size: int = CHUNK_BYTES,
+        index: bool = False,
+        fields: Dict[str, List[str]] | None = None,
+    ):
+        self.path = path
+        self.messages = messages
+        self.fields = fields or {}
+        self.chunk_size = max(chunk_size, 1 << 17)
+        self.file_corrupt = False
+        self._errors = "ignore" if disable_str_exceptions else "strict"
+        self._formats: Dict[str, list] = {}
+        self._appended_offsets: List[int] = []
+        self._has_sync = True
+        self._finished: List[Subscription] = []
+        self._time_s: float | None = None
+        self._time_e: float | None = None
+        # subscription -> [window started, window ended]
+        self._windows: Dict[Subscription, List[bool]] = {}
+        with open(path, "rb") as f:
+            self._read_header(f)
+            self._read_definitions(f)
+            self._data_offset = f.tell()
+        self._index: ULogIndex | None = None
+        self._build_index = False
+        if index:
+            self._index = ULogIndex.load(path, self._errors)
+            self._build_index = self._index is None
+            # a topic filter keeps a subscription that an unfiltered read
+            # replaces, so the index only serves it if no id was reused
+            if self._index is not None and messages is not None and self._index.header["readded"]:
+                self._index = None
+
+    @property
+    def data_list(self) -> List[Subscription]:
+        """Topic instances that had data, sorted like pyulog's (after `batches()`)."""
+        return sorted(self._finished, key=lambda s: (s.name, s.multi_id))
+
+    def _read_header(self, f: BinaryIO) -> None:
+        header = f.read(16)
+        if len(header) != 16:
+            raise TypeError("Invalid file format (Header too short)")
+        if header[:7] != HEADER_BYTES:
+            raise TypeError("Invalid file format (Failed to parse header)")
+
+    def _read_definitions(self, f: BinaryIO) -> None:
+        while True:
+            data = f.read(3)
+            if len(data) < 3:
+                break
+            msg_size, msg_type = _unpack_header(data)
+            data = f.read(msg_size)
+            try:
+                if msg_type == MSG_TYPE_FORMAT:
+                    name, fields = _parse_format(data, self._errors)
+                    self._formats[name] = fields
+                elif msg_type in (MSG_TYPE_ADD_LOGGED_MSG, MSG_TYPE_LOGGING, MSG_TYPE_LOGGING_TAGGED):
+                    f.seek(-(3 + msg_size), 1)
+                    break  # end of section
+                elif msg_type == MSG_TYPE_FLAG_BITS:
+                    incompat_flags = data[8:16]
+                    offsets = list(struct.unpack("<QQQ", data[16:40]))
+                    while offsets and offsets[-1] == 0:
+                        offsets.pop()
+                    self._appended_offsets = offsets
+                    if incompat_flags[0] & ~1:
+                        raise ValueError("Unknown incompatible flag set: cannot parse the log")
+                    if any(incompat_flags[1:8]):
+                        raise NotImplementedError("Unknown incompatible flag set: cannot parse the log")
+                elif msg_type in _SKIPPED_TYPES:
+                    if _is_truncated(msg_type, data, self._errors):
+                        raise struct.error(f"truncated message of type {chr(msg_type)}")
+                else:
+                    if self._is_corrupt(msg_type, msg_size):
+                        # advance by a single byte instead of skipping the message
+                        f.seek(-2 - msg_size, 1)
+            except IndexError:
+                self.file_corrupt = True
+
+    def _is_corrupt(self, msg_type: int, msg_size: int) -> bool:
+        if msg_type == 0 or msg_size == 0 or msg_size > 10000:
+            self.file_corrupt = True
+            return True
+        return False
+
+    def _find_sync(self, f: BinaryIO, start: int, length: int = -1) -> int | None:
+        """
+        Returns the offset just past the first sync sequence at or after
+        `start` (within `length` bytes if given), or None.
+        """
+        f.seek(start)
+        if length != -1:
+            chunk = f.read(length)
+            index = chunk.find(SYNC_BYTES)
+            found = None if index < 0 else start + index + len(SYNC_BYTES)
+        else:
+            found = None
+            position = start
+            while True:
+                chunk = f.read(self.chunk_size)
+                if len(chunk) < len(SYNC_BYTES):
+                    break
+                index = chunk.find(SYNC_BYTES)
+                if index >= 0:
+                    found = position + index + len(SYNC_BYTES)
+                    break
+                position += len(chunk) - (len(SYNC_BYTES) - 1)
+                f.seek(position)
+            if found is None:
+                self._has_sync = False
+        if found is not None:
+            self.file_corrupt = True
+        return found
+
+    def batches(
+        self, time_s: float | None = None, time_e: float | None = None
+    ) -> Iterator[Tuple[Subscription, np.ndarray]]:
+        """
+        Yields (subscription, records) pairs in file order, `records` being a
+        structured array with the subscription's dtype. A subscription whose
+        message id is subscribed again is dropped (as pyulog does); only the
+        subscriptions in `data_list` hold valid data once this is exhausted.
+
+        Only the records of each topic instance from its first timestamp >=
+        `time_s` up to, excluding, its first timestamp >= `time_e` are
+        yielded; the others are not decoded. Every instance of `data_list` is
+        yielded at least once, possibly with no records. Read through the
+        index, the instances are yielded in turn and the window bounds are
+        found by a binary search, so the records outside it are not read.
+
+        Args:
+        - time_s (float, optional): Start of the time window, in seconds.
+        - time_e (float, optional): End of the time window, in seconds.
+        """
+        self._time_s, self._time_e = time_s, time_e
+        if self._index is not None:
+            yield from self._indexed_batches(time_s, time_e)
+            return
+        builder = None
+        if self._build_index:
+            try:
+                builder = _IndexBuilder(self.path, self._errors)
+            except OSError:
+                pass
+        try:
+            with open(self.path, "rb") as f:
+                start = self._data_offset
+                for offset in self._appended_offsets:
+                    yield from self._read_segment(f, start, offset, builder)
+                    start = offset
+                yield from self._read_segment(f, start, 1 << 50, builder)
+            if builder is not None:
+                builder.finish(sorted(builder.finished, key=lambda s: (s.name, s.multi_id)), self.file_corrupt)
+        finally:
+            if builder is not None:
+                builder.close()
+
+    def _indexed_batches(
+        self, time_s: float | None, time_e: float | None
+    ) -> Iterator[Tuple[Subscription, np.ndarray]]:
+        """Reads the records of the selected topic instances at the offsets of the index."""
+        index = self._index
+        self.file_corrupt = index.header["file_corrupt"]
+        with open(self.path, "rb") as f:
+            for entry in index.entries:
+                if self.messages is not None and entry["name"] not in self.messages:
+                    continue
+                subscription = Subscription(
+                    entry["msg_id"], entry["multi_id"], entry["name"], self._formats, self.fields.get(entry["name"])
+                )
+                subscription.count = entry["count"]
+                self._finished.append(subscription)
+                offsets = index.offsets(entry)
+                first, last = 0, len(offsets)
+                if "timestamp" in subscription.dtype.fields:
+                    block_max = index.block_max(entry)
+                    if time_s:
+                        first = self._first_at(f, subscription, offsets, block_max, time_s)
+                    if time_e:
+                        last = max(first, self._first_at(f, subscription, offsets, block_max, time_e))
+                itemsize = subscription.dtype.itemsize
+                rows = max(1, self.chunk_size // itemsize)
+                for begin in range(first, max(last, first + 1), rows):
+                    chunk = offsets[begin : min(begin + rows, last)].astype(np.int64) + subscription.offset
+                    yield subscription, np.frombuffer(self._read_at(f, chunk, itemsize), dtype=subscription.dtype)
+
+    def _first_at(
+        self, f: BinaryIO, subscription: Subscription, offsets: np.ndarray, block_max: np.ndarray, time: float
+    ) -> int:
+        """Returns the index of the first record with a timestamp >= `time` (in seconds), or the record count."""
+        # the first block holding such a record is the first whose running maximum reaches `time`
+        block = int(np.searchsorted(np.maximum.accumulate(block_max), time * 1e6))
+        if block == len(block_max):
+            return len(offsets)
+        first = block * INDEX_BLOCK
+        dtype, shift = subscription.dtype.fields["timestamp"][:2]
+        chunk = offsets[first : first + INDEX_BLOCK].astype(np.int64) + subscription.offset + shift
+        timestamps = np.frombuffer(self._read_at(f, chunk, dtype.itemsize), dtype=dtype)
+        return first + int(np.flatnonzero(timestamps >= time * 1e6)[0])
+
+    def _read_at(self, f: BinaryIO, offsets: np.ndarray, size: int) -> bytes:
+        """
+        Reads `size` bytes at each file offset. Records less than _GAP_BYTES
+        apart are read at once, up to `chunk_size` bytes at a time.
+        """
+        offsets = offsets.astype(np.int64)
+        parts = []
+        steps = np.diff(offsets)
+        for run in np.split(offsets, np.flatnonzero((steps > _GAP_BYTES) | (steps < 0)) + 1):
+            while run.size:
+                count = int(np.searchsorted(run, run[0] + self.chunk_size - size, "right")) or 1
+                f.seek(int(run[0]))
+                buffer = f.read(int(run[count - 1]) + size - int(run[0]))
+                parts.append(_gather(memoryview(buffer), run[:count] - run[0], size))
+                run = run[count:]
+        return b"".join(parts)
+
+    def _window(self, subscription: Subscription, timestamps: np.ndarray) -> Tuple[int, int] | None:
+        """
+        Returns the range of a batch of records that falls in the time window,
+        or None once the window of `subscription` has ended. The window starts
+        at the first timestamp >= time_s and ends before the first timestamp
+        >= time_e.
+        """
+        state = self._windows.setdefault(subscription, [not self._time_s, False])
+        if state[1]:
+            return None
+        start = 0
+        if not state[0]:
+            hits = np.flatnonzero(timestamps >= self._time_s * 1e6)
+            start = hits[0] if hits.size else len(timestamps)
+            state[0] = hits.size > 0
+        stop = len(timestamps)
+        if self._time_e:
+            hits = np.flatnonzero(timestamps >= self._time_e * 1e6)
+            if hits.size:
+                stop = hits[0]
+                state[1] = True
+        return start, max(start, stop)
+
+    def _read_segment(
+        self, f: BinaryIO, start: int, limit: int, builder: _IndexBuilder | None = None
+    ) -> Iterator[Tuple[Subscription, np.ndarray]]:
+        """Decodes the messages from offset `start` up to offset `limit`."""
+        subscriptions: Dict[int, Subscription] = {}
+        # every subscription, whatever the topic filter, for the index
+        indexed: Dict[int, Subscription] | None = None if builder is None else {}
+        positions: List[int] = []
+        # the chunk buffer holds the file contents from offset `base`
+        base, pos, buffer, at_end = start, 0, b"", False
+        # pyulog checks `limit` against a position count that a sync search
+        # does not update; `drift` is how far that count is ahead of `pos`
+        drift = 0
+        while True:
+            # refill: drop what was read, keep the unread tail
+            base += pos
+            f.seek(base)
+            buffer = f.read(self.chunk_size)
+            at_end = len(buffer) < self.chunk_size
+            pos = 0
+            n = len(buffer)
+            stop = min(n, limit - drift - base)
+            append = positions.append
+            refill = False
+            while True:
+                if pos + 3 > n:
+                    refill = True
+                    break
+                end = pos + 3 + (buffer[pos] | buffer[pos + 1] << 8)
+                if end > stop:
+                    refill = end > n
+                    break
+                if buffer[pos + 2] == MSG_TYPE_DATA and end - pos >= 5:
+                    append(pos)
+                    pos = end
+                    continue
+                # apply the data messages seen so far before anything else
+                yield from self._decode(buffer, base, positions, subscriptions, indexed, builder)
+                positions.clear()
+                resume, counted = self._apply(f, buffer, pos, end, base, subscriptions, indexed, builder)
+                if resume is None:
+                    break
+                drift = (drift + base + end if counted is None else counted) - resume
+                pos = resume - base
+                stop = min(n, limit - drift - base)
+            yield from self._decode(buffer, base, positions, subscriptions, indexed, builder)
+            positions.clear()
+            if not refill or at_end:
+                break
+        # the subscriptions of a segment end with it; pyulog pops them last to first
+        self._finished.extend(s for s in reversed(list(subscriptions.values())) if s.count > 0)
+        if builder is not None:
+            builder.finished.extend(s for s in reversed(list(indexed.values())) if s in builder.instances)
+
+    def _apply(
+        self,
+        f: BinaryIO,
+        buffer: bytes,
+        pos: int,
+        end: int,
+        base: int,
+        subscriptions: Dict[int, Subscription],
+        indexed: Dict[int, Subscription] | None = None,
+        builder: _IndexBuilder | None = None,
+    ) -> Tuple[int | None, int | None]:
+        """
+        Handles a message other than a well formed data message.
+
+        Returns:
+        - int | None: File offset to continue at, None where pyulog stops
+          reading the segment (a truncated message).
+        - int | None: The offset pyulog counts as read, if it is not the end
+          of the message.
+        """
+        msg_size, msg_type = _unpack_header(buffer, pos)
+        data = buffer[pos + 3 : end]
+        if _is_truncated(msg_type, data, self._errors):
+            return None, None
+        try:
+            if msg_type == MSG_TYPE_ADD_LOGGED_MSG:
+                msg_id = data[1] | data[2] << 8
+                name = data[3:].decode("utf-8", self._errors)
+                subscription = Subscription(msg_id, data[0], name, self._formats, self.fields.get(name))
+                if self.messages is None or subscription.name in self.messages:
+                    subscriptions[msg_id] = subscription
+                if indexed is not None:
+                    builder.readded |= msg_id in indexed
+                    indexed[msg_id] = subscription
+            elif msg_type not in _SKIPPED_TYPES and msg_type != MSG_TYPE_DROPOUT:
+                if self._is_corrupt(msg_type, msg_size):
+                    # advance by a single byte and look for a sync sequence
+                    if self._has_sync:
+                        found = self._find_sync(f, base + pos + 1)
+                        if found is not None:
+                            return found, base + pos + 1
+                    return base + pos + 1, base + pos + 1
+                if self._has_sync:
+                    # look for a sync sequence in the payload
+                    found = self._find_sync(f, base + pos + 3, msg_size)
+                    if found is not None:
+                        return found, None
+        except IndexError:
+            self.file_corrupt = True
+        return base + end, None
+
+    def _decode(
+        self,
+        buffer: bytes,
+        base: int,
+        positions: List[int],
+        subscriptions: Dict[int, Subscription],
+        indexed: Dict[int, Subscription] | None = None,
+        builder: _IndexBuilder | None = None,
+    ) -> Iterator[Tuple[Subscription, np.ndarray]]:
+        """
+        Gathers the records of the data messages at `positions` by topic and
+        passes the offsets of every topic's records to `builder`, if any.
+        """
+        if not positions:
+            return
+        raw = np.frombuffer(buffer, dtype=np.uint8)
+        starts = np.array(positions, dtype=np.int64)
+        msg_ids = raw[starts + 3].astype(np.int64) | raw[starts + 4].astype(np.int64) << 8
+        sizes = raw[starts].astype(np.int64) | raw[starts + 1].astype(np.int64) << 8
+        order = np.argsort(msg_ids, kind="stable")
+        ids, first = np.unique(msg_ids[order], return_index=True)
+        bounds = list(first) + [len(order)]
+        view = memoryview(buffer)
+        windowed = bool(self._time_s or self._time_e)
+        for k, msg_id in enumerate(ids.tolist()):
+            subscription = subscriptions.get(msg_id)
+            other = None if indexed is None else indexed.get(msg_id)
+            if subscription is not None:
+                selected = order[bounds[k] : bounds[k + 1]]
+                itemsize = subscription.dtype.itemsize
+                selected = selected[sizes[selected] == subscription.record_size + 2]
+                if selected.size:
+                    payloads = starts[selected] + 5
+                    subscription.count += len(payloads)
+                    if windowed:
+                        ended = self._windows.get(subscription, (False, False))[1]
+                        if other is subscription or not ended:
+                            # only the timestamps are read to place the window
+                            timestamps = _timestamps(subscription, raw, payloads)
+                            if other is subscription:
+                                builder.add(other, payloads + base, timestamps)
+                            window = self._window(subscription, timestamps)
+                            if window is not None:
+                                payloads = payloads[window[0] : window[1]]
+                                records = np.frombuffer(
+                                    _gather(view, payloads + subscription.offset, itemsize), dtype=subscription.dtype
+                                )
+                                yield subscription, records
+                    else:
+                        records = np.frombuffer(
+                            _gather(view, payloads + subscription.offset, itemsize), dtype=subscription.dtype
+                        )
+                        if other is subscription:
+                            builder.add(other, payloads + base, _timestamps(other, raw, payloads, records))
+                        yield subscription, records
+            if other is not None and other is not subscription:
+                selected = order[bounds[k] : bounds[k + 1]]
+                selected = selected[sizes[selected] == other.record_size + 2]
+                if selected.size:
+                    payloads = starts[selected] + 5
+                    builder.add(other, payloads + base, _timestamps(other, raw, payloads))
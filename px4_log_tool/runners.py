@@ -1,20 +1,30 @@
 #!/usr/bin python3
 import os
 import json
-from px4_log_tool.processing_modules.converter import convert_ros2bag2csv
+from px4_log_tool.processing_modules.converter import ULogDecodeError
 from px4_log_tool.processing_modules.metagen import get_file_metadata
+from px4_log_tool.processing_modules.tables import check_format
 from px4_log_tool.util.logger import log
 from px4_log_tool.util.components import (
     convert_dir_csv_db3,
+    convert_dir_db3_csv,
+    convert_dir_mcap_csv,
     dump_template_filter,
+    get_bag_dirs,
     get_csv_dirs,
+    get_mcap_files,
     get_msg_reference,
     extract_filter,
     get_ulog_files,
     convert_dir_ulog_csv,
+    convert_dir_ulog_db3,
     merge_csvs,
-    resample_unified,
-    adjust_topics,
+    resample_csvs,
+    resample_merged_csvs,
+    check_merge_params,
+    check_resample_params,
+    check_time_window,
+    check_whitelist_headers,
 )
 import shutil
 
@@ -22,6 +32,39 @@ import shutil
 FILTER = dict()
 
 
+def load_ulog_filter(
+    filter: str | None,
+    format: str = "csv",
+    time_s: float | None = None,
+    time_e: float | None = None,
+    verbose: bool = False,
+) -> bool:
+    """
+    Loads the filter of a ULog conversion into FILTER, applying the command
+    line time bounds, and validates it together with the output format.
+
+    Returns:
+    - bool: True if the conversion can go ahead.
+    """
+    global FILTER
+
+    FILTER = extract_filter(filter_str=filter, verbose=verbose)
+    if not check_format(format, verbose=verbose):
+        return False
+    # command line bounds take precedence over the filter's
+    if time_s is not None:
+        FILTER["time_window"]["start_s"] = time_s
+    if time_e is not None:
+        FILTER["time_window"]["end_s"] = time_e
+    if not check_time_window(FILTER["time_window"], verbose=verbose):
+        return False
+    if not check_merge_params(FILTER["merge_params"], verbose=verbose):
+        return False
+    if not check_resample_params(FILTER["resample_params"], verbose=verbose):
+        return False
+    return check_whitelist_headers(FILTER["whitelist_headers"], verbose=verbose)
+
+
 def ulog_csv(
     verbose: bool,
     ulog_dir: str,
@@ -30,38 +73,71 @@ def ulog_csv(
     merge: bool = False,
     clean: bool = False,
     resample: bool = False,
+    jobs: int | None = None,
+    checksum: bool = False,
+    force: bool = False,
+    format: str = "csv",
+    index: bool = True,
+    time_s: float | None = None,
+    time_e: float | None = None,
 ):
-    global FILTER
-
-    FILTER = extract_filter(filter_str=filter, verbose=verbose)
+    if not load_ulog_filter(filter, format, time_s, time_e, verbose=verbose):
+        return False
 
     ulog_files: list[tuple[str,str]] = get_ulog_files(ulog_dir=ulog_dir, verbose=verbose)
 
     if output_dir is None:
         output_dir = "./output_dir"
     convert_dir_ulog_csv(
-        ulog_files=ulog_files, output_dir=output_dir, filter=FILTER, verbose=verbose
+        ulog_files=ulog_files,
+        output_dir=output_dir,
+        filter=FILTER,
+        jobs=jobs,
+        checksum=checksum,
+        force=force,
+        format=format,
+        index=index,
+        ulog_dir=ulog_dir,
+        verbose=verbose,
     )
 
     if merge:
-        unified_df = merge_csvs(output_dir=output_dir, verbose=verbose)
+        unified = merge_csvs(
+            output_dir=output_dir,
+            jobs=jobs,
+            format=format,
+            merge_params=FILTER["merge_params"],
+            # the resampled missions are unified instead
+            unify=not resample,
+            verbose=verbose,
+        )
         msg_reference = get_msg_reference(verbose=verbose)
-        if resample and msg_reference is not None:
-            _ = resample_unified(
-                unified_df=unified_df,
+        if resample and unified is not None and msg_reference is not None:
+            resample_merged_csvs(
+                output_dir=output_dir,
                 msg_reference=msg_reference,
                 resample_params=FILTER["resample_params"],
-                in_place=True,
+                jobs=jobs,
+                format=format,
                 verbose=verbose,
             )
 
     if resample and not merge:
-        log("Cannot resample without merging!", log_level=2, verbosity=verbose)
+        msg_reference = get_msg_reference(verbose=verbose)
+        if msg_reference is not None:
+            resample_csvs(
+                output_dir=output_dir,
+                msg_reference=msg_reference,
+                resample_params=FILTER["resample_params"],
+                jobs=jobs,
+                format=format,
+                verbose=verbose,
+            )
 
     if clean:
         log("Cleaning directory and breadcrumbs.", verbosity=verbose, log_level=0)
         shutil.rmtree(output_dir)
-    return
+    return True
 
 
 def csv_db3(
@@ -69,6 +145,7 @@ def csv_db3(
     directory_address: str,
     filter: str,
     output_dir: str | None,
+    jobs: int | None = None,
 ):
     global FILTER
 
@@ -84,6 +161,8 @@ def csv_db3(
         output_dir=output_dir,
         topic_prefix=FILTER["bag_params"]["topic_prefix"],
         capitalise_topics=FILTER["bag_params"]["capitalise_topics"],
+        jobs=jobs,
+        msg_dir=FILTER["bag_params"]["msg_dir"],
         verbose=verbose,
     )
     return
@@ -94,17 +173,36 @@ def ulog_db3(
     directory_address: str,
     filter: str,
     output_dir: str | None,
+    jobs: int | None = None,
+    checksum: bool = False,
+    force: bool = False,
+    format: str = "csv",
+    index: bool = True,
+    time_s: float | None = None,
+    time_e: float | None = None,
+    csv: bool = True,
 ):
-    global FILTER
-
+    if not load_ulog_filter(filter, format, time_s, time_e, verbose=verbose):
+        return
     if output_dir is None:
         output_dir = "./output_dir"
-    ulog_csv(verbose=verbose, ulog_dir=directory_address, filter=filter, output_dir=output_dir)
 
-    log("ROS 2 Bag topics will be adjusted.", log_level=0, verbosity=verbose)
-    adjust_topics(verbose=verbose, directory_address=output_dir, filter=FILTER)
+    ulog_files: list[tuple[str,str]] = get_ulog_files(ulog_dir=directory_address, verbose=verbose)
 
-    csv_db3(verbose=verbose, directory_address=output_dir, filter=filter, output_dir=f"{output_dir}_bags")
+    log("ROS 2 Bag topics will be adjusted.", log_level=0, verbosity=verbose)
+    convert_dir_ulog_db3(
+        ulog_files=ulog_files,
+        output_dir=output_dir,
+        filter=FILTER,
+        csv=csv,
+        jobs=jobs,
+        checksum=checksum,
+        force=force,
+        format=format,
+        index=index,
+        ulog_dir=directory_address,
+        verbose=verbose,
+    )
     return
 
 
@@ -112,12 +210,69 @@ def db3_csv(
     verbose: bool,
     directory_address: str,
     filter: str,
+    output_dir: str | None = None,
+    jobs: int | None = None,
+    time_s: float | None = None,
+    time_e: float | None = None,
+    create_index: bool = False,
 ):
     global FILTER
 
-    FILTER = extract_filter(filter_str=filter, verbose=verbose)
+    # unlike for .ulog files, all topics of a bag are converted unless whitelisted
+    FILTER = extract_filter(filter_str=filter, verbose=verbose, defaults={"whitelist_messages": []})
+    if time_s is not None:
+        FILTER["time_window"]["start_s"] = time_s
+    if time_e is not None:
+        FILTER["time_window"]["end_s"] = time_e
+    if not check_time_window(FILTER["time_window"], verbose=verbose):
+        return
+
+    bag_dirs = get_bag_dirs(bag_dir=directory_address, verbose=verbose)
+
+    if output_dir is None:
+        log(".csv files will be created in-place, in the topic_csvs directory of each bag.", log_level=1, verbosity=verbose)
+
+    convert_dir_db3_csv(
+        bag_dirs=bag_dirs,
+        output_dir=output_dir,
+        filter=FILTER,
+        jobs=jobs,
+        create_index=create_index,
+        verbose=verbose,
+    )
+    return
 
-    convert_ros2bag2csv(bag_file_address=directory_address, verbose=verbose)
+def mcap_csv(
+    verbose: bool,
+    directory_address: str,
+    filter: str,
+    output_dir: str | None,
+    jobs: int | None = None,
+    time_s: float | None = None,
+    time_e: float | None = None,
+):
+    global FILTER
+
+    # as for bags, all topics are converted unless whitelisted
+    FILTER = extract_filter(filter_str=filter, verbose=verbose, defaults={"whitelist_messages": []})
+    if time_s is not None:
+        FILTER["time_window"]["start_s"] = time_s
+    if time_e is not None:
+        FILTER["time_window"]["end_s"] = time_e
+    if not check_time_window(FILTER["time_window"], verbose=verbose):
+        return
+
+    mcap_files = get_mcap_files(mcap_dir=directory_address, verbose=verbose)
+
+    if output_dir is None:
+        output_dir = "./output_dir"
+    convert_dir_mcap_csv(
+        mcap_files=mcap_files,
+        output_dir=output_dir,
+        filter=FILTER,
+        jobs=jobs,
+        verbose=verbose,
+    )
     return
 
 def generate_ulog_metadata(verbose: bool, directory_address: str, filter: str):
@@ -131,7 +286,11 @@ def generate_ulog_metadata(verbose: bool, directory_address: str, filter: str):
             mission_data = []
             for file in filenames:
                 if file.split(".")[-1] == "ulg" or file.split(".")[-1] == "ulog":
-                    mission_metadata = get_file_metadata(metadata_fields, dirpath, file)
+                    try:
+                        mission_metadata = get_file_metadata(metadata_fields, dirpath, file)
+                    except ULogDecodeError as e:
+                        log(f"{e} Skipping it.", verbosity=verbose, log_level=2)
+                        continue
                     mission_metadata["mission_name"] = file.split(".")[0]
                     mission_data.append(mission_metadata)
             mission_data.sort(key=lambda x: x["mission_name"])
@@ -1,95 +1,148 @@
 #!/usr/bin python3
 import os
+import shutil
 from copy import deepcopy
-from multiprocessing import Process
 from typing import Any, Dict
 from px4_log_tool.util.logger import log
 from px4_log_tool.util.tui import progress_bar
-from px4_log_tool.processing_modules.converter import convert_csv2ros2bag, convert_ulog2csv
-from px4_log_tool.processing_modules.merger import merge_csv
-from px4_log_tool.processing_modules.resampler import resample_data, adjust_topic_rate
+from px4_log_tool.util.scheduler import map_ordered, path_size, run_tasks
+from px4_log_tool.util.manifest import (
+    BAG_KEYS,
+    CONVERSION_KEYS,
+    file_checksum,
+    filter_hash,
+    is_fresh,
+    load_manifest,
+    save_manifest,
+    ulog_fingerprint,
+)
+from px4_log_tool.processing_modules.converter import (
+    bag_topic_sizes,
+    convert_csv2ros2bag,
+    convert_mcap2csv,
+    convert_ros2bag2csv,
+    convert_ulog2csv,
+    convert_ulog2ros2bag,
+    csv_output_dir,
+)
+from px4_log_tool.processing_modules.db3 import is_bag_dir
+from px4_log_tool.processing_modules.merger import DERIVED_TABLES, merge_csv, unify_tables
+from px4_log_tool.processing_modules.resampler import (
+    PYRAMID_DIR,
+    classify_labels,
+    dataclass_lookup,
+    pyramid_columns,
+    pyramid_edges,
+    resample_data,
+    resample_topics,
+    write_pyramid,
+)
+from px4_log_tool.processing_modules.tables import is_table, list_tables, read_table, table_name, table_stem, write_frame
 
 import pandas as pd
 import yaml
 
+def _resample_mission(
+    mission: str,
+    merged_df: pd.DataFrame,
+    resample_params: Dict[str, Any],
+    num_labels: list[str],
+    cat_labels: list[str],
+) -> pd.DataFrame:
+    """
+    Resamples the rows of one mission of a unified dataframe (see `resample_unified`),
+    labelled `mission` in the "mission_name" column.
+    """
+    merged_df = resample_data(
+        merged_df.drop(columns="mission_name"),
+        resample_params["target_frequency_hz"],
+        resample_params["num_method"],
+        resample_params["cat_method"],
+        resample_params["interpolate_numerical"],
+        resample_params["interpolate_method"],
+        num_labels,
+        cat_labels,
+        verbose=False,
+    )
+    merged_df.insert(0, "mission_name", mission)
+    return merged_df
+
+
+def _resample_merged(
+    root: str,
+    resample_params: Dict[str, Any],
+    dataclasses: Dict[str, str],
+    format: str = "csv",
+) -> None:
+    """
+    Resamples the merged table of one mission into its 'resampled' table
+    (see `resample_merged_csvs`), and writes its pyramid if `pyramid_levels_hz` are given.
+    """
+    merged_df = read_table(os.path.join(root, table_name("merged", format)))
+    num_labels, cat_labels = classify_labels(list(merged_df.columns), dataclasses)
+    levels_hz = resample_params.get("pyramid_levels_hz") or []
+    if levels_hz and len(merged_df) > 0:
+        timestamps = merged_df["timestamp"].to_numpy()
+        edges = pyramid_edges(int(timestamps.min()), int(timestamps.max()), levels_hz)
+        levels = pyramid_columns(edges, timestamps, {label: merged_df[label].to_numpy() for label in num_labels})
+        raw = [table for table in list_tables(root) if table_stem(table) not in DERIVED_TABLES]
+        write_pyramid(root, levels_hz, edges, levels, raw, format)
+    mission = "/".join(os.path.normpath(root).split(os.sep))
+    resampled_df = _resample_mission(mission, merged_df, resample_params, num_labels, cat_labels)
+    write_frame(resampled_df, os.path.join(root, table_name("resampled", format)))
+
+
 def resample_unified(
     unified_df: pd.DataFrame,
     msg_reference: pd.DataFrame,
     resample_params: Dict[str, Any],
     in_place: bool = False,
+    format: str = "csv",
+    jobs: int | None = None,
     verbose: bool = False,
 ) -> pd.DataFrame | pd.Series:
     """Resamples a unified dataframe based on the message reference and
     resample parameters.
 
-    This function iterates through each mission in the unified dataframe,
-    identifies numerical and categorical labels based on a provided message
-    reference, and then applies the `resample_data` function to resample the
-    data for each mission. The resampled dataframes are then concatenated into
-    a single dataframe and returned.
+    The unified dataframe is split by mission in a single pass, its labels
+    are classified as numerical or categorical once through an Alias ->
+    Dataclass dictionary, and the missions are resampled in parallel with
+    `resample_data`. The resampled dataframes are concatenated once, in
+    mission name order, and returned.
 
     Args:
     - unified_df (pd.DataFrame): The unified dataframe to be resampled.
     - msg_reference (pd.DataFrame): A dataframe containing message references (Alias, Dataclass).
     - resample_params (dict): A dictionary containing resampling parameters:
+    - in_place (bool): Overwrite the unified table in the current directory.
+    - format (str): Format of the unified table ("csv", "npy" or "arrow").
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
     - verbose (bool): Verbose output.
 
     Returns:
     - pd.DataFrame: The resampled dataframe.
     """
-    reference = deepcopy(msg_reference)
-    num_labels = []
-    cat_labels = []
-    mission_names = sorted(unified_df["mission_name"].unique())
+    num_labels, cat_labels = classify_labels(list(unified_df.columns), dataclass_lookup(msg_reference))
+    missions = list(unified_df.groupby("mission_name", sort=True))
 
-    resampled_df = pd.DataFrame()
-
-    i = 0
     log("Resampling Progress:", verbosity=verbose, log_level=0,bold=True)
-    progress_bar(i / (len(mission_names) + 1), verbose=verbose)
-
-    for mission in mission_names:
-        merged_df = unified_df[unified_df["mission_name"] == mission]
-        for label in merged_df.columns:
-            if label == "timestamp" or label == "mission_name":
-                continue
-            msg, param = label.split("_", maxsplit=1)
-            if msg[-1].isdigit():
-                msg = msg[:-1]
-            label_dc = reference[reference["Alias"] == f"{msg}_{param}"]
-            label_dc = label_dc.reset_index(drop=True)
-            dc = label_dc["Dataclass"]
-            if dc.size < 1:
-                continue
-            if dc.iloc[0] == "Numerical":
-                num_labels.append(label)
-            else:
-                cat_labels.append(label)
-
-        merged_df = resample_data(
-            merged_df[merged_df.columns[1:]].copy(),
-            resample_params["target_frequency_hz"],
-            resample_params["num_method"],
-            resample_params["cat_method"],
-            resample_params["interpolate_numerical"],
-            resample_params["interpolate_method"],
-            num_labels,
-            cat_labels,
-            verbose=False,
-        )
-        merged_df["mission_name"] = mission
-        merged_df = merged_df[["mission_name"] + list(merged_df.columns)[:-1]]
-        num_labels = []
-        cat_labels = []
-        resampled_df = pd.concat([resampled_df, merged_df])
+    progress_bar(0, verbose=verbose)
 
-        i += 1
-        progress_bar(i / (len(mission_names) + 1), verbose=verbose)
+    resampled = []
+    results = map_ordered(
+        _resample_mission,
+        ((mission, merged_df, resample_params, num_labels, cat_labels) for mission, merged_df in missions),
+        jobs=jobs,
+    )
+    for i, merged_df in enumerate(results, start=1):
+        resampled.append(merged_df)
+        progress_bar(i / (len(missions) + 1), verbose=verbose)
+    del missions
 
+    resampled_df = pd.concat(resampled) if resampled else pd.DataFrame()
     if in_place:
-        resampled_df.to_csv("unified.csv", index=False)
-    i += 1
-    progress_bar(i / (len(mission_names) + 1), verbose=verbose)
+        write_frame(resampled_df, table_name("unified", format))
+    progress_bar(1, verbose=verbose)
     return resampled_df
 
 def get_msg_reference(verbose: bool = False):
@@ -115,6 +168,14 @@ DEFAULT_FILTER_CONFIG = {
         "default": ["timestamp_sample", "device_id", "error_count"],
         "description": "Blacklisted headers"
     },
+    "whitelist_headers": {
+        "default": {},
+        "description": "Whitelisted headers per topic"
+    },
+    "time_window": {
+        "default": {"start_s": None, "end_s": None},
+        "description": "Extraction time window [s]"
+    },
     "resample_params": {
         "default": {
             "target_frequency_hz": 10,
@@ -122,16 +183,28 @@ DEFAULT_FILTER_CONFIG = {
             "cat_method": "ffill",
             "interpolate_numerical": True,
             "interpolate_method": "linear",
+            "pyramid_levels_hz": [],
         },
         "description": "Resampling parameters"
         # sub_keys_check is removed as the logic now always merges,
         # defaulting only missing sub-keys.
     },
+    "merge_params": {
+        "default": {
+            "mode": "outer",
+            "reference": None,
+            "frequency_hz": 100,
+            "direction": "backward",
+            "tolerance_s": None,
+        },
+        "description": "Merging parameters"
+    },
     "bag_params": {
         "default": {
             "topic_prefix": "/fmu/out",
             "topic_max_frequency_hz": 100,
             "capitalise_topics": False,
+            "msg_dir": None,
         },
         "description": "ROS 2 bag parameters"
     },
@@ -175,7 +248,7 @@ def dump_template_filter(file_path: str, verbose: bool = False):
         log(f"Error writing template file to {filter_path}: {e}", verbosity=verbose, log_level=1)
 
 
-def extract_filter(filter_str: str | None, verbose: bool = False):
+def extract_filter(filter_str: str | None, verbose: bool = False, defaults: dict | None = None):
     """
     Extracts filter parameters from a YAML file, applying defaults from
     DEFAULT_FILTER_CONFIG for missing or incomplete sections.
@@ -184,6 +257,8 @@ def extract_filter(filter_str: str | None, verbose: bool = False):
     - filter_file_path (str, optional): Path to the YAML filter file.
                                        If None, all default values are used.
     - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+    - defaults (dict, optional): Section -> default value of the command,
+      replacing that of DEFAULT_FILTER_CONFIG.
 
     Returns:
     - dict: The loaded and defaulted filter configuration.
@@ -222,7 +297,7 @@ def extract_filter(filter_str: str | None, verbose: bool = False):
     final_filter_config = {}
 
     for key, schema_item in DEFAULT_FILTER_CONFIG.items():
-        default_value_for_key = deepcopy(schema_item["default"])
+        default_value_for_key = deepcopy((defaults or {}).get(key, schema_item["default"]))
         description = schema_item["description"]
         
         section_value_to_assign = None
@@ -246,7 +321,8 @@ def extract_filter(filter_str: str | None, verbose: bool = False):
                     merged_section = deepcopy(default_value_for_key)
                     
                     for user_sub_key in user_section_data:
-                        if user_sub_key not in merged_section: # Check against keys in the default dict
+                        # sections without default sub-keys (e.g. per topic settings) take any
+                        if default_value_for_key and user_sub_key not in merged_section: # Check against keys in the default dict
                             log(f"Info: User-provided sub-key '{user_sub_key}' in section '{key}' of {config_source_name} is not defined in the default schema for this section. It will be included.", verbosity=verbose, log_level=0)
                     
                     merged_section.update(user_section_data)
@@ -287,6 +363,99 @@ def extract_filter(filter_str: str | None, verbose: bool = False):
     return final_filter_config
 
 
+def check_whitelist_headers(whitelist_headers: dict, verbose: bool = False) -> bool:
+    """
+    Checks the `whitelist_headers` section of a filter configuration.
+
+    Args:
+    - whitelist_headers (dict): Topic name -> list of field names to keep.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - bool: True if every topic maps to a list of field names.
+    """
+    for topic, fields in whitelist_headers.items():
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            log(f"Invalid whitelist_headers entry for '{topic}': expected a list of field names.", verbosity=verbose, log_level=2)
+            return False
+    return True
+
+
+def check_time_window(time_window: dict, verbose: bool = False) -> bool:
+    """
+    Checks the `time_window` section of a filter configuration.
+
+    Args:
+    - time_window (dict): {"start_s": seconds or None, "end_s": seconds or None}.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - bool: True if the bounds are unset or non-negative numbers, start before end.
+    """
+    bounds = [time_window.get("start_s"), time_window.get("end_s")]
+    for key, value in zip(("start_s", "end_s"), bounds):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+            log(f"Invalid time_window.{key} '{value}': expected a non-negative number of seconds.", verbosity=verbose, log_level=2)
+            return False
+    if None not in bounds and bounds[0] >= bounds[1]:
+        log(f"Invalid time window: start ({bounds[0]} s) must be before end ({bounds[1]} s).", verbosity=verbose, log_level=2)
+        return False
+    return True
+
+
+def check_resample_params(resample_params: dict, verbose: bool = False) -> bool:
+    """
+    Checks the frequencies of the `resample_params` section of a filter configuration.
+
+    Args:
+    - resample_params (dict): {"target_frequency_hz", "pyramid_levels_hz", ...}.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - bool: True if the target frequency and the pyramid levels are positive numbers.
+    """
+    levels = resample_params["pyramid_levels_hz"] or []
+    if not isinstance(levels, list):
+        log(f"Invalid resample_params.pyramid_levels_hz '{levels}': expected a list of frequencies.", verbosity=verbose, log_level=2)
+        return False
+    for key, value in [("target_frequency_hz", resample_params["target_frequency_hz"])] + [("pyramid_levels_hz", level) for level in levels]:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            log(f"Invalid resample_params.{key} '{value}': expected a positive number.", verbosity=verbose, log_level=2)
+            return False
+    return True
+
+
+def check_merge_params(merge_params: dict, verbose: bool = False) -> bool:
+    """
+    Checks the `merge_params` section of a filter configuration.
+
+    Args:
+    - merge_params (dict): {"mode", "reference", "frequency_hz", "direction", "tolerance_s"}.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - bool: True if the mode and direction are known and the reference, rate and tolerance are valid.
+    """
+    if merge_params["mode"] not in ("outer", "asof"):
+        log(f"Invalid merge_params.mode '{merge_params['mode']}': expected 'outer' or 'asof'.", verbosity=verbose, log_level=2)
+        return False
+    if merge_params["direction"] not in ("backward", "nearest"):
+        log(f"Invalid merge_params.direction '{merge_params['direction']}': expected 'backward' or 'nearest'.", verbosity=verbose, log_level=2)
+        return False
+    if merge_params["reference"] is not None and not isinstance(merge_params["reference"], str):
+        log(f"Invalid merge_params.reference '{merge_params['reference']}': expected a topic name.", verbosity=verbose, log_level=2)
+        return False
+    frequency = merge_params["frequency_hz"]
+    if isinstance(frequency, bool) or not isinstance(frequency, (int, float)) or frequency <= 0:
+        log(f"Invalid merge_params.frequency_hz '{frequency}': expected a positive number.", verbosity=verbose, log_level=2)
+        return False
+    tolerance = merge_params["tolerance_s"]
+    if tolerance is not None and (isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)) or tolerance < 0):
+        log(f"Invalid merge_params.tolerance_s '{tolerance}': expected a non-negative number of seconds.", verbosity=verbose, log_level=2)
+        return False
+    return True
+
+
 def get_ulog_files(ulog_dir: str, verbose: bool = False) -> list[tuple[str,str]]:
     """
     Retrieves a list of `.ulog` files from the specified directory.
@@ -311,158 +480,657 @@ def get_ulog_files(ulog_dir: str, verbose: bool = False) -> list[tuple[str,str]]
 def get_csv_dirs(csv_dir: str, verbose: bool = False) -> list[str]:
     csv_dirs: list[str] = []
     for root, subdirs, files in os.walk(csv_dir):
+        # npy tables are directories, and pyramids are derived tables; do not descend into them
+        subdirs[:] = [subdir for subdir in subdirs if not is_table(root, subdir) and subdir != PYRAMID_DIR]
         if not subdirs:
-            if all(file.endswith(".csv") for file in files):
+            if all(is_table(root, file) for file in files):
                 csv_dirs.append(root)
     log(msg=f"Converting [{len(csv_dirs)}] .csv directories.", verbosity=verbose, log_level=0)
     return csv_dirs
 
-def convert_dir_ulog_csv(ulog_files: list[tuple[str,str]], output_dir: str, filter: dict, verbose: bool = False):
+def _removed_ulogs(entries: dict, ulog_dir: str | None, ulog_files: list[tuple[str,str]]) -> list[tuple[str,str]]:
+    """
+    Returns the manifest entries, as (path, filename) tuples, of `.ulog` files
+    that were removed from `ulog_dir`: those under it that no longer exist.
+    Entries of other input trees are kept.
+    """
+    if ulog_dir is None:
+        return []
+    found = {os.path.join(root, file) for root, file in ulog_files}
+    base = os.path.abspath(ulog_dir)
+    removed = []
+    for path in entries:
+        if path in found or os.path.exists(path):
+            continue
+        if os.path.commonpath([base, os.path.abspath(path)]) == base:
+            removed.append((os.path.dirname(path), os.path.basename(path)))
+    return removed
+
+
+def _remove_outputs(path: str, output_dir: str) -> None:
+    """Removes an output directory, and its parents up to `output_dir` that are left empty."""
+    shutil.rmtree(path, ignore_errors=True)
+    parent = os.path.dirname(path)
+    while parent and os.path.abspath(parent) != os.path.abspath(output_dir):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def convert_dir_ulog_csv(
+    ulog_files: list[tuple[str,str]],
+    output_dir: str,
+    filter: dict,
+    jobs: int | None = None,
+    checksum: bool = False,
+    force: bool = False,
+    format: str = "csv",
+    index: bool = True,
+    ulog_dir: str | None = None,
+    verbose: bool = False,
+) -> list[str]:
     """
     Converts a list of `.ulog` files to `.csv` files in parallel.
 
+    A manifest in `output_dir` records the fingerprint of every converted
+    `.ulog` file and the filter it was converted with. Files whose
+    fingerprint, filter and output format are unchanged since the last run are skipped;
+    the outputs of changed files are removed before they are converted again,
+    and those of files removed from `ulog_dir` are removed altogether.
+
     Args:
     - ulog_files (list[str]): A list of tuples, where each tuple contains the file path and filename.
     - output_dir (str): The output directory for the converted `.csv` files.
+    - filter (dict): Filter configuration.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - checksum (bool, optional): Record content hashes, so that files whose modification
+      time changed but whose content did not are skipped as well. Defaults to False.
+    - force (bool, optional): Convert every file regardless of the manifest. Defaults to False.
+    - format (str, optional): Output table format ("csv", "npy" or "arrow"). Defaults to "csv".
+    - index (bool, optional): Use and build the cached index of each `.ulog` file. Defaults to True.
+    - ulog_dir (str, optional): Directory tree `ulog_files` were collected from, whose
+      removed files are dropped from the manifest. None to keep all entries.
     - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: The `.ulog` files that failed to convert.
     """
 
-    processes: list[Process] = []
+    entries = load_manifest(output_dir, verbose=verbose)
+    filter_digest = filter_hash(filter)
+
+    pending: list[tuple[str,str]] = []
+    fingerprints = {}
     for file in ulog_files:
-        process = Process(
-            target=convert_ulog2csv,
-            args=(
+        path = os.path.join(file[0], file[1])
+        csv_dir = csv_output_dir(os.path.join(output_dir, file[0]), file[1])
+        fingerprints[path] = ulog_fingerprint(path)
+        if (
+            not force
+            and os.path.isdir(csv_dir)
+            and is_fresh(entries.get(path), path, fingerprints[path], filter_digest, checksum, format)
+        ):
+            continue
+        # invalidate the outputs of a previous conversion
+        if entries.pop(path, None) is not None:
+            shutil.rmtree(csv_dir, ignore_errors=True)
+        pending.append(file)
+
+    removed = _removed_ulogs(entries, ulog_dir, ulog_files)
+    for file in removed:
+        del entries[os.path.join(file[0], file[1])]
+        _remove_outputs(csv_output_dir(os.path.join(output_dir, file[0]), file[1]), output_dir)
+    if removed:
+        log(f"Removed the outputs of [{len(removed)}] removed .ulog files.", verbosity=verbose, log_level=0)
+
+    if len(pending) < len(ulog_files):
+        log(f"Skipping [{len(ulog_files) - len(pending)}] unchanged .ulog files.", verbosity=verbose, log_level=0)
+
+    tasks = [
+        (
+            os.path.join(file[0], file[1]),
+            (
                 file[0],
                 file[1],
                 filter["whitelist_messages"],
                 os.path.join(output_dir, file[0]),
                 filter["blacklist_headers"],
                 ",",
-                None,
-                None,
+                filter["time_window"]["start_s"],
+                filter["time_window"]["end_s"],
+                False,
+                verbose,
                 False,
-                verbose
+                format,
+                index,
+                filter["whitelist_headers"],
             ),
         )
-        processes.append(process)
-        process.start()
-
-    i = 0
-    total = len(processes)
-    log("Conversion Progress:", verbosity=verbose, log_level=0,bold=True)
-    for process in processes:
-        process.join()
-        i += 1
-        progress_bar(i / total, verbose)
-    log("", verbosity=verbose, log_level=0, color=False,timestamped=False)
-    return
-
-
-def convert_dir_csv_db3(csv_dirs: list[str], output_dir: str, topic_prefix: str, capitalise_topics: bool, verbose: bool = False):
-
-    processes = []
-    for dir in csv_dirs:
-        process = Process(
-            target=convert_csv2ros2bag,
-            args=(
+        for file in pending
+    ]
+    failed = run_tasks(
+        convert_ulog2csv,
+        tasks,
+        jobs=jobs,
+        sizes=[fingerprints[task[0]]["size"] for task in tasks],
+        title="Conversion Progress:",
+        verbose=verbose,
+    )
+
+    for path, _ in tasks:
+        if path in failed:
+            continue
+        entries[path] = dict(fingerprints[path], filter=filter_digest, format=format)
+        if checksum:
+            entries[path]["sha256"] = file_checksum(path)
+    save_manifest(output_dir, entries)
+    return failed
+
+
+def get_bag_dirs(bag_dir: str, verbose: bool = False) -> list[str]:
+    """
+    Retrieves the ROS 2 bag directories (holding `.db3` files) in a directory tree.
+
+    Args:
+    - bag_dir (str): Path to a bag directory, or to a directory tree of them.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: The bag directories, sorted.
+    """
+    bag_dirs: list[str] = []
+    for root, subdirs, _ in os.walk(bag_dir):
+        if is_bag_dir(root):
+            bag_dirs.append(root)
+            # the files of a split bag are all in its directory
+            subdirs[:] = []
+    bag_dirs.sort()
+    log(msg=f"Converting [{len(bag_dirs)}] .db3 bags.", verbosity=verbose, log_level=0)
+    return bag_dirs
+
+
+def convert_dir_db3_csv(
+    bag_dirs: list[str],
+    output_dir: str | None,
+    filter: dict,
+    jobs: int | None = None,
+    create_index: bool = False,
+    verbose: bool = False,
+) -> list[str]:
+    """
+    Converts ROS 2 bags to `.csv` files in parallel.
+
+    Bags whose files are indexed by topic are split into one work unit per
+    topic, so that the topics of a large bag are converted on all workers;
+    other bags are converted in a single pass each, as reading a topic from
+    them means scanning the whole bag.
+
+    Args:
+    - bag_dirs (list[str]): Bag directories.
+    - output_dir (str, optional): Root of the mirror tree of `.csv` directories.
+      If None, the `.csv` files are written to "topic_csvs" in each bag directory.
+    - filter (dict): Filter configuration.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - create_index (bool, optional): Index the bags by topic first, where they are not yet.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: The bags (or bag topics) that failed to convert.
+    """
+    bag_params = filter["bag_params"]
+    tasks = []
+    sizes = []
+    for bag_dir in bag_dirs:
+        csv_dir = None if output_dir is None else os.path.join(output_dir, bag_dir)
+        topic_sizes = bag_topic_sizes(
+            bag_dir,
+            filter["whitelist_messages"],
+            bag_params["topic_prefix"],
+            bag_params["capitalise_topics"],
+            create_index,
+            verbose,
+        )
+        if topic_sizes is None:
+            units = [(bag_dir, None, path_size(bag_dir))]
+        else:
+            units = [(f"{bag_dir}:{topic}", [topic], size) for topic, size in topic_sizes.items()]
+        for label, topics, size in units:
+            tasks.append(
+                (
+                    label,
+                    (
+                        bag_dir,
+                        verbose,
+                        bag_params["msg_dir"],
+                        filter["whitelist_messages"],
+                        filter["blacklist_headers"],
+                        filter["time_window"]["start_s"],
+                        filter["time_window"]["end_s"],
+                        bag_params["topic_prefix"],
+                        bag_params["capitalise_topics"],
+                        False,
+                        csv_dir,
+                        topics,
+                    ),
+                )
+            )
+            sizes.append(size)
+    return run_tasks(
+        convert_ros2bag2csv,
+        tasks,
+        jobs=jobs,
+        sizes=sizes,
+        title="Conversion Progress:",
+        verbose=verbose,
+    )
+
+
+def get_mcap_files(mcap_dir: str, verbose: bool = False) -> list[tuple[str, str]]:
+    """
+    Retrieves a list of `.mcap` files from the specified directory.
+
+    Args:
+    - mcap_dir (str): Path to the directory containing `.mcap` files.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: A list of tuples, where each tuple contains the file path and filename.
+    """
+    mcap_files: list[tuple[str, str]] = []
+    for root, _, files in os.walk(mcap_dir):
+        for file in sorted(files):
+            if file.split(".")[-1] == "mcap":
+                mcap_files.append((root, file))
+
+    log(msg=f"Converting [{len(mcap_files)}] .mcap files.", verbosity=verbose, log_level=0)
+    return mcap_files
+
+
+def convert_dir_mcap_csv(
+    mcap_files: list[tuple[str, str]],
+    output_dir: str,
+    filter: dict,
+    jobs: int | None = None,
+    verbose: bool = False,
+) -> list[str]:
+    """
+    Converts a list of `.mcap` files to `.csv` files, one file after the
+    other, each decoded on all workers (chunks of a file are independent).
+
+    The `.csv` files of "<dir>/<name>.mcap" are written to "<output_dir>/<dir>/<name>".
+
+    Args:
+    - mcap_files (list[str]): A list of tuples, where each tuple contains the file path and filename.
+    - output_dir (str): The output directory for the converted `.csv` files.
+    - filter (dict): Filter configuration.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: The `.mcap` files that failed to convert.
+    """
+    bag_params = filter["bag_params"]
+    failed = []
+    log("Conversion Progress:", verbosity=verbose, log_level=0, bold=True)
+    for i, (root, file) in enumerate(mcap_files):
+        path = os.path.join(root, file)
+        try:
+            converted = convert_mcap2csv(
+                path,
+                os.path.join(output_dir, root, os.path.splitext(file)[0]),
+                filter["whitelist_messages"],
+                filter["blacklist_headers"],
+                filter["time_window"]["start_s"],
+                filter["time_window"]["end_s"],
+                bag_params["topic_prefix"],
+                bag_params["capitalise_topics"],
+                bag_params["msg_dir"],
+                jobs,
+                verbose,
+            )
+        except Exception as e:
+            log(f"Issue with converting file {path}: {e}.", verbosity=verbose, log_level=2)
+            converted = False
+        if not converted:
+            failed.append(path)
+        progress_bar((i + 1) / len(mcap_files), verbose)
+    log("", verbosity=verbose, log_level=0, color=False, timestamped=False)
+    if failed:
+        log(f"[{len(failed)}/{len(mcap_files)}] .mcap files failed.", verbosity=verbose, log_level=2)
+    return failed
+
+
+def convert_dir_csv_db3(csv_dirs: list[str], output_dir: str, topic_prefix: str, capitalise_topics: bool, jobs: int | None = None, msg_dir: str | None = None, verbose: bool = False) -> list[str]:
+
+    tasks = [
+        (
+            dir,
+            (
                 dir,
                 os.path.join(output_dir, dir),
                 topic_prefix,
                 capitalise_topics,
-                verbose
-            )
+                verbose,
+                msg_dir,
+            ),
+        )
+        for dir in csv_dirs
+    ]
+    return run_tasks(
+        convert_csv2ros2bag,
+        tasks,
+        jobs=jobs,
+        sizes=[path_size(dir) for dir in csv_dirs],
+        title="Conversion Progress:",
+        verbose=verbose,
+    )
+
+
+def convert_dir_ulog_db3(
+    ulog_files: list[tuple[str,str]],
+    output_dir: str,
+    filter: dict,
+    csv: bool = True,
+    jobs: int | None = None,
+    checksum: bool = False,
+    force: bool = False,
+    format: str = "csv",
+    index: bool = True,
+    ulog_dir: str | None = None,
+    verbose: bool = False,
+) -> list[str]:
+    """
+    Converts a list of `.ulog` files directly to ROS 2 bags in parallel.
+
+    The bags are written to the mirror tree "<output_dir>_bags", and with
+    `csv` the topic tables to `output_dir`, as by `convert_dir_ulog_csv`.
+    Each tree keeps its own manifest; files whose outputs are fresh in all of
+    them are skipped, and the outputs of files removed from `ulog_dir` are removed.
+
+    Args:
+    - ulog_files (list[str]): A list of tuples, where each tuple contains the file path and filename.
+    - output_dir (str): The output directory for the converted `.csv` files.
+    - filter (dict): Filter configuration.
+    - csv (bool, optional): Also write the topic tables. Defaults to True.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - checksum (bool, optional): Record content hashes, so that files whose modification
+      time changed but whose content did not are skipped as well. Defaults to False.
+    - force (bool, optional): Convert every file regardless of the manifests. Defaults to False.
+    - format (str, optional): Output table format ("csv", "npy" or "arrow"). Defaults to "csv".
+    - index (bool, optional): Use and build the cached index of each `.ulog` file. Defaults to True.
+    - ulog_dir (str, optional): Directory tree `ulog_files` were collected from, whose
+      removed files are dropped from the manifests. None to keep all entries.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: The `.ulog` files that failed to convert.
+    """
+    bag_dir = f"{output_dir}_bags"
+    roots = [bag_dir, output_dir] if csv else [bag_dir]
+    manifests = {root: load_manifest(root, verbose=verbose) for root in roots}
+    filter_digests = {root: filter_hash(filter, BAG_KEYS if root == bag_dir else CONVERSION_KEYS) for root in roots}
+
+    def outputs(root: str, file: tuple[str,str]) -> str:
+        csv_dir = csv_output_dir(os.path.join(output_dir, file[0]), file[1])
+        if root == output_dir:
+            return csv_dir
+        # the bag of a table directory is written into its mirror directory
+        return os.path.join(bag_dir, csv_dir, os.path.basename(csv_dir))
+
+    pending: list[tuple[str,str]] = []
+    fingerprints = {}
+    for file in ulog_files:
+        path = os.path.join(file[0], file[1])
+        fingerprints[path] = ulog_fingerprint(path)
+        if not force and all(
+            os.path.isdir(outputs(root, file))
+            and is_fresh(manifests[root].get(path), path, fingerprints[path], filter_digests[root], checksum, format)
+            for root in roots
+        ):
+            continue
+        # invalidate the outputs of a previous conversion
+        for root in roots:
+            if manifests[root].pop(path, None) is not None:
+                shutil.rmtree(outputs(root, file), ignore_errors=True)
+        pending.append(file)
+
+    removed = set()
+    for root in roots:
+        for file in _removed_ulogs(manifests[root], ulog_dir, ulog_files):
+            del manifests[root][os.path.join(file[0], file[1])]
+            _remove_outputs(outputs(root, file), root)
+            removed.add(file)
+    if removed:
+        log(f"Removed the outputs of [{len(removed)}] removed .ulog files.", verbosity=verbose, log_level=0)
+
+    if len(pending) < len(ulog_files):
+        log(f"Skipping [{len(ulog_files) - len(pending)}] unchanged .ulog files.", verbosity=verbose, log_level=0)
+
+    tasks = [
+        (
+            os.path.join(file[0], file[1]),
+            (
+                file[0],
+                file[1],
+                os.path.dirname(outputs(bag_dir, file)),
+                filter["whitelist_messages"],
+                os.path.join(output_dir, file[0]) if csv else None,
+                filter["blacklist_headers"],
+                filter["time_window"]["start_s"],
+                filter["time_window"]["end_s"],
+                filter["bag_params"]["topic_prefix"],
+                filter["bag_params"]["capitalise_topics"],
+                filter["bag_params"]["topic_max_frequency_hz"],
+                verbose,
+                format,
+                index,
+                filter["whitelist_headers"],
+                filter["bag_params"]["msg_dir"],
+            ),
         )
-        processes.append(process)
-        process.start()
+        for file in pending
+    ]
+    failed = run_tasks(
+        convert_ulog2ros2bag,
+        tasks,
+        jobs=jobs,
+        sizes=[fingerprints[task[0]]["size"] for task in tasks],
+        title="Conversion Progress:",
+        verbose=verbose,
+    )
 
-    i = 0
-    total = len(processes)
-    log("Conversion Progress:", verbosity=verbose, log_level=0,bold=True)
-    for process in processes:
-        process.join()
-        i += 1
-        progress_bar(i / total, verbose)
-    log("", verbosity=verbose, log_level=0, color=False,timestamped=False)
-    return
+    for path, _ in tasks:
+        if path in failed:
+            continue
+        entry = dict(fingerprints[path], format=format)
+        if checksum:
+            entry["sha256"] = file_checksum(path)
+        for root in roots:
+            manifests[root][path] = dict(entry, filter=filter_digests[root])
+    for root in roots:
+        save_manifest(root, manifests[root])
+    return failed
 
 
-def merge_csvs(output_dir: str, verbose: bool = False) -> pd.DataFrame:
+def get_table_dirs(output_dir: str) -> list[tuple[str, list[str]]]:
+    """
+    Lists the directories of an output tree that hold tables, with their tables.
+
+    Args:
+    - output_dir (str): Root of the output tree.
+
+    Returns:
+    - list[tuple[str, list[str]]]: (directory, table names) pairs.
+    """
+    table_dirs = []
+    for root, subdirs, files in os.walk(output_dir):
+        # npy tables are directories, and pyramids are derived tables; do not descend into them
+        files = list_tables(root, files + subdirs)
+        subdirs[:] = [subdir for subdir in subdirs if subdir not in files and subdir != PYRAMID_DIR]
+        if len(files) > 0:
+            table_dirs.append((root, files))
+    return table_dirs
+
+
+def merge_csvs(
+    output_dir: str,
+    jobs: int | None = None,
+    format: str = "csv",
+    merge_params: dict | None = None,
+    unify: bool = True,
+    verbose: bool = False,
+) -> str | None:
     """
     Merges multiple `.csv` files into a single unified `.csv` file, while
     leaving breadcrumb `merged.csv` files in the output directory tree.
+    Tables of the other formats are read as well, and `format` selects the
+    format of the merged and unified tables.
+
+    The unified table is written one mission at a time (see `unify_tables`),
+    so it is never held in memory as a whole. Without `unify` it is not
+    written, e.g. when the merged tables are resampled and unified next.
 
     Args:
     - output_dir (str): The directory containing the `.csv` files.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - format (str, optional): Format of the merged and unified tables. Defaults to "csv".
+    - merge_params (dict, optional): The `merge_params` of the filter. Defaults to the exact timestamp merge.
+    - unify (bool, optional): Whether to write the unified table. Defaults to True.
     - verbose (bool, optional): Whether to print verbose output. Defaults to False.
 
     Returns:
-    - pd.DataFrame: The unified DataFrame.
+    - str | None: Path of the unified table (or of the output directory without
+      `unify`), or None if there was nothing to merge.
     """
-    csv_files = []
-    for root, _, files in os.walk(output_dir):
-        if len(files) > 0:
-            csv_files.append((root, files))
+    csv_files = get_table_dirs(output_dir)
 
     log(f"Merging into [{len(csv_files)}] .csv files.", verbosity=verbose, log_level=0)
 
-    processes = []
-
-    for file in csv_files:
-        process = Process(
-            target=merge_csv,
-            args=(file[0], file[1]),
-        )
-        processes.append(process)
-        process.start()
-
-    i = 0
-    total = len(processes)
-    log("Merging Progress:", verbosity=verbose, log_level=0, bold=True)
-    for process in processes:
-        process.join()
-        i += 1
-        progress_bar(i / total, verbose)
-    log("", verbosity=verbose, log_level=0, color=False, timestamped=False)
+    run_tasks(
+        merge_csv,
+        [(file[0], (file[0], file[1], format, merge_params, verbose)) for file in csv_files],
+        jobs=jobs,
+        sizes=[sum(path_size(os.path.join(file[0], f)) for f in file[1]) for file in csv_files],
+        title="Merging Progress:",
+        verbose=verbose,
+    )
 
+    merged_name = table_name("merged", format)
+    unified_name = table_name("unified", format)
     merge_files = []
     for root, _, files in os.walk(output_dir):
-        if "merged.csv" in files:
+        if merged_name in files or os.path.isdir(os.path.join(root, merged_name)):
             merge_files.append(root)
 
-    log("Unifying all 'merged.csv' files into a single 'unified.csv' -- This may take a while.", verbosity=verbose, log_level=0)
+    if not merge_files:
+        log(f"No '{merged_name}' files to unify in {output_dir}.", verbosity=verbose, log_level=1)
+        return None
+    if not unify:
+        return output_dir
+
+    log(f"Unifying all '{merged_name}' files into a single '{unified_name}'.", verbosity=verbose, log_level=0)
+
+    unify_tables([os.path.join(file, merged_name) for file in merge_files], unified_name)
+    return unified_name
+
 
-    unified_df = pd.concat(
-        [pd.read_csv(os.path.join(file, "merged.csv")) for file in merge_files]
+def resample_csvs(
+    output_dir: str,
+    msg_reference: pd.DataFrame,
+    resample_params: Dict[str, Any],
+    jobs: int | None = None,
+    format: str = "csv",
+    verbose: bool = False,
+) -> str | None:
+    """
+    Resamples the topic tables of each mission onto a grid of its own and
+    unifies the results, without merging the topics first. Breadcrumb
+    `resampled.csv` files are left in the output directory tree.
+
+    Args:
+    - output_dir (str): The directory containing the `.csv` files.
+    - msg_reference (pd.DataFrame): A dataframe containing message references (Alias, Dataclass).
+    - resample_params (dict): The `resample_params` of the filter.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - format (str, optional): Format of the resampled and unified tables. Defaults to "csv".
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - str | None: Path of the unified table, or None if there was nothing to resample.
+    """
+    table_dirs = get_table_dirs(output_dir)
+    dataclasses = dataclass_lookup(msg_reference)
+
+    log(f"Resampling the topics of [{len(table_dirs)}] missions.", verbosity=verbose, log_level=0)
+
+    failed = run_tasks(
+        resample_topics,
+        [(root, (root, files, format, resample_params, dataclasses, verbose)) for root, files in table_dirs],
+        jobs=jobs,
+        sizes=[sum(path_size(os.path.join(root, f)) for f in files) for root, files in table_dirs],
+        title="Resampling Progress:",
+        verbose=verbose,
     )
-    unified_df.to_csv("unified.csv", index=False)
-    return unified_df
 
+    return _unify_resampled([root for root, _ in table_dirs if root not in failed], output_dir, format, verbose)
 
-def adjust_topics(directory_address:str, filter:dict, verbose: bool = False):
 
-    adjust_frequency: float = filter["bag_params"]["topic_max_frequency_hz"]
-    csv_dirs: list[str] = get_csv_dirs(csv_dir = directory_address, verbose = verbose)
-    
-    processes: list[Process] = []
-    for dir in csv_dirs:
-        for filename in os.listdir(dir):
-            if not filename.endswith(".csv"):
-                continue
-            filepath = os.path.join(dir, filename)
-
-            process = Process(
-                target=adjust_topic_rate,
-                args=(filepath, adjust_frequency, verbose),
-            )
-            processes.append(process)
-            process.start()
-    i = 0
-    total = len(processes)
-    log("Topic Rate Adjustment Progress:", verbosity=verbose, log_level=0, bold=True)
-    for process in processes:
-        process.join()
-        i += 1
-        progress_bar(i / total, verbose)
-    log("", verbosity=verbose, log_level=0, color=False, timestamped=False)
+def resample_merged_csvs(
+    output_dir: str,
+    msg_reference: pd.DataFrame,
+    resample_params: Dict[str, Any],
+    jobs: int | None = None,
+    format: str = "csv",
+    verbose: bool = False,
+) -> str | None:
+    """
+    Resamples the merged table of each mission (see `merge_csvs`) and unifies
+    the results, leaving breadcrumb `resampled.csv` files in the output
+    directory tree. As the missions are resampled before they are unified,
+    only the largest mission is ever held in memory, not the unified table.
+
+    Args:
+    - output_dir (str): The directory containing the `merged.csv` files.
+    - msg_reference (pd.DataFrame): A dataframe containing message references (Alias, Dataclass).
+    - resample_params (dict): The `resample_params` of the filter.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - format (str, optional): Format of the merged, resampled and unified tables. Defaults to "csv".
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - str | None: Path of the unified table, or None if there was nothing to resample.
+    """
+    merged_name = table_name("merged", format)
+    merge_dirs = [root for root, files in get_table_dirs(output_dir) if merged_name in files]
+    dataclasses = dataclass_lookup(msg_reference)
+
+    log(f"Resampling the merged tables of [{len(merge_dirs)}] missions.", verbosity=verbose, log_level=0)
+
+    failed = run_tasks(
+        _resample_merged,
+        [(root, (root, resample_params, dataclasses, format)) for root in merge_dirs],
+        jobs=jobs,
+        sizes=[path_size(os.path.join(root, merged_name)) for root in merge_dirs],
+        title="Resampling Progress:",
+        verbose=verbose,
+    )
+    return _unify_resampled([root for root in merge_dirs if root not in failed], output_dir, format, verbose)
+
+
+def _unify_resampled(roots: list[str], output_dir: str, format: str, verbose: bool = False) -> str | None:
+    """Unifies the 'resampled' tables of missions, in mission name order, into the 'unified' table."""
+    resampled_name = table_name("resampled", format)
+    unified_name = table_name("unified", format)
+    # as their mission names, e.g. "output_dir/dir/log"
+    roots = sorted(roots, key=lambda root: os.path.normpath(root).split(os.sep))
+    resampled_files = [os.path.join(root, resampled_name) for root in roots]
+    if not resampled_files:
+        log(f"No '{resampled_name}' files to unify in {output_dir}.", verbosity=verbose, log_level=1)
+        return None
+
+    log(f"Unifying all '{resampled_name}' files into a single '{unified_name}'.", verbosity=verbose, log_level=0)
 
-    return
+    unify_tables(resampled_files, unified_name)
+    return unified_name
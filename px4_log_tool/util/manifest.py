@@ -0,0 +1,141 @@
+#!/usr/bin python3
+import hashlib
+import json
+import os
+from typing import Any, Dict
+from px4_log_tool.util.logger import log
+
+MANIFEST_NAME = ".ulog_csv_manifest.json"
+MANIFEST_VERSION = 1
+
+
+# filter sections that the topic tables of a ULog depend on
+CONVERSION_KEYS = ("whitelist_messages", "blacklist_headers", "whitelist_headers", "time_window")
+# and the bags, in addition
+BAG_KEYS = CONVERSION_KEYS + ("bag_params",)
+
+
+def filter_hash(filter: dict, keys: tuple = CONVERSION_KEYS) -> str:
+    """
+    Hashes the sections of an effective filter configuration (as returned by
+    `extract_filter`) that the converted outputs depend on, so that changing
+    e.g. the resampling parameters does not invalidate them.
+
+    Args:
+    - filter (dict): Filter configuration.
+    - keys (tuple, optional): Sections to hash. Defaults to those of the topic tables.
+
+    Returns:
+    - str: Hex digest that changes whenever a value of these sections changes.
+    """
+    sections = {key: filter.get(key) for key in keys}
+    encoded = json.dumps(sections, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ulog_fingerprint(path: str) -> Dict[str, int]:
+    """
+    Returns the cheap part of a ULog fingerprint: its size and modification time.
+
+    Args:
+    - path (str): Path to the ULog file.
+
+    Returns:
+    - Dict[str, int]: {"size": bytes, "mtime_ns": modification time in ns}.
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_fresh(
+    entry: Dict[str, Any] | None,
+    path: str,
+    fingerprint: Dict[str, int],
+    filter_digest: str,
+    checksum: bool = False,
+    format: str = "csv",
+) -> bool:
+    """
+    Decides whether the outputs recorded in a manifest entry are still valid.
+
+    The filter, the output format and the size must match. A matching modification
+    time is taken as proof of unchanged content; otherwise, with `checksum`,
+    the content hash is compared so that touched but unchanged files (e.g.
+    re-synced archives) are not converted again. The entry's modification
+    time is refreshed in that case.
+
+    Args:
+    - entry (dict, optional): Manifest entry of the ULog, if any.
+    - path (str): Path to the ULog file.
+    - fingerprint (dict): Current fingerprint from `ulog_fingerprint`.
+    - filter_digest (str): Current `filter_hash`.
+    - checksum (bool, optional): Whether to compare content hashes.
+    - format (str, optional): Current output table format.
+
+    Returns:
+    - bool: True if the ULog does not need to be converted again.
+    """
+    if entry is None or entry.get("filter") != filter_digest:
+        return False
+    if entry.get("format", "csv") != format:
+        return False
+    if entry.get("size") != fingerprint["size"]:
+        return False
+    if entry.get("mtime_ns") == fingerprint["mtime_ns"]:
+        return True
+    if not checksum or "sha256" not in entry:
+        return False
+    if file_checksum(path) != entry["sha256"]:
+        return False
+    entry["mtime_ns"] = fingerprint["mtime_ns"]
+    return True
+
+
+def load_manifest(output_dir: str, verbose: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the ULog entries of the conversion manifest in `output_dir`.
+
+    Args:
+    - output_dir (str): Root of the output tree.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - Dict[str, dict]: ULog path -> entry (empty if there is no usable manifest).
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log(f"Ignoring unreadable manifest {manifest_path}: {e}", verbosity=verbose, log_level=1)
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        log(f"Ignoring manifest {manifest_path} of another version.", verbosity=verbose, log_level=1)
+        return {}
+    return manifest.get("ulogs", {})
+
+
+def save_manifest(output_dir: str, entries: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Atomically writes the conversion manifest into `output_dir`.
+
+    Args:
+    - output_dir (str): Root of the output tree.
+    - entries (Dict[str, dict]): ULog path -> entry.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "ulogs": entries}, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
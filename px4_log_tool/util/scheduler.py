@@ -0,0 +1,178 @@
+#!/usr/bin python3
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.sharedctypes import RawArray
+from typing import Any, Callable, Iterable, Iterator
+from px4_log_tool.util.logger import log
+from px4_log_tool.util.tui import progress_bar
+
+# Flags, shared with the worker processes, marking the tasks that have started.
+_started = None
+
+
+def default_jobs(jobs: int | None = None) -> int:
+    """
+    Resolves the number of worker processes to use.
+
+    Args:
+    - jobs (int, optional): Requested number of workers. Defaults to the CPU count.
+
+    Returns:
+    - int: A positive number of workers.
+    """
+    if jobs is None or jobs < 1:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def path_size(path: str) -> int:
+    """
+    Returns the size of a file, or the total size of the files in a directory tree.
+
+    Args:
+    - path (str): Path to a file or directory.
+
+    Returns:
+    - int: Size in bytes (0 if the path cannot be read).
+    """
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        total = 0
+        for root, _, files in os.walk(path):
+            for file in files:
+                total += os.path.getsize(os.path.join(root, file))
+        return total
+    except OSError:
+        return 0
+
+
+def _init_worker(started) -> None:
+    global _started
+    _started = started
+
+
+def _run_task(index: int, target: Callable[..., Any], args: tuple) -> Any:
+    _started[index] = 1
+    return target(*args)
+
+
+def run_tasks(
+    target: Callable[..., Any],
+    tasks: list[tuple[str, tuple]],
+    jobs: int | None = None,
+    sizes: list[int] | None = None,
+    title: str = "Progress:",
+    verbose: bool = False,
+) -> list[str]:
+    """
+    Runs `target` once per task on a fixed pool of worker processes.
+
+    Tasks are submitted largest first when `sizes` are given, so that the
+    longest conversions do not start last and hold up the whole run. A task
+    fails when `target` raises or when its worker process dies (e.g. killed
+    for running out of memory); failures are logged with the task label and
+    do not stop the remaining tasks. A dying worker takes the whole pool down,
+    so the tasks caught in it are resubmitted, and the ones that had already
+    started are retried one at a time to single out the task responsible.
+
+    Args:
+    - target (Callable): Picklable function executed in the worker processes.
+    - tasks (list[tuple[str, tuple]]): (label, args) pairs, one per call of `target`.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+    - sizes (list[int], optional): Size of each task, used to schedule the largest first.
+    - title (str, optional): Title of the progress bar.
+    - verbose (bool, optional): Whether to print verbose output. Defaults to False.
+
+    Returns:
+    - list[str]: Labels of the tasks that failed.
+    """
+    queue = list(range(len(tasks)))
+    if sizes is not None:
+        queue.sort(key=lambda i: sizes[i], reverse=True)
+
+    failed: list[str] = []
+    total = len(tasks)
+    done = 0
+    workers = default_jobs(jobs)
+    started = RawArray("b", max(total, 1))
+    isolated: list[int] = []
+
+    log(title, verbosity=verbose, log_level=0, bold=True)
+    while queue or isolated:
+        if queue:
+            batch, width, queue = queue, min(workers, len(queue)), []
+        else:
+            batch, width, isolated = isolated[:1], 1, isolated[1:]
+        for i in batch:
+            started[i] = 0
+
+        with ProcessPoolExecutor(
+            max_workers=width, initializer=_init_worker, initargs=(started,)
+        ) as executor:
+            futures = {
+                executor.submit(_run_task, i, target, tasks[i][1]): i for i in batch
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    if not started[i]:
+                        queue.append(i)
+                        continue
+                    if width > 1:
+                        isolated.append(i)
+                        continue
+                    error = RuntimeError("worker process terminated abruptly")
+                if error is not None:
+                    failed.append(tasks[i][0])
+                    log(
+                        f"Task '{tasks[i][0]}' failed: {type(error).__name__}: {error}",
+                        verbosity=verbose,
+                        log_level=2,
+                    )
+                done += 1
+                progress_bar(done / total, verbose)
+    log("", verbosity=verbose, log_level=0, color=False, timestamped=False)
+
+    if failed:
+        log(f"[{len(failed)}/{total}] tasks failed.", verbosity=verbose, log_level=2)
+    return failed
+
+
+def map_ordered(
+    target: Callable[..., Any],
+    tasks: Iterable[tuple],
+    jobs: int | None = None,
+) -> Iterator[Any]:
+    """
+    Yields `target(*args)` for each task, in task order, computed on a pool
+    of worker processes.
+
+    At most two tasks per worker are in flight, so that results are not
+    held in memory faster than the caller consumes them. With a single job
+    the tasks are run in the calling process.
+
+    Args:
+    - target (Callable): Picklable function executed in the worker processes.
+    - tasks (Iterable[tuple]): Arguments of each call of `target`.
+    - jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+
+    Yields:
+    - The result of each task. An exception raised by a task is raised here.
+    """
+    workers = default_jobs(jobs)
+    if workers == 1:
+        for args in tasks:
+            yield target(*args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque = deque()
+        for args in tasks:
+            pending.append(executor.submit(target, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()